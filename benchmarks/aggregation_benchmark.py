@@ -0,0 +1,58 @@
+"""
+Equivalence check and micro-benchmark of CompiledAggregation against Aggregation.
+
+    python -m benchmarks.aggregation_benchmark --carts 2000
+"""
+import argparse
+import random
+import time
+from models.hepler import Aggregation, CompiledAggregation, CompiledRules, categories_dct
+
+
+def generate_cases(n_carts: int, reco_size: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    names = list(categories_dct)
+    cases = []
+    for _ in range(n_carts):
+        cart = rng.sample(names, rng.randint(0, 6))
+        if rng.random() < 0.1:
+            # Unknown UPCs map to an empty name
+            cart.append("")
+        reco = rng.sample(names, reco_size) + ["x", "unknown product"]
+        # Candidates overlapping the cart, with stray whitespace, duplicated
+        reco += [f" {p} " for p in cart[:2]] + reco[:3]
+        rng.shuffle(reco)
+        cases.append((reco, cart))
+    return cases
+
+
+def run(cls, categories, cases) -> tuple[list, float]:
+    started = time.perf_counter()
+    results = [cls(list(reco), cart, categories, 17).get_final_recommendations() for reco, cart in cases]
+    return results, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--carts", type = int, default = 2000)
+    parser.add_argument("--reco-size", type = int, default = 52)
+    args = parser.parse_args()
+
+    cases = generate_cases(args.carts, args.reco_size)
+
+    started = time.perf_counter()
+    rules = CompiledRules(categories_dct)
+    print(f"Compiled {len(rules.products)} products in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    expected, current = run(Aggregation, categories_dct, cases)
+    actual, compiled = run(CompiledAggregation, rules, cases)
+    assert expected == actual, "results differ"
+
+    per_call = lambda seconds: seconds / len(cases) * 1e6
+    print(f"Aggregation:         {per_call(current):8.1f}us per call")
+    print(f"CompiledAggregation: {per_call(compiled):8.1f}us per call")
+    print(f"Results identical, speed-up x{current / compiled:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Equivalence check of the mmap model artifact against the in-process ModelIndex, with the
+per-worker memory and load time of both.
+
+    python -m benchmarks.artifact_benchmark --sessions 20000
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from benchmarks.synthetic import generate_transactions
+from configs.constant import TIME_SLOTS, TIMINGS, TIMINGS_COL
+from initialize.helper import DataPreprocessor
+from initialize.models import train_timing_partition
+from repos.model_artifact import ModelArtifact, write_model_artifact
+from repos.model_index import ModelIndex, TimingIndex
+from utils.helper import build_lookup_dicts
+
+
+def build_model_index(df, version: int = 1) -> ModelIndex:
+    timings = {}
+    for timing in TIMINGS:
+        _, popular_json, association_json, _, _ = train_timing_partition(timing, df[df[TIMINGS_COL] == timing])
+        timings[timing] = TimingIndex.from_documents(popular_json[0], association_json)
+    return ModelIndex(version, timings)
+
+
+def measure(fn):
+    """Result, seconds and Python heap bytes allocated by `fn`."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - started
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, allocated
+
+
+def assert_equivalent(index: ModelIndex, artifact: ModelArtifact, name_to_upc_map: dict, upc_to_name_map: dict, top_n: int):
+    assert dict(artifact.name_to_upc) == name_to_upc_map, "name_to_upc differs"
+    assert dict(artifact.upc_to_name) == upc_to_name_map, "upc_to_name differs"
+    assert artifact.name_to_upc.to_dict() == name_to_upc_map and artifact.upc_to_name.to_dict() == upc_to_name_map, "lookup dicts differ"
+    assert artifact.upc_to_name.get("not a upc", "") == ""
+    for timing, timing_index in index.timings.items():
+        assert artifact.popular(timing, top_n) == index.popular(timing, top_n), f"{timing} popular differs"
+        products = list(timing_index.associations)
+        for product in products:
+            assert artifact.associations(timing, [product], top_n) == index.associations(timing, [product], top_n), \
+                f"{timing} associations of {product} differ"
+        # Multi-item carts, with an unknown item
+        for i in range(0, len(products), 3):
+            cart = products[i:i + 3] + ["unknown product"]
+            assert artifact.associations(timing, cart, top_n) == index.associations(timing, cart, top_n), \
+                f"{timing} associations of {cart} differ"
+
+
+def open_served(path: str) -> tuple:
+    """What a worker serving the artifact holds: the mapping and dict copies of its lookups."""
+    artifact = ModelArtifact(path)
+    return artifact, artifact.name_to_upc.to_dict(), artifact.upc_to_name.to_dict()
+
+
+def time_lookups(upc_to_name, upcs: list) -> float:
+    started = time.perf_counter()
+    for upc in upcs:
+        upc_to_name.get(upc, "")
+    return (time.perf_counter() - started) / len(upcs) * 1e6
+
+
+def time_queries(model, carts: list, top_n: int) -> float:
+    started = time.perf_counter()
+    for timing, cart in carts:
+        model.popular(timing, top_n)
+        model.associations(timing, cart, top_n)
+    return (time.perf_counter() - started) / len(carts) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type = int, default = 20_000)
+    parser.add_argument("--top-n", type = int, default = 60)
+    args = parser.parse_args()
+
+    df = DataPreprocessor(TIME_SLOTS).preprocess(generate_transactions(n_sessions = args.sessions))
+    name_to_upc_map, upc_to_name_map = build_lookup_dicts(df)
+    index = build_model_index(df)
+    print(f"{len(df)} rows, {len(upc_to_name_map)} products")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "model_v1.bin")
+        size = write_model_artifact(path, index, name_to_upc_map, upc_to_name_map)
+        (artifact, _, upc_to_name), open_seconds, open_bytes = measure(lambda: open_served(path))
+        assert_equivalent(index, artifact, name_to_upc_map, upc_to_name_map, args.top_n)
+        print("Outputs identical")
+
+        # What every worker pays: parse the documents into a ModelIndex + lookup dicts, or map the file
+        docs = {timing: (timing_index.popular, timing_index.associations) for timing, timing_index in index.timings.items()}
+        _, build_seconds, build_bytes = measure(lambda: (
+            ModelIndex(1, {timing: TimingIndex.from_documents({"popular_data": popular}, [
+                {"product": product, "associate_products": dict(zip(*associates))} for product, associates in associations.items()
+            ]) for timing, (popular, associations) in docs.items()}),
+            dict(name_to_upc_map), dict(upc_to_name_map),
+        ))
+        print(f"artifact file: {size / 1e6:.2f} MB, shared by all workers of the host")
+        print(f"  in-process: {build_seconds * 1e3:8.1f} ms, {build_bytes / 1e6:6.2f} MB private heap per worker")
+        print(f"  mmap      : {open_seconds * 1e3:8.1f} ms, {open_bytes / 1e6:6.2f} MB private heap per worker (lookup dicts included)")
+
+        carts = [(timing, list(index.timings[timing].associations)[i:i + 3])
+                 for timing in TIMINGS for i in range(0, len(index.timings[timing].associations), 7)]
+        print(f"query (popular + associations of a 3 item cart): "
+              f"in-process {time_queries(index, carts, args.top_n):.1f} us, mmap {time_queries(artifact, carts, args.top_n):.1f} us")
+        upcs = list(upc_to_name_map)
+        print(f"UPC lookup: served dict {time_lookups(upc_to_name, upcs):.2f} us, artifact map {time_lookups(artifact.upc_to_name, upcs):.2f} us")
+
+
+if __name__ == "__main__":
+    main()
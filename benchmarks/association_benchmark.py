@@ -0,0 +1,49 @@
+"""
+Equivalence check and benchmark of the sparse association engine against the loop version.
+
+    python -m benchmarks.association_benchmark --sessions 20000
+"""
+import argparse
+import time
+from benchmarks.synthetic import generate_transactions
+from initialize.models import association_based, association_based_loop
+
+
+def assert_equivalent(expected: list, actual: list):
+    """Same documents: the same associates of every product, in the same order, with the same counts."""
+    # Documents are stored by product, the order of the list does not matter
+    expected_by_product = {doc['product']: list(doc['associate_products'].items()) for doc in expected}
+    actual_by_product = {doc['product']: list(doc['associate_products'].items()) for doc in actual}
+    assert len(expected_by_product) == len(expected) and len(actual_by_product) == len(actual), "duplicate products"
+    assert expected_by_product.keys() == actual_by_product.keys(), "products differ"
+    for product, expected_assoc in expected_by_product.items():
+        assert expected_assoc == actual_by_product[product], f"associates differ for {product}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type = int, default = 20_000)
+    parser.add_argument("--top-n", type = int, default = 100)
+    parser.add_argument("--repeat", type = int, default = 3)
+    args = parser.parse_args()
+
+    df = generate_transactions(n_sessions = args.sessions)
+    print(f"{len(df)} rows, {args.sessions} sessions, {df['Product_name'].nunique()} products")
+
+    timings = {}
+    outputs = {}
+    for name, fn in (("loop", association_based_loop), ("sparse", association_based)):
+        best = float("inf")
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            outputs[name] = fn(df, top_n = args.top_n)
+            best = min(best, time.perf_counter() - started)
+        timings[name] = best
+        print(f"{name:>6}: {best:.3f}s (best of {args.repeat})")
+
+    assert_equivalent(outputs["loop"], outputs["sparse"])
+    print(f"Outputs identical, speed-up x{timings['loop'] / timings['sparse']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Size and read cost of the association documents, {name: weight} against the compact format
+(int32 product ids and weights, repos.association_store), on models trained from synthetic
+transactions: BSON bytes, then per document the BSON decode alone, decode + unpack as served,
+and decode + odmantic model parse as the admin models read them. Checks that both formats
+unpack to the same associations.
+
+    python -m benchmarks.association_format_benchmark --sessions 20000
+"""
+import argparse
+import time
+import bson
+from benchmarks.synthetic import generate_transactions
+from configs.constant import TIME_SLOTS, TIMINGS, TIMINGS_COL
+from initialize.helper import DataPreprocessor
+from initialize.models import train_timing_partition
+from models.db import BreakfastAssociation
+from repos.association_store import VocabularyBuilder, pack_association, unpack_association
+
+
+def per_document(fn, raws: list, repeat: int) -> float:
+    """Best microseconds per document of `fn(raw)` over `repeat` passes."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for raw in raws:
+            fn(raw)
+        best = min(best, (time.perf_counter() - started) / len(raws))
+    return best * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type = int, default = 20_000)
+    parser.add_argument("--repeat", type = int, default = 5)
+    parser.add_argument("--seed", type = int, default = 7)
+    args = parser.parse_args()
+
+    df = DataPreprocessor(TIME_SLOTS).preprocess(generate_transactions(n_sessions = args.sessions, seed = args.seed))
+    legacy_docs, vocabulary = [], VocabularyBuilder()
+    for timing in TIMINGS:
+        _, _, association_json, _, _ = train_timing_partition(timing, df[df[TIMINGS_COL] == timing])
+        legacy_docs += association_json
+    compact_docs = [pack_association(doc, vocabulary) for doc in legacy_docs]
+    names = vocabulary.names
+
+    for legacy, compact in zip(legacy_docs, compact_docs):
+        assert unpack_association(compact, names) == unpack_association(legacy, names), f"{legacy['product']} differs"
+    print(f"{len(legacy_docs)} documents, {len(names)} products in the vocabulary, both formats unpack alike")
+
+    legacy_raws = [bson.encode(doc) for doc in legacy_docs]
+    compact_raws = [bson.encode(doc) for doc in compact_docs]
+    vocabulary_bytes = len(bson.encode({"chunk": 0, "names": names}))
+    legacy_bytes, compact_bytes = sum(map(len, legacy_raws)), sum(map(len, compact_raws))
+    print(f"BSON: {legacy_bytes / 1e6:.2f} MB as {{name: weight}}, {compact_bytes / 1e6:.2f} MB compact "
+          f"+ {vocabulary_bytes / 1e6:.2f} MB vocabulary ({(compact_bytes + vocabulary_bytes) / legacy_bytes:.0%}), "
+          f"{legacy_bytes / len(legacy_raws):.0f} -> {compact_bytes / len(compact_raws):.0f} bytes per document")
+
+    print(f"\n{'per document':<42}{'{name: weight} us':>18}{'compact us':>12}")
+    rows = [
+        ("BSON decode", bson.decode, bson.decode),
+        ("BSON decode + unpack (served)", lambda raw: unpack_association(bson.decode(raw), names),
+         lambda raw: unpack_association(bson.decode(raw), names)),
+        ("BSON decode + odmantic parse (admin)", lambda raw: BreakfastAssociation.model_validate_doc(bson.decode(raw) | {"_id": bson.ObjectId()}),
+         lambda raw: BreakfastAssociation.model_validate_doc(bson.decode(raw) | {"_id": bson.ObjectId()})),
+    ]
+    for name, legacy_fn, compact_fn in rows:
+        print(f"{name:<42}{per_document(legacy_fn, legacy_raws, args.repeat):>18.1f}{per_document(compact_fn, compact_raws, args.repeat):>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Merge of the association lists of a cart's items, on models trained from synthetic transactions,
+for carts of 1, 5 and 20 items: the previous insertion-order merge, summed weights ranked by a
+full sort and by heap selection, merge_association_scores (which picks one of the two by the size
+of the union) and the same query on the in-process index and the mapped artifact. Checks that every
+serving mode returns the same ranking, and how often summing changes the top N of the previous merge.
+
+    python -m benchmarks.association_merge_benchmark --sessions 20000 --top-n 60
+"""
+import argparse
+import heapq
+import os
+import random
+import tempfile
+import time
+from operator import itemgetter
+from benchmarks.artifact_benchmark import build_model_index
+from benchmarks.synthetic import generate_transactions
+from configs.constant import TIME_SLOTS
+from initialize.helper import DataPreprocessor
+from repos.model_artifact import ModelArtifact, write_model_artifact
+from utils.helper import build_lookup_dicts
+from utils.ranking import merge_association_scores
+
+
+def insertion_merge(sources, top_n: int, normalize: bool = False) -> list:
+    """The merge this replaced: later cart items extend the result, weights are ignored."""
+    assoc_products = {}
+    for associates, _ in sources:
+        assoc_products.update(dict.fromkeys(associates))
+    return list(assoc_products)[:top_n]
+
+
+def sorted_merge(sources, top_n: int, normalize: bool = False) -> list:
+    """Summed weights ranked by sorting the whole union."""
+    scores = {}
+    for associates, weights in sources:
+        if normalize:
+            total = sum(weights)
+            weights = [weight / total for weight in weights]
+        for associate, weight in zip(associates, weights):
+            scores[associate] = scores.get(associate, 0) + weight
+    return [associate for associate, _ in sorted(scores.items(), key = itemgetter(1), reverse = True)[:top_n]]
+
+
+def heap_merge(sources, top_n: int, normalize: bool = False) -> list:
+    """Summed weights, always selected with heapq.nlargest."""
+    scores = {}
+    for associates, weights in sources:
+        for associate, weight in zip(associates, weights):
+            scores[associate] = scores.get(associate, 0) + weight
+    return [associate for associate, _ in heapq.nlargest(top_n, scores.items(), key = itemgetter(1))]
+
+
+def generate_carts(index, sizes: list, per_size: int, seed: int) -> dict:
+    """Carts of products that have associations, drawn per timing, keyed by size."""
+    rng = random.Random(seed)
+    timings = [timing for timing, timing_index in index.timings.items() if len(timing_index.associations) >= max(sizes)]
+    carts = {}
+    for size in sizes:
+        carts[size] = []
+        for _ in range(per_size):
+            timing = rng.choice(timings)
+            carts[size].append((timing, rng.sample(list(index.timings[timing].associations), size)))
+    return carts
+
+
+def per_call(fn, calls: list, repeat: int) -> float:
+    """Best microseconds per call of `fn(*args)` over `repeat` passes."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for args in calls:
+            fn(*args)
+        best = min(best, (time.perf_counter() - started) / len(calls))
+    return best * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type = int, default = 20_000)
+    parser.add_argument("--top-n", type = int, default = 60, help = "Associates kept, the route asks for topN + 50")
+    parser.add_argument("--carts", type = int, default = 300, help = "Carts per size")
+    parser.add_argument("--repeat", type = int, default = 5)
+    parser.add_argument("--seed", type = int, default = 7)
+    args = parser.parse_args()
+
+    df = DataPreprocessor(TIME_SLOTS).preprocess(generate_transactions(n_sessions = args.sessions, seed = args.seed))
+    name_to_upc_map, upc_to_name_map = build_lookup_dicts(df)
+    index = build_model_index(df)
+    sizes = [1, 5, 20]
+    carts = generate_carts(index, sizes, args.carts, args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "model_v1.bin")
+        write_model_artifact(path, index, name_to_upc_map, upc_to_name_map)
+        artifact = ModelArtifact(path)
+
+        for normalize in (False, True):
+            for size in sizes:
+                for timing, cart in carts[size]:
+                    sources = [index.timings[timing].associations[product] for product in cart]
+                    expected = sorted_merge(sources, args.top_n, normalize)
+                    if not normalize:
+                        assert heap_merge(sources, args.top_n) == expected, f"heap merge differs on {cart}"
+                    assert merge_association_scores(sources, args.top_n, normalize) == expected, f"merge differs on {cart}"
+                    assert index.associations(timing, cart, args.top_n, normalize) == expected, f"ModelIndex differs on {cart}"
+                    assert artifact.associations(timing, cart, args.top_n, normalize) == expected, f"ModelArtifact differs on {cart}"
+        print("Sort and heap selection, in-process index and mapped artifact rank alike")
+
+        print(f"\n{'cart items':<12}{'candidates':>11}{'top N changed':>15}"
+              f"{'insertion us':>14}{'sum+sort us':>13}{'sum+heap us':>13}{'merge us':>10}{'normalized us':>15}{'index us':>10}{'mmap us':>10}")
+        for size in sizes:
+            cases = [(timing, cart, [index.timings[timing].associations[product] for product in cart]) for timing, cart in carts[size]]
+            candidates = sum(len({name for names, _ in sources for name in names}) for _, _, sources in cases) / len(cases)
+            changed = sum(insertion_merge(sources, args.top_n) != merge_association_scores(sources, args.top_n)
+                          for _, _, sources in cases) / len(cases)
+            merges = [(sources, args.top_n) for _, _, sources in cases]
+            queries = [(timing, cart, args.top_n) for timing, cart, _ in cases]
+            timings = [
+                per_call(insertion_merge, merges, args.repeat),
+                per_call(sorted_merge, merges, args.repeat),
+                per_call(heap_merge, merges, args.repeat),
+                per_call(merge_association_scores, merges, args.repeat),
+                per_call(lambda sources, top_n: merge_association_scores(sources, top_n, True), merges, args.repeat),
+                per_call(index.associations, queries, args.repeat),
+                per_call(artifact.associations, queries, args.repeat),
+            ]
+            print(f"{size:<12}{candidates:>11.0f}{changed:>14.0%} " + "".join(
+                f"{value:>{width}.1f}" for value, width in zip(timings, (14, 13, 13, 10, 15, 10, 10))))
+        del artifact
+
+
+if __name__ == "__main__":
+    main()
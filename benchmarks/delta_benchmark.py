@@ -0,0 +1,64 @@
+"""
+Equivalence check and benchmark of an incremental delta merge against a full retrain over the
+whole history, the compute part of /setup/delta vs /setup.
+
+    python -m benchmarks.delta_benchmark --sessions 200000 --delta-sessions 2000
+"""
+import argparse
+import time
+import pandas as pd
+from benchmarks.association_benchmark import assert_equivalent
+from benchmarks.synthetic import generate_transactions
+from configs.constant import SESSION_COL, TIME_SLOTS, TIMINGS, TIMINGS_COL, PRODUCT_NAME_COL
+from initialize.helper import DataPreprocessor
+from initialize.models import merge_delta_counts, train_timing_partition
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type = int, default = 200_000)
+    parser.add_argument("--delta-sessions", type = int, default = 2_000)
+    parser.add_argument("--top-n", type = int, default = 100)
+    args = parser.parse_args()
+
+    preprocessor = DataPreprocessor(TIME_SLOTS)
+    history = preprocessor.preprocess(generate_transactions(n_sessions = args.sessions, seed = 1))
+    delta = preprocessor.preprocess(generate_transactions(n_sessions = args.delta_sessions, seed = 2))
+    # New sessions only
+    delta[SESSION_COL] += args.sessions
+    combined = pd.concat([history, delta], ignore_index = True)
+    print(f"history {len(history)} rows, delta {len(delta)} rows")
+
+    full_seconds = merge_seconds = 0.0
+    for tm in TIMINGS:
+        # Models and counts stored by the last full /setup
+        _, _, stored_associations, _, raw_counts = train_timing_partition(tm, history[history[TIMINGS_COL] == tm], args.top_n)
+        stored_rows = {row["product"]: (row["associates"], row["counts"]) for row in raw_counts["associations"]}
+
+        started = time.perf_counter()
+        _, expected_popular, expected_associations, _, _ = train_timing_partition(tm, combined[combined[TIMINGS_COL] == tm], args.top_n)
+        full_seconds += time.perf_counter() - started
+
+        started = time.perf_counter()
+        delta_partition = delta[delta[TIMINGS_COL] == tm]
+        # What the job reads from Mongo: the popularity document and the rows of the delta products
+        products = set(delta_partition[PRODUCT_NAME_COL].unique())
+        base_rows = {product: counts for product, counts in stored_rows.items() if product in products}
+        _, rows, popular_json, association_json = merge_delta_counts(raw_counts["popularity"], base_rows, delta_partition, args.top_n)
+        merge_seconds += time.perf_counter() - started
+
+        assert popular_json == expected_popular, f"{tm} popular differs"
+        # Products the delta touched are re-ranked, the others keep their stored list
+        touched = {doc["product"] for doc in association_json}
+        expected = [doc for doc in expected_associations if doc["product"] in touched]
+        assert_equivalent(expected, association_json)
+        assert_equivalent([doc for doc in expected_associations if doc["product"] not in touched],
+                          [doc for doc in stored_associations if doc["product"] not in touched])
+        print(f"{tm:>9}: {len(touched)} of {len(expected_associations)} products re-ranked")
+
+    print("Outputs equivalent")
+    print(f"full retrain: {full_seconds:.3f}s, delta merge: {merge_seconds:.3f}s, x{full_seconds / merge_seconds:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Equivalence check and benchmark of the streaming /setup ingestion against reading, validating,
+re-writing and re-reading the processed upload.
+
+    python -m benchmarks.ingest_benchmark --sessions 200000
+"""
+import argparse
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+import pandas as pd
+from benchmarks.synthetic import generate_transactions
+from configs.constant import TIME_SLOTS, TIMINGS, TIMINGS_COL, DATE_COL, PRODUCT_NAME_COL, SESSION_COL, QUANTITY_COL, EXPECTED_PROCESSED_COLS
+from initialize.data_validation import validate_columns
+from initialize.helper import DataPreprocessor, ingest_processed
+
+
+def ingest_three_pass(raw: bytes, stored_path: str) -> pd.DataFrame:
+    """What /setup did before: parse the upload, validate, write it back, parse the stored file again."""
+    df = pd.read_csv(io.BytesIO(raw))
+    assert validate_columns(df, EXPECTED_PROCESSED_COLS, verbose = False)
+    df.to_csv(stored_path, index = False)
+    del df
+    df = pd.read_csv(stored_path)
+    return DataPreprocessor(TIME_SLOTS).preprocess(df)
+
+
+def measure(fn):
+    """Result, seconds and peak traced bytes of `fn`, timed in a run without tracing."""
+    started = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - started
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def partitions(df: pd.DataFrame) -> dict:
+    columns = [SESSION_COL, PRODUCT_NAME_COL, QUANTITY_COL, "UPC"]
+    return {tm: df.loc[df[TIMINGS_COL] == tm, columns].astype({"UPC": str}).reset_index(drop = True) for tm in TIMINGS}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type = int, default = 200_000)
+    parser.add_argument("--chunk-rows", type = int, default = 100_000)
+    args = parser.parse_args()
+
+    df = generate_transactions(n_sessions = args.sessions)
+    df.loc[df.index[::997], DATE_COL] = "not a date"
+    df.loc[df.index[::1013], PRODUCT_NAME_COL] = "  Mixed Case Name  "
+
+    with tempfile.TemporaryDirectory() as tmp:
+        upload_path = os.path.join(tmp, "upload.csv")
+        df.to_csv(upload_path, index = False)
+        print(f"{len(df)} rows, {os.path.getsize(upload_path) / 1e6:.1f} MB upload")
+        del df
+
+        def three_pass():
+            with open(upload_path, "rb") as f:
+                raw = f.read()
+            return ingest_three_pass(raw, os.path.join(tmp, "stored.csv"))
+
+        expected, old_seconds, old_peak = measure(three_pass)
+        actual, new_seconds, new_peak = measure(
+            lambda: ingest_processed(upload_path, DataPreprocessor(TIME_SLOTS), args.chunk_rows))
+
+    expected, actual = partitions(expected), partitions(actual)
+    for tm in TIMINGS:
+        pd.testing.assert_frame_equal(expected[tm], actual[tm], check_dtype = False)
+    print("Partitions identical")
+    print(f"  read + validate + write + re-read: {old_seconds:6.2f}s, peak {old_peak / 1e6:7.1f} MB")
+    print(f"  streaming, {args.chunk_rows} rows/chunk: {new_seconds:6.2f}s, peak {new_peak / 1e6:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Local load test of the whole service: drives main.backend_app in-process (httpx ASGI transport)
+against the in-memory Mongo stand-in, trained through /setup on synthetic transactions and the
+categories of db/Categories.csv. Replays a request mix and reports throughput and p50/p95/p99
+latency per endpoint, plus the mean of every recorded stage.
+
+    python -m benchmarks.load_test --requests 5000 --concurrency 32
+    python -m benchmarks.load_test --record mix.jsonl          # keep the generated mix
+    python -m benchmarks.load_test --mix mix.jsonl             # replay it (or any recorded one)
+
+A mix is JSON lines of {"method", "path", "json"}; the API key is added when replayed.
+Runs in a scratch directory, the lookups, artifacts and stored inputs of the repo are untouched.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_KEY = "load-test"
+RECOMMENDATION_PATH = "/api/v1/recommendation"
+BATCH_PATH = "/api/v1/recommendation/batch"
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return float("nan")
+    rank = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def generate_mix(n_requests: int, n_products: int, batch_share: float, batch_size: int, hot_share: float, seed: int) -> list:
+    """
+    Requests shaped like checkout traffic: carts of 0-5 items drawn with a Zipf-like popularity,
+    a share of them repeated from a small hot set (what the base ranking cache serves), and a
+    share of /recommendation/batch calls.
+    """
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, n_products + 1)]
+    upcs = [str(100_000 + i) for i in range(n_products)]
+
+    def cart() -> dict:
+        items = rng.choices(upcs, weights, k = rng.randint(0, 5))
+        return {"cartItems": items, "currentHour": rng.randrange(24), "topN": rng.choice([3, 5, 10])}
+
+    hot_carts = [cart() for _ in range(50)]
+    mix = []
+    for _ in range(n_requests):
+        if rng.random() < batch_share:
+            mix.append({"method": "POST", "path": BATCH_PATH, "json": {"items": [cart() for _ in range(batch_size)]}})
+        else:
+            body = rng.choice(hot_carts) if rng.random() < hot_share else cart()
+            mix.append({"method": "POST", "path": RECOMMENDATION_PATH, "json": body})
+    return mix
+
+
+def read_mix(path: str) -> list:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def write_mix(path: str, mix: list):
+    with open(path, "w") as f:
+        for request in mix:
+            f.write(json.dumps(request) + "\n")
+
+
+def prepare_workdir() -> str:
+    """Scratch copy of the files the service reads from its working directory."""
+    workdir = tempfile.mkdtemp(prefix = "reco-load-")
+    os.makedirs(os.path.join(workdir, "db"))
+    os.makedirs(os.path.join(workdir, "initialize", "Data"))
+    shutil.copy(os.path.join(REPO_DIR, "db", "Categories.csv"), os.path.join(workdir, "db", "Categories.csv"))
+    return workdir
+
+
+async def train(client, sessions: int, seed: int) -> dict:
+    """Full /setup through the API, then a few Fixed/Always products so the final merge runs."""
+    from benchmarks.synthetic import generate_transactions
+    from configs.constant import CATEGORY_DATA_PATH
+
+    processed = io.BytesIO()
+    generate_transactions(n_sessions = sessions, seed = seed).to_csv(processed, index = False)
+    with open(CATEGORY_DATA_PATH, "rb") as f:
+        categories = f.read()
+    response = await client.post("/api/v1/setup", params = {"api_key": API_KEY}, files = {
+        "processed": ("processed.csv", processed.getvalue(), "text/csv"),
+        "categories": ("Categories.csv", categories, "text/csv"),
+    })
+    response.raise_for_status()
+    job_id = response.json()["jobId"]
+    while True:
+        job = (await client.get(f"/api/v1/setup/{job_id}", params = {"api_key": API_KEY})).json()
+        if job["status"] not in ("queued", "running"):
+            break
+        await asyncio.sleep(0.2)
+    if job["status"] != "succeeded":
+        raise RuntimeError(f"/setup failed: {job['error']}")
+
+    for product_type, upcs in (("fixed", ["100003", "100010", "100025"]), ("always", ["100001", "100007"])):
+        csv = "UPC,Product Name\n" + "".join(f"{upc},{upc}\n" for upc in upcs)
+        response = await client.post("/api/v1/upload-products", params = {"api_key": API_KEY, "productType": product_type},
+                                     files = {"file": ("products.csv", csv.encode(), "text/csv")})
+        response.raise_for_status()
+    return job
+
+
+async def replay(client, mix: list, concurrency: int) -> tuple[dict, dict, float]:
+    """Send `mix` from `concurrency` concurrent clients, latencies per path and status counts."""
+    latencies, statuses = {}, {}
+    pending = iter(mix)
+
+    async def worker():
+        for request in pending:
+            started = time.perf_counter()
+            response = await client.request(request["method"], request["path"], params = {"api_key": API_KEY}, json = request.get("json"))
+            latencies.setdefault(request["path"], []).append(time.perf_counter() - started)
+            key = (request["path"], response.status_code)
+            statuses[key] = statuses.get(key, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - started
+
+
+def report(latencies: dict, statuses: dict, seconds: float, measured: int):
+    print(f"\n{measured} requests in {seconds:.2f}s, {measured / seconds:.0f} req/s")
+    print(f"{'endpoint':<32}{'count':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    everything = sorted(value for values in latencies.values() for value in values)
+    for path, values in sorted(latencies.items()) + [("all", everything)]:
+        values = sorted(values)
+        print(f"{path:<32}{len(values):>8}{sum(values) / len(values) * 1e3:>10.2f}"
+              + "".join(f"{percentile(values, q) * 1e3:>10.2f}" for q in (50, 95, 99)) + f"{values[-1] * 1e3:>10.2f}")
+    print("status: " + ", ".join(f"{path} {status} x{count}" for (path, status), count in sorted(statuses.items())))
+
+
+def stage_report():
+    from utils.metrics import latency_metrics
+
+    print(f"\n{'stage (whole run, warmup included)':<56}{'count':>8}{'mean ms':>10}")
+    for (endpoint, stage), histogram in sorted(latency_metrics.stages.items()):
+        print(f"{endpoint + ' ' + stage:<56}{histogram.count:>8}{histogram.sum / histogram.count * 1e3:>10.3f}")
+
+
+async def run(args) -> None:
+    import httpx
+    from loguru import logger
+    from benchmarks.memory_mongo import MemoryMongoClient, install
+    from configs.manager import settings
+    from repos.model_index import model_index_store
+    from utils.cache import base_ranking_cache
+    from utils.single_flight import single_flight
+    import main
+
+    # Every /recommendation logs at debug level, which would dominate the numbers
+    logger.remove()
+    logger.add(sys.stderr, level = args.log_level)
+    settings.API_KEY = API_KEY
+    settings.MODEL_SERVING_MODE = model_index_store.mode = args.serving_mode
+    settings.TRAINING_WORKERS = args.training_workers
+    base_ranking_cache.max_size = args.cache_size
+    single_flight.enabled = not args.no_coalesce
+    mongo = MemoryMongoClient(latency = args.db_latency_ms / 1e3)
+    install(mongo)
+
+    app = main.backend_app
+    transport = httpx.ASGITransport(app = app)
+    async with httpx.AsyncClient(transport = transport, base_url = "http://load-test", timeout = None) as client:
+        await app.router.startup()
+        try:
+            started = time.perf_counter()
+            job = await train(client, args.sessions, args.seed)
+            print(f"/setup on {args.sessions} sessions: {time.perf_counter() - started:.1f}s, model v{job['result']['modelVersion']}, "
+                  f"serving from {args.serving_mode}")
+
+            if args.mix:
+                mix = read_mix(args.mix)
+            else:
+                from benchmarks.synthetic import load_product_names
+                mix = generate_mix(args.requests, len(load_product_names()), args.batch_share, args.batch_size, args.hot_share, args.seed)
+            if args.record:
+                write_mix(args.record, mix)
+                print(f"mix of {len(mix)} requests written to {args.record}")
+
+            # Warm the caches and the lazily loaded lists, not measured
+            await replay(client, mix[:args.warmup], args.concurrency)
+            calls = mongo.calls
+            latencies, statuses, seconds = await replay(client, mix[args.warmup:], args.concurrency)
+            measured = sum(len(values) for values in latencies.values())
+            report(latencies, statuses, seconds, measured)
+            print(f"database calls during the replay: {mongo.calls - calls}, cache: {base_ranking_cache.stats()['hitRatio']} hit ratio")
+            print("reads collapsed (whole run): " + (", ".join(
+                f"{name} {read['collapsed']}/{read['calls']}" for name, read in single_flight.stats()["reads"].items()) or "none"))
+            stage_report()
+        finally:
+            await app.router.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type = int, default = 20_000, help = "Synthetic sessions trained by /setup")
+    parser.add_argument("--requests", type = int, default = 5_000)
+    parser.add_argument("--concurrency", type = int, default = 32)
+    parser.add_argument("--warmup", type = int, default = 200, help = "Requests of the mix sent before measuring")
+    parser.add_argument("--mix", help = "Replay this JSON lines mix instead of generating one")
+    parser.add_argument("--record", help = "Write the mix to this JSON lines file")
+    parser.add_argument("--batch-share", type = float, default = 0.05)
+    parser.add_argument("--batch-size", type = int, default = 20)
+    parser.add_argument("--hot-share", type = float, default = 0.3, help = "Share of carts repeated from a hot set")
+    parser.add_argument("--serving-mode", choices = ["mmap", "memory", "mongo"], default = "mmap")
+    parser.add_argument("--db-latency-ms", type = float, default = 0.5, help = "Simulated round-trip of every database call")
+    parser.add_argument("--cache-size", type = int, default = 10_000, help = "Base ranking cache size, 0 disables it")
+    parser.add_argument("--no-coalesce", action = "store_true", help = "Every request makes its own reads (single-flight off)")
+    parser.add_argument("--training-workers", type = int, default = 1)
+    parser.add_argument("--log-level", default = "WARNING", help = "loguru level while the service runs")
+    parser.add_argument("--seed", type = int, default = 7)
+    parser.add_argument("--keep", action = "store_true", help = "Keep the scratch directory")
+    args = parser.parse_args()
+    if args.mix:
+        args.mix = os.path.abspath(args.mix)
+    if args.record:
+        args.record = os.path.abspath(args.record)
+
+    # The stand-in needs no server, the settings still require these
+    for name in ("MONGO_URI", "DB_NAME", "CATEGORY_DATA_LOCATION", "API_KEY", "api_key"):
+        os.environ.setdefault(name, {"MONGO_URI": "mongodb://load-test", "DB_NAME": "load_test"}.get(name, API_KEY))
+    # The service resolves its data files from the working directory
+    sys.path.insert(0, REPO_DIR)
+    workdir = prepare_workdir()
+    os.chdir(workdir)
+    try:
+        asyncio.run(run(args))
+    finally:
+        os.chdir(REPO_DIR)
+        if args.keep:
+            print(f"scratch directory kept: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors = True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,580 @@
+"""
+In-memory stand-in for the Motor client, enough of it for AIOEngine and the raw collection calls
+of this service to run without a Mongo server. Documents round-trip through BSON like they would
+over the wire, unique indexes are enforced and used for equality / $in lookups, and every call can
+pay a simulated network round-trip.
+
+    from benchmarks.memory_mongo import MemoryMongoClient, install
+    install(MemoryMongoClient(latency = 0.0005))
+"""
+import asyncio
+import bson
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.operations import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+_MISSING = object()
+
+
+def _copy(doc: dict) -> dict:
+    # Same coercions (tuples to lists, no numpy scalars...) and isolation as a server round-trip
+    return bson.decode(bson.encode(doc))
+
+
+def _get(doc: dict, path: str):
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _set(doc: dict, path: str, value):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+
+def _compare(value, op: str, operand) -> bool:
+    if op == "$eq":
+        return value == operand or (isinstance(value, list) and operand in value)
+    if op == "$ne":
+        return not _compare(value, "$eq", operand)
+    if op == "$in":
+        return any(_compare(value, "$eq", item) for item in operand)
+    if op == "$nin":
+        return not _compare(value, "$in", operand)
+    if op == "$exists":
+        return (value is not _MISSING) == bool(operand)
+    if value is _MISSING or value is None:
+        return False
+    try:
+        if op == "$lt":
+            return value < operand
+        if op == "$lte":
+            return value <= operand
+        if op == "$gt":
+            return value > operand
+        if op == "$gte":
+            return value >= operand
+    except TypeError:
+        # Mongo compares across types by type order, no query of this service relies on it
+        return False
+    raise OperationFailure(f"Unsupported query operator {op}")
+
+
+def matches(doc: dict, query: dict) -> bool:
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(doc, sub) for sub in condition):
+                return False
+        elif isinstance(condition, dict) and condition and all(op.startswith("$") for op in condition):
+            value = _get(doc, key)
+            if not all(_compare(value, op, operand) for op, operand in condition.items()):
+                return False
+        elif not _compare(_get(doc, key), "$eq", condition):
+            return False
+    return True
+
+
+def project(doc: dict, projection) -> dict:
+    if not projection:
+        return doc
+    if isinstance(projection, (list, tuple)):
+        projection = dict.fromkeys(projection, 1)
+    include_id = projection.get("_id", 1)
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+    if fields and all(fields.values()):
+        result = {"_id": doc["_id"]} if include_id and "_id" in doc else {}
+        for key in fields:
+            value = _get(doc, key)
+            if value is not _MISSING:
+                _set(result, key, value)
+        return result
+    result = {key: value for key, value in doc.items() if key not in fields}
+    if not include_id:
+        result.pop("_id", None)
+    return result
+
+
+def _sort(docs: list, keys) -> list:
+    if isinstance(keys, dict):
+        keys = list(keys.items())
+    for key, direction in reversed(keys):
+        def sort_key(doc, key = key):
+            # Missing and None sort first, like Mongo
+            value = _get(doc, key)
+            return (0, 0) if value is _MISSING or value is None else (1, value)
+        docs.sort(key = sort_key, reverse = direction < 0)
+    return docs
+
+
+def _apply_update(doc: dict, update: dict, inserting: bool):
+    for op, fields in update.items():
+        for key, operand in fields.items():
+            current = _get(doc, key)
+            if op == "$set" or (op == "$setOnInsert" and inserting):
+                _set(doc, key, operand)
+            elif op == "$inc":
+                _set(doc, key, (0 if current is _MISSING else current) + operand)
+            elif op == "$max":
+                if current is _MISSING or operand > current:
+                    _set(doc, key, operand)
+            elif op == "$min":
+                if current is _MISSING or operand < current:
+                    _set(doc, key, operand)
+            elif op == "$unset":
+                *parents, last = key.split(".")
+                parent = _get(doc, ".".join(parents)) if parents else doc
+                if isinstance(parent, dict):
+                    parent.pop(last, None)
+            elif op != "$setOnInsert":
+                raise OperationFailure(f"Unsupported update operator {op}")
+
+
+def _upsert_seed(query: dict) -> dict:
+    """Fields of the document an upsert inserts, taken from the equality conditions of its filter."""
+    seed = {}
+    for key, condition in query.items():
+        if key.startswith("$"):
+            continue
+        if isinstance(condition, dict) and condition and all(op.startswith("$") for op in condition):
+            if "$eq" in condition:
+                _set(seed, key, condition["$eq"])
+        else:
+            _set(seed, key, condition)
+    return seed
+
+
+class MemoryCursor:
+    """find()/aggregate() cursor: chainable sort/skip/limit, `await to_list()` and `async for`."""
+
+    def __init__(self, collection, fetch, projection = None):
+        self._collection = collection
+        self._fetch = fetch
+        self._projection = projection
+        self._sort = None
+        self._skip = 0
+        self._limit = 0
+        self._docs = None
+
+    def sort(self, key, direction = 1):
+        self._sort = [(key, direction)] if isinstance(key, str) else key
+        return self
+
+    def skip(self, n: int):
+        self._skip = n
+        return self
+
+    def limit(self, n: int):
+        self._limit = n
+        return self
+
+    def batch_size(self, n: int):
+        return self
+
+    async def _load(self) -> list:
+        if self._docs is None:
+            await self._collection.database.client.round_trip()
+            docs = self._fetch()
+            if self._sort:
+                docs = _sort(docs, self._sort)
+            docs = docs[self._skip:]
+            if self._limit:
+                docs = docs[:self._limit]
+            if self._projection is not None:
+                docs = [project(_copy(doc), self._projection) for doc in docs]
+            self._docs = docs
+        return self._docs
+
+    async def to_list(self, length = None) -> list:
+        docs = await self._load()
+        return docs if length is None else docs[:length]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in await self._load():
+            yield doc
+
+
+class MemoryCollection:
+
+    def __init__(self, database, name: str):
+        self.database = database
+        self.name = name
+        self._docs = {}
+        # Unique index name -> (key paths, {key values: _id})
+        self._unique = {}
+        self._indexes = {"_id_": [("_id", 1)]}
+
+    # === Storage ===
+
+    def _index_key(self, doc: dict, paths: tuple):
+        values = tuple(_get(doc, path) for path in paths)
+        return tuple(None if value is _MISSING else value for value in values)
+
+    def _check_unique(self, doc: dict, replacing = None):
+        if doc["_id"] in self._docs and doc["_id"] != replacing:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_ dup key: {doc['_id']!r}", 11000)
+        for name, (paths, entries) in self._unique.items():
+            owner = entries.get(self._index_key(doc, paths))
+            if owner is not None and owner != doc["_id"]:
+                raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {name}", 11000)
+
+    def _store(self, doc: dict, previous: dict | None = None):
+        self._check_unique(doc, replacing = previous["_id"] if previous else None)
+        for paths, entries in self._unique.values():
+            if previous is not None:
+                entries.pop(self._index_key(previous, paths), None)
+            entries[self._index_key(doc, paths)] = doc["_id"]
+        self._docs[doc["_id"]] = doc
+
+    def _remove(self, doc: dict):
+        for paths, entries in self._unique.values():
+            entries.pop(self._index_key(doc, paths), None)
+        del self._docs[doc["_id"]]
+
+    def _candidates(self, query: dict):
+        """Documents that may match, narrowed by _id or a single-field unique index when the query allows it."""
+        indexed = {"_id": None, **{paths[0]: entries for paths, entries in self._unique.values() if len(paths) == 1}}
+        for key, entries in indexed.items():
+            condition = query.get(key, _MISSING)
+            if condition is _MISSING:
+                continue
+            if isinstance(condition, dict) and set(condition) <= {"$eq", "$in"} and condition:
+                values = condition.get("$in", [condition.get("$eq")]) if "$in" in condition else [condition["$eq"]]
+            elif isinstance(condition, dict) or isinstance(condition, list):
+                continue
+            else:
+                values = [condition]
+            ids = values if entries is None else [entries.get((value,)) for value in values]
+            return [self._docs[i] for i in dict.fromkeys(ids) if i is not None and i in self._docs]
+        return self._docs.values()
+
+    def _matching(self, query: dict | None) -> list:
+        query = query or {}
+        return [doc for doc in self._candidates(query) if matches(doc, query)]
+
+    # === Reads ===
+
+    def find(self, filter = None, projection = None, **kwargs) -> MemoryCursor:
+        # Only the documents returned are copied, after sort/skip/limit
+        cursor = MemoryCursor(self, lambda: self._matching(filter), projection or {})
+        if kwargs.get("sort"):
+            cursor.sort(kwargs["sort"])
+        return cursor.skip(kwargs.get("skip", 0)).limit(kwargs.get("limit", 0))
+
+    async def find_one(self, filter = None, projection = None, **kwargs):
+        if filter is not None and not isinstance(filter, dict):
+            filter = {"_id": filter}
+        docs = await self.find(filter, projection, **kwargs).limit(1).to_list(1)
+        return docs[0] if docs else None
+
+    async def count_documents(self, filter, **kwargs) -> int:
+        await self.database.client.round_trip()
+        return len(self._matching(filter))
+
+    async def estimated_document_count(self, **kwargs) -> int:
+        await self.database.client.round_trip()
+        return len(self._docs)
+
+    def aggregate(self, pipeline: list, **kwargs) -> MemoryCursor:
+        def run():
+            docs = [_copy(doc) for doc in self._docs.values()]
+            for stage in pipeline:
+                (op, spec), = stage.items()
+                if op == "$match":
+                    docs = [doc for doc in docs if matches(doc, spec)]
+                elif op == "$sort":
+                    docs = _sort(docs, spec)
+                elif op == "$skip":
+                    docs = docs[spec:]
+                elif op == "$limit":
+                    docs = docs[:spec]
+                elif op == "$project":
+                    docs = [project(doc, spec) for doc in docs]
+                elif op == "$count":
+                    docs = [{spec: len(docs)}]
+                elif op == "$out":
+                    target = self.database[spec]
+                    target._docs, target._unique = {}, {name: (paths, {}) for name, (paths, _) in target._unique.items()}
+                    for doc in docs:
+                        target._store(doc)
+                    docs = []
+                else:
+                    raise OperationFailure(f"Unsupported aggregation stage {op}")
+            return docs
+        return MemoryCursor(self, run)
+
+    # === Writes ===
+
+    async def insert_one(self, document: dict, **kwargs) -> InsertOneResult:
+        await self.database.client.round_trip()
+        document.setdefault("_id", ObjectId())
+        self._store(_copy(document))
+        return InsertOneResult(document["_id"], True)
+
+    async def insert_many(self, documents: list, ordered: bool = True, **kwargs) -> InsertManyResult:
+        if not documents:
+            raise TypeError("documents must be a non-empty list")
+        await self.database.client.round_trip()
+        inserted, errors = [], []
+        for i, document in enumerate(documents):
+            document.setdefault("_id", ObjectId())
+            try:
+                self._store(_copy(document))
+                inserted.append(document["_id"])
+            except DuplicateKeyError as e:
+                errors.append({"index": i, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted), "writeConcernErrors": [],
+                                  "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": []})
+        return InsertManyResult(inserted, True)
+
+    def _update(self, filter: dict, update: dict | None, replacement: dict | None, upsert: bool, many: bool) -> dict:
+        """Apply an update or a replacement, raw result in the server format (n, nModified, upserted)."""
+        if replacement is not None and any(key.startswith("$") for key in replacement):
+            raise ValueError("replacement can not include $ operators")
+        targets = self._matching(filter)
+        if not many:
+            targets = targets[:1]
+        modified = 0
+        for doc in targets:
+            if replacement is not None:
+                new = _copy({"_id": doc["_id"], **{k: v for k, v in replacement.items() if k != "_id"}})
+            else:
+                new = _copy(doc)
+                _apply_update(new, _copy(update), inserting = False)
+            if new != doc:
+                self._store(new, previous = doc)
+                modified += 1
+        raw = {"n": len(targets), "nModified": modified, "ok": 1.0}
+        if not targets and upsert:
+            new = _upsert_seed(filter)
+            if replacement is not None:
+                new.update(_copy(replacement))
+            else:
+                _apply_update(new, _copy(update), inserting = True)
+            new.setdefault("_id", ObjectId())
+            self._store(_copy(new))
+            raw.update(n = 1, upserted = new["_id"])
+        return raw
+
+    async def update_one(self, filter: dict, update: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        await self.database.client.round_trip()
+        return UpdateResult(self._update(filter, update, None, upsert, many = False), True)
+
+    async def update_many(self, filter: dict, update: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        await self.database.client.round_trip()
+        return UpdateResult(self._update(filter, update, None, upsert, many = True), True)
+
+    async def replace_one(self, filter: dict, replacement: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        await self.database.client.round_trip()
+        return UpdateResult(self._update(filter, None, replacement, upsert, many = False), True)
+
+    async def find_one_and_update(self, filter: dict, update: dict, projection = None, sort = None, upsert: bool = False,
+                                  return_document = ReturnDocument.BEFORE, **kwargs):
+        await self.database.client.round_trip()
+        targets = self._matching(filter)
+        if sort:
+            targets = _sort(targets, sort)
+        before = _copy(targets[0]) if targets else None
+        if targets:
+            filter = {"_id": targets[0]["_id"]}
+        raw = self._update(filter, update, None, upsert, many = False)
+        if return_document == ReturnDocument.AFTER:
+            doc_id = raw.get("upserted", filter.get("_id"))
+            doc = self._docs.get(doc_id)
+            return project(_copy(doc), projection) if doc else None
+        return project(before, projection) if before else None
+
+    async def delete_one(self, filter: dict, **kwargs) -> DeleteResult:
+        await self.database.client.round_trip()
+        targets = self._matching(filter)[:1]
+        for doc in targets:
+            self._remove(doc)
+        return DeleteResult({"n": len(targets), "ok": 1.0}, True)
+
+    async def delete_many(self, filter: dict, **kwargs) -> DeleteResult:
+        await self.database.client.round_trip()
+        targets = self._matching(filter)
+        for doc in targets:
+            self._remove(doc)
+        return DeleteResult({"n": len(targets), "ok": 1.0}, True)
+
+    async def bulk_write(self, requests: list, ordered: bool = True, **kwargs) -> BulkWriteResult:
+        await self.database.client.round_trip()
+        result = {"writeErrors": [], "writeConcernErrors": [], "nInserted": 0, "nUpserted": 0,
+                  "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": []}
+        for i, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    request._doc.setdefault("_id", ObjectId())
+                    self._store(_copy(request._doc))
+                    result["nInserted"] += 1
+                    continue
+                if isinstance(request, (DeleteOne, DeleteMany)):
+                    targets = self._matching(request._filter)
+                    targets = targets[:1] if isinstance(request, DeleteOne) else targets
+                    for doc in targets:
+                        self._remove(doc)
+                    result["nRemoved"] += len(targets)
+                    continue
+                if isinstance(request, ReplaceOne):
+                    raw = self._update(request._filter, None, request._doc, request._upsert, many = False)
+                elif isinstance(request, (UpdateOne, UpdateMany)):
+                    raw = self._update(request._filter, request._doc, None, request._upsert, many = isinstance(request, UpdateMany))
+                else:
+                    raise OperationFailure(f"Unsupported bulk operation {type(request).__name__}")
+            except DuplicateKeyError as e:
+                result["writeErrors"].append({"index": i, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+                continue
+            if "upserted" in raw:
+                result["nUpserted"] += 1
+                result["upserted"].append({"index": i, "_id": raw["upserted"]})
+            else:
+                result["nMatched"] += raw["n"]
+                result["nModified"] += raw["nModified"]
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    # === Indexes ===
+
+    async def create_index(self, keys, unique: bool = False, name: str | None = None, **kwargs) -> str:
+        await self.database.client.round_trip()
+        keys = [(keys, 1)] if isinstance(keys, str) else list(keys)
+        name = name or "_".join(f"{key}_{direction}" for key, direction in keys)
+        self._indexes[name] = keys
+        if unique and name not in self._unique:
+            paths, entries = tuple(key for key, _ in keys), {}
+            for doc in self._docs.values():
+                key = self._index_key(doc, paths)
+                if key in entries:
+                    raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {name}", 11000)
+                entries[key] = doc["_id"]
+            self._unique[name] = (paths, entries)
+        return name
+
+    async def create_indexes(self, indexes: list, **kwargs) -> list:
+        names = []
+        for index in indexes:
+            document = index.document
+            names.append(await self.create_index(list(document["key"].items()), unique = document.get("unique", False),
+                                                 name = document.get("name")))
+        return names
+
+    async def drop_index(self, name: str, **kwargs):
+        await self.database.client.round_trip()
+        self._indexes.pop(name, None)
+        self._unique.pop(name, None)
+
+    async def index_information(self) -> dict:
+        return {name: {"key": keys, **({"unique": True} if name in self._unique else {})} for name, keys in self._indexes.items()}
+
+
+class MemoryDatabase:
+
+    def __init__(self, client, name: str):
+        self.client = client
+        self.name = name
+        self._collections = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = MemoryCollection(self, name)
+        return collection
+
+    def get_collection(self, name: str, **kwargs) -> MemoryCollection:
+        return self[name]
+
+    async def command(self, command, *args, **kwargs) -> dict:
+        await self.client.round_trip()
+        if command in ("ping", {"ping": 1}):
+            return {"ok": 1.0}
+        raise OperationFailure(f"Unsupported command {command}")
+
+    async def list_collection_names(self, **kwargs) -> list:
+        await self.client.round_trip()
+        return [name for name, collection in self._collections.items() if collection._docs or len(collection._indexes) > 1]
+
+    async def drop_collection(self, name: str, **kwargs):
+        await self.client.round_trip()
+        self._collections.pop(name, None)
+
+
+class MemorySession:
+    """No-op client session, AIOEngine.save() opens one per call."""
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def end_session(self):
+        pass
+
+
+class MemoryMongoClient:
+    """
+    :param latency: Seconds every database call waits, as a network round-trip would. With 0 it
+        still yields to the event loop once, like an awaited driver call does.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self._databases = {}
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        database = self._databases.get(name)
+        if database is None:
+            database = self._databases[name] = MemoryDatabase(self, name)
+        return database
+
+    def get_database(self, name: str, **kwargs) -> MemoryDatabase:
+        return self[name]
+
+    async def round_trip(self):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+
+    async def start_session(self, **kwargs) -> MemorySession:
+        return MemorySession()
+
+    def close(self):
+        pass
+
+
+def install(client: MemoryMongoClient, database: str | None = None):
+    """Make the service's Mongo singleton (engine and module-level collections) use `client`."""
+    from odmantic import AIOEngine
+    import db.singleton as singleton
+    from configs.manager import settings
+
+    database = database or settings.DB_NAME
+    instance = singleton._MongoClientSingleton()
+    instance.mongo_client = client
+    instance.engine = AIOEngine(client = client, database = database)
+    for name in singleton.__all__:
+        if name.endswith("_collection_name"):
+            setattr(singleton, name, client[database][name[:-len("_name")]])
+    return instance.engine
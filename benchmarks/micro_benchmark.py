@@ -0,0 +1,98 @@
+"""
+Micro-benchmarks of the hot functions of training and serving, one number each so a regression
+shows up when comparing two runs.
+
+    python -m benchmarks.micro_benchmark
+    python -m benchmarks.micro_benchmark --only get_timing merge_final_recommendations
+"""
+import argparse
+import random
+import time
+import timeit
+from benchmarks.aggregation_benchmark import generate_cases
+from benchmarks.synthetic import generate_transactions
+from configs.constant import TIME_SLOTS, TIMINGS_COL
+from initialize.helper import DataPreprocessor, get_timing
+from initialize.models import association_based
+from models.hepler import Aggregation, CompiledAggregation, CompiledRules, categories_dct
+from repos.fixed_always_product import merge_final_recommendations
+
+
+def best_per_call(fn, repeat: int) -> float:
+    """Best seconds per call over `repeat` runs, each long enough (>= 0.2s) to time reliably."""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat = repeat, number = number)) / number
+
+
+def bench_get_timing(args) -> tuple[float, str]:
+    hours = list(range(24)) * 10
+
+    def run():
+        for hour in hours:
+            get_timing(hour, TIME_SLOTS)
+    return best_per_call(run, args.repeat) / len(hours), "per call"
+
+
+def bench_merge_final_recommendations(args) -> tuple[float, str]:
+    rng = random.Random(args.seed)
+    upcs = [str(100_000 + i) for i in range(500)]
+    cases = [(rng.sample(upcs, 60),
+              [{"UPC": upc} for upc in rng.sample(upcs, 5)],
+              [{"UPC": upc} for upc in rng.sample(upcs, 2)],
+              rng.choice([3, 5, 10])) for _ in range(200)]
+
+    def run():
+        for base, fixed, always, top_n in cases:
+            merge_final_recommendations(base, fixed, always, top_n)
+    return best_per_call(run, args.repeat) / len(cases), "per cart"
+
+
+def bench_aggregation(cls, rules, args) -> tuple[float, str]:
+    cases = generate_cases(200, 52, args.seed)
+
+    def run():
+        for reco, cart in cases:
+            cls(list(reco), cart, rules, 17).get_final_recommendations()
+    return best_per_call(run, args.repeat) / len(cases), "per cart"
+
+
+def bench_association_based(args) -> tuple[float, str]:
+    df = DataPreprocessor(TIME_SLOTS).preprocess(generate_transactions(n_sessions = args.sessions, seed = args.seed))
+    partition = df[df[TIMINGS_COL] == "Breakfast"]
+    timer = timeit.Timer(lambda: association_based(partition))
+    return min(timer.repeat(repeat = args.repeat, number = 1)), f"per partition of {len(partition)} rows"
+
+
+BENCHMARKS = {
+    "get_timing": bench_get_timing,
+    "merge_final_recommendations": bench_merge_final_recommendations,
+    "Aggregation": lambda args: bench_aggregation(Aggregation, categories_dct, args),
+    "CompiledAggregation": lambda args: bench_aggregation(CompiledAggregation, CompiledRules(categories_dct), args),
+    "association_based": bench_association_based,
+}
+
+
+def format_seconds(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:8.2f} {unit}"
+    return f"{seconds / 1e-9:8.1f} ns"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", nargs = "+", choices = list(BENCHMARKS))
+    parser.add_argument("--sessions", type = int, default = 20_000, help = "Synthetic sessions for association_based")
+    parser.add_argument("--repeat", type = int, default = 5)
+    parser.add_argument("--seed", type = int, default = 7)
+    args = parser.parse_args()
+
+    for name in args.only or BENCHMARKS:
+        started = time.perf_counter()
+        seconds, unit = BENCHMARKS[name](args)
+        print(f"{name:<30}{format_seconds(seconds)} {unit:<32}({time.perf_counter() - started:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
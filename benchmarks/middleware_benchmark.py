@@ -0,0 +1,174 @@
+"""
+Cost of each layer of the response pipeline, measured by calling the ASGI app directly (no
+server, no client) with a /recommendation sized payload, plus equivalence checks of the pure-ASGI
+exception and gzip middlewares and of FastJSONResponse against what they replace.
+
+    python -m benchmarks.middleware_benchmark --requests 1000
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import time
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from loguru import logger
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.middleware.gzip import GZipMiddleware as StarletteGZipMiddleware
+from middleware.compression import GZipMiddleware
+from middleware.exception import ExceptionHandlerMiddleware
+from middleware.timing import TimingMiddleware
+from utils.responses import FastJSONResponse
+
+
+class LegacyExceptionHandlerMiddleware(BaseHTTPMiddleware):
+    """The BaseHTTPMiddleware version ExceptionHandlerMiddleware replaced."""
+
+    async def dispatch(self, request, call_next):
+        try:
+            return await call_next(request)
+        except Exception as e:
+            return JSONResponse(status_code = 500, content = {'error': e.__class__.__name__, 'messages': e.args})
+
+
+def payload(n_items: int) -> dict:
+    return {
+        "message": "Final Recommendation",
+        "recommendedItems": [{"upc": str(400_000 + i), "name": f"product number {i} é"} for i in range(n_items)],
+    }
+
+
+def build_app(middlewares: list, fast_json: bool, body: dict) -> FastAPI:
+    app = FastAPI()
+
+    if fast_json:
+        @app.post("/reco")
+        async def reco():
+            return FastJSONResponse(body)
+    else:
+        @app.post("/reco")
+        async def reco():
+            return body
+
+    @app.post("/fail")
+    async def fail():
+        raise ValueError("broken", 42)
+
+    # Listed outermost first
+    for middleware, options in reversed(middlewares):
+        app.add_middleware(middleware, **options)
+    return app
+
+
+async def call(app, path: str = "/reco", accept_gzip: bool = True, origin: bool = False) -> tuple[int, dict, bytes]:
+    headers = [(b"host", b"bench"), (b"content-type", b"application/json"), (b"content-length", b"2")]
+    if accept_gzip:
+        headers.append((b"accept-encoding", b"gzip, deflate"))
+    if origin:
+        headers.append((b"origin", b"http://localhost:3000"))
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+             "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "", "headers": headers,
+             "client": ("127.0.0.1", 50000), "server": ("bench", 80)}
+    messages = [{"type": "http.request", "body": b"{}", "more_body": False}]
+    # Like a server: the request body once, then nothing until the client goes away
+    never = asyncio.get_running_loop().create_future()
+
+    async def receive():
+        return messages.pop() if messages else await never
+
+    status, response_headers, chunks = None, {}, []
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            response_headers.update((key.decode(), value.decode()) for key, value in message["headers"])
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    never.cancel()
+    return status, response_headers, b"".join(chunks)
+
+
+async def time_app(app, requests: int, **options) -> float:
+    """Microseconds per request over `requests` sequential requests."""
+    started = time.perf_counter()
+    for _ in range(requests):
+        await call(app, **options)
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+async def check_equivalence(body: dict, large_body: dict):
+    # Same error payload and status
+    for app in (build_app([(LegacyExceptionHandlerMiddleware, {})], False, body), build_app([(ExceptionHandlerMiddleware, {})], False, body)):
+        status, _, content = await call(app, "/fail")
+        assert status == 500 and json.loads(content) == {"error": "ValueError", "messages": ["broken", 42]}, content
+
+    # Same bytes as JSONResponse
+    for content in (body, large_body):
+        assert FastJSONResponse(content).body == JSONResponse(content).body, "FastJSONResponse output differs"
+
+    # Small bodies untouched, large ones gzipped to the same content
+    for content in (body, large_body):
+        responses = []
+        for gzip_middleware in (StarletteGZipMiddleware, GZipMiddleware):
+            app = build_app([(gzip_middleware, {"minimum_size": 1000, "compresslevel": 2})], False, content)
+            responses.append(await call(app))
+        (old_status, old_headers, old_body), (new_status, new_headers, new_body) = responses
+        assert old_status == new_status and old_headers.get("content-encoding") == new_headers.get("content-encoding")
+        assert old_headers.get("vary") == new_headers.get("vary")
+        decode = lambda headers, raw: gzip.decompress(raw) if headers.get("content-encoding") == "gzip" else raw
+        assert decode(old_headers, old_body) == decode(new_headers, new_body), "gzip content differs"
+        assert int(new_headers["content-length"]) == len(new_body)
+
+
+async def main_async(args):
+    body, large_body = payload(args.items), payload(200)
+    # The failing route is expected, not its traceback
+    logger.disable("middleware")
+    await check_equivalence(body, large_body)
+    print(f"Outputs equivalent, payload {len(JSONResponse(body).body)} bytes")
+
+    cors = (CORSMiddleware, {"allow_origins": ["http://localhost:3000"], "allow_credentials": True,
+                             "allow_methods": ["*"], "allow_headers": ["*"]})
+    gzip_options = {"minimum_size": 1000, "compresslevel": 2}
+    layers = [
+        ("bare route (dict -> jsonable_encoder -> JSONResponse)", [], False, {}),
+        ("FastJSONResponse returned by the route", [], True, {}),
+        ("+ ExceptionHandler, BaseHTTPMiddleware", [(LegacyExceptionHandlerMiddleware, {})], False, {}),
+        ("+ ExceptionHandler, pure ASGI", [(ExceptionHandlerMiddleware, {})], False, {}),
+        ("+ CORS, no Origin header", [cors], False, {}),
+        ("+ CORS, with Origin header", [cors], False, {"origin": True}),
+        ("+ Starlette GZip, small body", [(StarletteGZipMiddleware, gzip_options)], False, {}),
+        ("+ GZip, small body", [(GZipMiddleware, gzip_options)], False, {}),
+        ("+ Timing (Server-Timing header)", [(TimingMiddleware, {})], False, {}),
+        ("previous stack", [(LegacyExceptionHandlerMiddleware, {}), cors, (StarletteGZipMiddleware, gzip_options)], False, {"origin": True}),
+        ("current stack", [(TimingMiddleware, {}), (ExceptionHandlerMiddleware, {}), cors, (GZipMiddleware, gzip_options)], True, {"origin": True}),
+    ]
+    apps = [(build_app(middlewares, fast_json, body), options) for _, middlewares, fast_json, options in layers]
+    for app, options in apps:
+        await time_app(app, 50, **options)
+    # Rounds over every layer, best of each: drifts of the machine hit all layers alike
+    best = [float("inf")] * len(apps)
+    for _ in range(args.repeat):
+        for i, (app, options) in enumerate(apps):
+            best[i] = min(best[i], await time_app(app, args.requests, **options))
+
+    print(f"{'layer':<58}{'us/request':>12}{'vs bare':>10}")
+    for (name, *_), micros in zip(layers, best):
+        print(f"{name:<58}{micros:>12.1f}{micros - best[0]:>+10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type = int, default = 1000)
+    parser.add_argument("--repeat", type = int, default = 7)
+    parser.add_argument("--items", type = int, default = 10, help = "Recommended items in the payload")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
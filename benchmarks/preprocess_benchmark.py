@@ -0,0 +1,49 @@
+"""
+Equivalence check and benchmark of the columnar DataPreprocessor against the row-wise version.
+
+    python -m benchmarks.preprocess_benchmark --sessions 100000
+"""
+import argparse
+import time
+from benchmarks.synthetic import generate_transactions
+from configs.constant import TIME_SLOTS, DATE_COL, PRODUCT_NAME_COL, TIMINGS_COL
+from initialize.helper import DataPreprocessor, TimingClassifier
+
+
+def preprocess_row_wise(df):
+    """What DataPreprocessor.preprocess did before it was vectorized."""
+    classifier = TimingClassifier(TIME_SLOTS)
+    df[PRODUCT_NAME_COL] = df[PRODUCT_NAME_COL].apply(lambda x: x.strip().lower() if isinstance(x, str) else x)
+    df[TIMINGS_COL] = df[DATE_COL].apply(classifier.classify_timing)
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type = int, default = 100_000)
+    args = parser.parse_args()
+
+    df = generate_transactions(n_sessions = args.sessions)
+    # A few rows the inferred format does not fit
+    df.loc[df.index[::997], DATE_COL] = "not a date"
+    df.loc[df.index[::1009], DATE_COL] = "03/04/2024 5:15 PM"
+    df.loc[df.index[::1013], PRODUCT_NAME_COL] = "  Mixed Case Name  "
+    print(f"{len(df)} rows")
+
+    started = time.perf_counter()
+    expected = preprocess_row_wise(df.copy())
+    row_wise = time.perf_counter() - started
+    print(f"row-wise: {row_wise:.3f}s")
+
+    started = time.perf_counter()
+    actual = DataPreprocessor(TIME_SLOTS).preprocess(df.copy())
+    columnar = time.perf_counter() - started
+    print(f"columnar: {columnar:.3f}s")
+
+    assert expected[PRODUCT_NAME_COL].tolist() == actual[PRODUCT_NAME_COL].tolist(), "product names differ"
+    assert expected[TIMINGS_COL].tolist() == actual[TIMINGS_COL].astype(object).tolist(), "timings differ"
+    print(f"Outputs identical, speed-up x{row_wise / columnar:.1f}")
+
+
+if __name__ == "__main__":
+    main()
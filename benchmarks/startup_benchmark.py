@@ -0,0 +1,126 @@
+"""
+Cold start of the service: time to import main, to run the startup hook and to answer the first
+and second /recommendation, each measured in a fresh interpreter (against the in-memory Mongo
+stand-in) and reported as the median over the runs. Also lists the slowest imports and fails when
+a training-only module is imported by the serving path or the import exceeds --budget-ms.
+
+    python -m benchmarks.startup_benchmark --runs 5 --budget-ms 900
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_KEY = "startup-benchmark"
+# Needed by /setup only, the serving path must not import them
+TRAINING_ONLY_MODULES = ("pandas", "scipy", "setup", "initialize.models", "initialize.helper", "uvicorn")
+
+
+def child_env() -> dict:
+    env = dict(os.environ)
+    # The stand-in needs no server, the settings still require these
+    for name in ("MONGO_URI", "DB_NAME", "CATEGORY_DATA_LOCATION", "API_KEY", "api_key"):
+        env.setdefault(name, {"MONGO_URI": "mongodb://startup-benchmark", "DB_NAME": "startup_benchmark"}.get(name, API_KEY))
+    env["API_KEY"] = API_KEY
+    # The memory index needs no model artifact on disk
+    env.setdefault("MODEL_SERVING_MODE", "memory")
+    return env
+
+
+def cold_start() -> dict:
+    """Runs in the child: one cold start, timings in seconds."""
+    started = time.perf_counter()
+    import main
+    imported = time.perf_counter()
+    heavy = [name for name in TRAINING_ONLY_MODULES if name in sys.modules]
+
+    import asyncio
+    import httpx
+    from loguru import logger
+    from benchmarks.memory_mongo import MemoryMongoClient, install
+
+    logger.remove()
+    install(MemoryMongoClient())
+
+    async def run() -> dict:
+        app = main.backend_app
+        timings = {"import": imported - started}
+        transport = httpx.ASGITransport(app = app)
+        async with httpx.AsyncClient(transport = transport, base_url = "http://startup") as client:
+            begin = time.perf_counter()
+            await app.router.startup()
+            timings["startup hook"] = time.perf_counter() - begin
+            try:
+                for name in ("first request", "second request"):
+                    begin = time.perf_counter()
+                    response = await client.post("/api/v1/recommendation", params = {"api_key": API_KEY},
+                                                 json = {"cartItems": [], "currentHour": 9, "topN": 5})
+                    timings[name] = time.perf_counter() - begin
+                    timings["status"] = response.status_code
+            finally:
+                await app.router.shutdown()
+        return timings
+
+    timings = asyncio.run(run())
+    timings["heavy"] = heavy
+    return timings
+
+
+def run_child(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args], cwd = REPO_DIR, env = child_env(), capture_output = True, text = True, check = True)
+
+
+def slowest_imports(count: int) -> list:
+    """Packages imported by `import main` with the most import time (their own modules, summed)."""
+    stderr = run_child("-X", "importtime", "-c", "import main").stderr
+    packages = {}
+    for line in stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+\d+ \|\s+(\S+)", line)
+        if match:
+            package = match.group(2).split(".")[0]
+            packages[package] = packages.get(package, 0) + int(match.group(1)) / 1e6
+    return sorted(((seconds, package) for package, seconds in packages.items()), reverse = True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type = int, default = 5, help = "Fresh interpreters, medians are reported")
+    parser.add_argument("--budget-ms", type = float, default = None, help = "Fail when the median import of main exceeds it")
+    parser.add_argument("--top", type = int, default = 12, help = "Slowest packages listed")
+    parser.add_argument("--child", action = "store_true", help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(cold_start()))
+        return
+
+    runs = [json.loads(run_child("-m", "benchmarks.startup_benchmark", "--child").stdout.splitlines()[-1]) for _ in range(args.runs)]
+    print(f"{'cold start, median of ' + str(args.runs):<32}{'ms':>10}{'min ms':>10}{'max ms':>10}")
+    for name in ("import", "startup hook", "first request", "second request"):
+        values = [run[name] * 1e3 for run in runs]
+        print(f"{name:<32}{statistics.median(values):>10.1f}{min(values):>10.1f}{max(values):>10.1f}")
+    print(f"/recommendation status: {sorted({run['status'] for run in runs})}")
+
+    print(f"\n{'slowest packages imported by main':<40}{'ms':>10}")
+    for seconds, name in slowest_imports(args.top):
+        print(f"{name:<40}{seconds * 1e3:>10.1f}")
+
+    failures = []
+    heavy = sorted({name for run in runs for name in run["heavy"]})
+    if heavy:
+        failures.append(f"training-only modules imported by main: {', '.join(heavy)}")
+    median_import = statistics.median(run["import"] for run in runs) * 1e3
+    if args.budget_ms is not None and median_import > args.budget_ms:
+        failures.append(f"import of main took {median_import:.0f} ms, budget {args.budget_ms:.0f} ms")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
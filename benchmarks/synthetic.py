@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+from configs.constant import CATEGORY_DATA_PATH, SESSION_COL, DATE_COL, PRODUCT_NAME_COL, QUANTITY_COL
+
+
+def load_product_names(path: str = CATEGORY_DATA_PATH) -> np.ndarray:
+    return pd.read_csv(path)[PRODUCT_NAME_COL].astype(str).str.strip().str.lower().unique()
+
+
+def generate_transactions(n_sessions: int = 10_000, max_items: int = 8, product_names = None, seed: int = 7) -> pd.DataFrame:
+    """
+    Synthetic airport transactions in the /setup "processed" format.
+    Product popularity follows a Zipf-like curve so associations look like real baskets.
+    """
+    rng = np.random.default_rng(seed)
+    names = load_product_names() if product_names is None else np.asarray(product_names)
+    weights = 1 / np.arange(1, len(names) + 1)
+    weights /= weights.sum()
+
+    items_per_session = rng.integers(1, max_items + 1, size = n_sessions)
+    n_rows = int(items_per_session.sum())
+    session_ids = np.repeat(np.arange(1, n_sessions + 1), items_per_session)
+    session_start = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365 * 24 * 3600, size = n_sessions), unit = "s")
+    product_idx = rng.choice(len(names), size = n_rows, p = weights)
+
+    return pd.DataFrame({
+        SESSION_COL: session_ids,
+        DATE_COL: np.repeat(session_start, items_per_session).strftime("%Y-%m-%d %H:%M:%S"),
+        PRODUCT_NAME_COL: names[product_idx],
+        QUANTITY_COL: rng.integers(1, 4, size = n_rows),
+        "UPC": (product_idx + 100_000).astype(str),
+    })
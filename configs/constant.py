@@ -1,5 +1,6 @@
 PROCESSED_DATA_PATH = "initialize/Data/processed.csv" # During the deployment we can store it to cloud storage
 CATEGORY_DATA_PATH = "db/Categories.csv"
+DELTA_DATA_DIR = "initialize/Data/deltas" # Delta uploads merged since the last full /setup
 GREEN = '\033[92m'
 RED = '\033[91m'
 RESET = '\033[0m'
@@ -11,7 +12,19 @@ EXPECTED_PROCESSED_COLS = {
     'Quantity': 'int64',
 }
 
+# dtypes the processed upload is parsed with, chunk by chunk. UPCs stay strings (leading zeros)
+PROCESSED_DTYPES = {
+    'Session_id': 'int64',
+    'Datetime': 'object',
+    'Product_name': 'object',
+    'Quantity': 'int64',
+    'UPC': 'object',
+}
+
+# Store served when a request has no storeId, its models and inputs keep the unscoped names
 SHOP_LOCATION = 'Jackson Hole Airport'
+# storeId of the other stores, used in collection names and directories
+STORE_ID_PATTERN = r'^[a-z0-9][a-z0-9_-]{0,31}$'
 
 SESSION_COL = 'Session_id'
 DATE_COL = 'Datetime'
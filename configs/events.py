@@ -1,7 +1,11 @@
 import bcrypt
 from loguru import logger
-from db.singleton import get_engine, ping,close_connection
+from configs.manager import settings
+from db.singleton import get_engine, ping, close_connection, warm_up
 from models.db import User
+from repos.store_registry import store_registry
+from utils.config_bus import MODELS_CHANNEL, config_bus
+from utils.lookup_store import lookup_store
 
 def startup_event() :
     async def startup_db_client():
@@ -9,6 +13,8 @@ def startup_event() :
             logger.info("Connecting to database...")
             await ping()
             logger.info("Connected to database successfully")
+            connections = await warm_up()
+            logger.info(f"Database connection pool warmed up, {connections} connections open")
             
             # Create a admin user if the user collection is empty
             db = get_engine()
@@ -27,14 +33,39 @@ def startup_event() :
 
         except Exception as e:
             logger.error(f"Error while starting up db : {e}")
+
+        try:
+            db = get_engine()
+            await config_bus.poll(db, notify = False)
+            # Default store, the others are loaded by their first request
+            await store_registry.default.models.refresh(db)
+        except Exception as e:
+            # The poll above recorded the published version, the next one loads it again
+            config_bus.forget(MODELS_CHANNEL)
+            logger.error(f"Error while loading the model index, serving from database : {e}")
+        try:
+            await store_registry.default.catalog.refresh(get_engine())
+        except Exception as e:
+            config_bus.forget(MODELS_CHANNEL)
+            logger.error(f"Error while loading the category catalog : {e}")
+        # After the model index: it pins the lookup maps stored with its version
+        try:
+            snapshot = lookup_store.snapshot()
+            logger.info(f"Lookup maps loaded (version {snapshot.version})")
+        except FileNotFoundError as e:
+            logger.warning(f"Lookup maps not available yet, run /setup first : {e}")
+
+        # Pick up models and product lists changed by any worker
+        config_bus.start_watching(get_engine(), settings.CONFIG_VERSION_POLL_SECONDS)
     return startup_db_client
 
 def shutdown_event():
     async def shutdown_db_client():
         try:
+            config_bus.stop_watching()
             logger.info("Closing database connection...")
             await close_connection()
             logger.info("Database connection closed successfully")
         except Exception as e:
             logger.error(f"Error in closing database connection: {e}")
-        return shutdown_db_client
\ No newline at end of file
+    return shutdown_db_client
\ No newline at end of file
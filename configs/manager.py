@@ -22,6 +22,50 @@ class BackendBaseSettings(BaseSettings):
     SERVER_WORKERS:int=4
     LOG_LEVEL:str="debug"
     SERVER_RELOAD:bool=True
+
+    # Mongo client of each worker, see the pymongo options of the same name
+    MONGO_MAX_POOL_SIZE:int=100
+    # Connections opened by the startup hook and kept open, so first requests after a deploy do not connect
+    MONGO_MIN_POOL_SIZE:int=4
+    MONGO_MAX_IDLE_TIME_MS:int|None=None
+    MONGO_WAIT_QUEUE_TIMEOUT_MS:int|None=None
+    MONGO_SERVER_SELECTION_TIMEOUT_MS:int=30000
+    MONGO_CONNECT_TIMEOUT_MS:int=20000
+    MONGO_SOCKET_TIMEOUT_MS:int|None=None
+    # primary, primaryPreferred, secondary, secondaryPreferred or nearest
+    MONGO_READ_PREFERENCE:str="primary"
+    # Wire compression offered to the server, e.g. "zstd,zlib" (zstd and snappy need their python packages)
+    MONGO_COMPRESSORS:str=""
+    # Identical serving reads in flight at the same time share one round-trip (utils/single_flight.py)
+    MONGO_COALESCE_READS:bool=True
+
+    # "mmap" serves trained models from the binary artifact shared by all workers of the host (built
+    # from the database on the hosts that did not publish the version),
+    # "memory" from an in-process index per worker, "mongo" reads them on every request
+    MODEL_SERVING_MODE:str="mmap"
+    # Approximate memory (models, category catalog, lookups, mapped artifacts) of the stores a worker
+    # keeps loaded, the least recently used ones beyond it are evicted. The default store always stays
+    STORE_MEMORY_BUDGET_MB:int=2048
+    # How often each worker checks the config versions (models, Fixed/Always products) for changes
+    CONFIG_VERSION_POLL_SECONDS:float=2
+
+    # In-process cache of the /recommendation base ranking, 0 disables it
+    RECO_CACHE_SIZE:int=10000
+    RECO_CACHE_TTL_SECONDS:float=300
+    # Association weights of each cart item scaled to sum to 1 before they are summed across the cart
+    ASSOCIATION_NORMALIZE:bool=False
+    # Most carts accepted by /recommendation/batch
+    RECO_BATCH_MAX_ITEMS:int=500
+
+    # Per-stage durations of each response in a Server-Timing header (browser devtools, curl -v)
+    SERVER_TIMING_ENABLED:bool=True
+
+    # Processes used by /setup to train the timing partitions in parallel, 1 trains in a thread
+    TRAINING_WORKERS:int=4
+    # Rows of the processed upload parsed at a time by /setup, bounds the parsing memory
+    INGEST_CHUNK_ROWS:int=100000
+    # Lease of the training lock, renewed while a /setup job runs: the lock of a job whose worker died is free after this long
+    TRAINING_JOB_LEASE_SECONDS:float=120
     model_config = SettingsConfigDict(env_file=".env")
 
 
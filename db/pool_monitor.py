@@ -0,0 +1,120 @@
+import threading
+import time
+from pymongo import monitoring
+from utils.metrics import LatencyHistogram
+
+# Upper bounds in seconds, a checkout from a warm pool takes microseconds
+CHECKOUT_WAIT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+
+class _PoolCounters:
+    __slots__ = ("open", "in_use", "max_in_use", "checkouts", "failed_checkouts", "created", "closed", "cleared", "wait")
+
+    def __init__(self):
+        self.open = 0
+        self.in_use = 0
+        self.max_in_use = 0
+        self.checkouts = 0
+        self.failed_checkouts = {}
+        self.created = 0
+        self.closed = 0
+        self.cleared = 0
+        self.wait = LatencyHistogram(CHECKOUT_WAIT_BUCKETS)
+
+    def stats(self) -> dict:
+        wait = self.wait
+        return {
+            "open": self.open,
+            "inUse": self.in_use,
+            "maxInUse": self.max_in_use,
+            "checkouts": self.checkouts,
+            "failedCheckouts": dict(self.failed_checkouts),
+            "created": self.created,
+            "closed": self.closed,
+            "cleared": self.cleared,
+            "checkoutWaitMs": {
+                "mean": round(wait.sum / wait.count * 1e3, 3) if wait.count else None,
+                **{f"p{round(q * 100)}": round(bound * 1e3, 3) if bound not in (None, float("inf")) else bound
+                   for q, bound in ((q, wait.quantile(q)) for q in (0.5, 0.95, 0.99))},
+            },
+        }
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """
+    Connection pool events of this worker's Mongo client, per server: connections open and
+    checked out, and how long each checkout waited for a connection. pymongo calls it from its
+    own threads, hence the lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools = {}
+        self.started_at = time.time()
+
+    def _pool(self, address) -> _PoolCounters:
+        key = f"{address[0]}:{address[1]}"
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = _PoolCounters()
+        return pool
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self._pool(event.address).cleared += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool.created += 1
+            pool.open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool.closed += 1
+            pool.open -= 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            failed = self._pool(event.address).failed_checkouts
+            failed[event.reason] = failed.get(event.reason, 0) + 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool.checkouts += 1
+            pool.in_use += 1
+            pool.max_in_use = max(pool.max_in_use, pool.in_use)
+            if event.duration is not None:
+                pool.wait.observe(event.duration)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self._pool(event.address).in_use -= 1
+
+    def open_connections(self) -> int:
+        with self._lock:
+            return sum(pool.open for pool in self._pools.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"since": self.started_at, "servers": {address: pool.stats() for address, pool in self._pools.items()}}
+
+
+pool_monitor = PoolMonitor()
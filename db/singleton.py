@@ -1,6 +1,8 @@
 
+import asyncio
 from loguru import logger
 from configs.manager import settings
+from db.pool_monitor import pool_monitor
 from motor import motor_asyncio, core
 from odmantic import AIOEngine
 from pymongo.driver_info import DriverInfo
@@ -17,12 +19,28 @@ class _MongoClientSingleton:
         if not hasattr(cls, "instance"):
             cls.instance = super(_MongoClientSingleton, cls).__new__(cls)
             cls.instance.mongo_client = motor_asyncio.AsyncIOMotorClient(
-                settings.MONGO_URI, driver = DRIVER_INFO
+                settings.MONGO_URI, driver = DRIVER_INFO, event_listeners = [pool_monitor], **client_options()
             )
             cls.instance.engine = AIOEngine(client=cls.instance.mongo_client, database=settings.DB_NAME)
         return cls.instance 
 
 
+def client_options() -> dict:
+    """Pool, timeout, read preference and compression options from the settings, unset ones left to pymongo."""
+    options = {
+        "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": settings.MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": settings.MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": settings.MONGO_SOCKET_TIMEOUT_MS,
+        "readPreference": settings.MONGO_READ_PREFERENCE,
+        "compressors": settings.MONGO_COMPRESSORS or None,
+    }
+    return {name: value for name, value in options.items() if value is not None}
+
+
 def MongoDatabase() -> core.AgnosticDatabase:
     return _MongoClientSingleton().mongo_client[settings.DB_NAME]
 
@@ -34,24 +52,46 @@ def get_engine() -> AIOEngine:
 async def ping():
     await MongoDatabase().command("ping")
 
-async def close_connection():
-    await _MongoClientSingleton().mongo_client.close()
+async def warm_up(connections: int = settings.MONGO_MIN_POOL_SIZE) -> int:
+    """
+    Open `connections` pooled connections now with concurrent pings, rather than on the first requests.
+    :return: Connections open afterwards.
+    """
+    database = MongoDatabase()
+    await asyncio.gather(*(database.command("ping") for _ in range(max(1, connections))))
+    return pool_monitor.open_connections()
 
 
-breakfast_association_collection_name = MongoDatabase()['breakfast_association_collection']
-lunch_association_collection_name = MongoDatabase()['lunch_association_collection']
-dinner_association_collection_name = MongoDatabase()['dinner_association_collection']
-other_association_collection_name = MongoDatabase()['other_association_collection']
-
-breakfast_popular_collection_name = MongoDatabase()['breakfast_popular_collection']
-lunch_popular_collection_name = MongoDatabase()['lunch_popular_collection']
-dinner_popular_collection_name = MongoDatabase()['dinner_popular_collection']
-other_popular_collection_name = MongoDatabase()['other_popular_collection']
+async def close_connection():
+    # Motor's close() is synchronous
+    _MongoClientSingleton().mongo_client.close()
+
+
+_COLLECTIONS = {
+    "breakfast_association_collection_name": "breakfast_association_collection",
+    "lunch_association_collection_name": "lunch_association_collection",
+    "dinner_association_collection_name": "dinner_association_collection",
+    "other_association_collection_name": "other_association_collection",
+    "breakfast_popular_collection_name": "breakfast_popular_collection",
+    "lunch_popular_collection_name": "lunch_popular_collection",
+    "dinner_popular_collection_name": "dinner_popular_collection",
+    "other_popular_collection_name": "other_popular_collection",
+}
+
+
+def __getattr__(name: str):
+    # The client is created on first use, not when the module is imported
+    if name in _COLLECTIONS:
+        collection = MongoDatabase()[_COLLECTIONS[name]]
+        globals()[name] = collection
+        return collection
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 __all__ = ["MongoDatabase", 
            "get_engine",
            "ping", 
            "close_connection",
+           "warm_up",
            "breakfast_association_collection_name",
            "lunch_association_collection_name",
            "dinner_association_collection_name",
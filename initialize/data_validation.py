@@ -1,34 +1,28 @@
 from configs.constant import  GREEN, RED, RESET, EXPECTED_PROCESSED_COLS, EXPECTED_CATEGORY_COLS
 
-def validate(df1, df2):
+def validate_columns(df, expected_cols, verbose = True):
+    """
+    Check that every expected column exists with the expected dtype.
+    :param verbose: Also report the columns that are correct.
+    """
     problem = False
-    for column, expected_dtype in EXPECTED_PROCESSED_COLS.items():
-        if column not in df1.columns:
+    for column, expected_dtype in expected_cols.items():
+        if column not in df.columns:
             print(f"{RED}Column '{column}' is missing.{RESET}")
             problem = True
-        elif df1[column].dtype != expected_dtype:
-            print(f"{RED}Column '{column}' has incorrect type. Expected {expected_dtype} but got {df1[column].dtype}.{RESET}")
+        elif df[column].dtype != expected_dtype:
+            print(f"{RED}Column '{column}' has incorrect type. Expected {expected_dtype} but got {df[column].dtype}.{RESET}")
             problem = True
-        else:
+        elif verbose:
             print(f"{GREEN}Column '{column}' exists and has the correct type ({expected_dtype}).{RESET}")
+    return not problem
 
-    for column, expected_dtype in EXPECTED_CATEGORY_COLS.items():
-        if column not in df2.columns:
-            print(f"{RED}Column '{column}' is missing.{RESET}")
-            problem = True
-        elif df2[column].dtype != expected_dtype:
-            print(f"{RED}Column '{column}' has incorrect type. Expected {expected_dtype} but got {df2[column].dtype}.{RESET}")
-            problem = True
-        else:
-            print(f"{GREEN}Column '{column}' exists and has the correct type ({expected_dtype}).{RESET}")
+def validate(df1, df2):
+    valid = validate_columns(df1, EXPECTED_PROCESSED_COLS)
+    valid = validate_columns(df2, EXPECTED_CATEGORY_COLS) and valid
 
-    if problem:
+    if not valid:
         return False
     else:
         print("Data Validation Successful")
         return True
-
-
-
-
-
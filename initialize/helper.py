@@ -1,17 +1,15 @@
+import warnings
+import numpy as np
 import pandas as pd
-from configs.constant import DATE_COL, PRODUCT_NAME_COL, TIMINGS_COL, TIMINGS
+from pymongo import ReplaceOne
+from configs.constant import DATE_COL, PRODUCT_NAME_COL, TIMINGS_COL, EXPECTED_PROCESSED_COLS, PROCESSED_DTYPES
+from initialize.data_validation import validate_columns
+# Lives with the serving code, which must not import pandas
+from utils.timing import get_timing
 from typing import Union, Dict, Tuple
 
+INSERT_CHUNK_SIZE = 5000
 
-def get_timing(hr, timing_ranges):
-    try:
-        for category, (start, end) in timing_ranges.items():
-                    if category in TIMINGS:
-                    # Handles cases where the range spans midnight
-                        if start <= hr < end or (start > end and (hr >= start or hr < end)):
-                            return category
-    except:
-        return "None"
 
 class TimingClassifier:
     def __init__(self, timing_ranges: Dict[str, Tuple[int, int]]):
@@ -20,6 +18,8 @@ class TimingClassifier:
         :param timing_ranges: A dictionary of timing categories and their hour ranges.
         """
         self.timing_ranges = timing_ranges
+        # Timing of every hour of the day, the last entry is for unparseable datetimes
+        self.hour_labels = np.array([get_timing(hour, timing_ranges) for hour in range(24)] + ["None"], dtype = object)
 
     def classify_timing(self, datetime_str: Union[str, pd.Timestamp]) -> str:
         """
@@ -38,6 +38,41 @@ class TimingClassifier:
         except Exception:
             return "None"
 
+    @staticmethod
+    def _hour_of(value) -> float:
+        try:
+            dt = pd.to_datetime(value, errors='coerce')
+            return np.nan if pd.isnull(dt) else dt.hour
+        except Exception:
+            return np.nan
+
+    def extract_hours(self, values: pd.Series) -> np.ndarray:
+        """
+        Hour of every value as a float array, NaN where it cannot be parsed.
+        The column is parsed once; values the inferred format does not fit (mixed formats or
+        time zones) are parsed one by one, exactly as classify_timing would.
+        """
+        with warnings.catch_warnings():
+            # "Could not infer format" and mixed time zone warnings, handled by the fallback below
+            warnings.simplefilter("ignore")
+            try:
+                parsed = pd.to_datetime(values, errors='coerce')
+            except Exception:
+                parsed = None
+
+        if parsed is not None and pd.api.types.is_datetime64_any_dtype(parsed):
+            hours = parsed.dt.hour.to_numpy(dtype = float, na_value = np.nan)
+            missed = np.flatnonzero(np.isnan(hours) & values.notna().to_numpy())
+        else:
+            hours = np.full(len(values), np.nan)
+            missed = np.flatnonzero(values.notna().to_numpy())
+
+        if len(missed):
+            retry = values.iloc[missed]
+            hour_by_value = {value: self._hour_of(value) for value in pd.unique(retry)}
+            hours[missed] = retry.map(hour_by_value).to_numpy(dtype = float)
+        return hours
+
     def apply_timing_classification(self, df: pd.DataFrame, datetime_col: str, output_col: str) -> pd.DataFrame:
         """
         Apply timing classification to a DataFrame.
@@ -46,11 +81,27 @@ class TimingClassifier:
         :param output_col: Column name where the classified timings will be stored.
         :return: Updated DataFrame with the timing classification.
         """
-        df[output_col] = df[datetime_col].apply(self.classify_timing)
+        hours = self.extract_hours(df[datetime_col])
+        codes = np.where(np.isnan(hours), 24, hours).astype(np.int64)
+        labels = self.hour_labels[codes]
+        if all(isinstance(label, str) for label in self.hour_labels):
+            labels = pd.Categorical(labels)
+        df[output_col] = labels
         return df
 
     
 
+def clean_names(names: pd.Series) -> pd.Series:
+    """Strip and lowercase string values, other values are kept. Each distinct name is cleaned once."""
+    codes, uniques = pd.factorize(names)
+    uniques = pd.Series(uniques, dtype = object)
+    is_str = uniques.map(type).eq(str).to_numpy()
+    cleaned = uniques.where(~is_str, uniques.str.strip().str.lower()).to_numpy(dtype = object)
+    # Missing values have code -1 and stay as they are
+    return pd.Series(np.where(codes >= 0, cleaned[codes] if len(cleaned) else None, names.to_numpy(dtype = object)),
+                     index = names.index, dtype = object)
+
+
 class DataPreprocessor:
     def __init__(self, timing_slots: Dict[str, Tuple[int, int]]):
         """
@@ -67,7 +118,7 @@ class DataPreprocessor:
         """
         # Clean the 'Product_name' column
         if PRODUCT_NAME_COL in df_inp.columns:
-            df_inp[PRODUCT_NAME_COL] = df_inp[PRODUCT_NAME_COL].apply(lambda x: x.strip().lower() if isinstance(x, str) else x)
+            df_inp[PRODUCT_NAME_COL] = clean_names(df_inp[PRODUCT_NAME_COL])
 
         # Apply timing classification
         df_out = self.timing_classifier.apply_timing_classification(df_inp, datetime_col = DATE_COL, output_col = TIMINGS_COL)
@@ -75,10 +126,74 @@ class DataPreprocessor:
     
 
 
-def insert_data(collection_name, inp_data, many = True, dataset_name = ''):
-    collection_name.delete_many({})
+def ingest_processed(path: str, preprocessor: DataPreprocessor, chunk_rows: int = 100_000) -> pd.DataFrame:
+    """
+    Parse, validate and preprocess the processed transactions CSV in a single streaming pass.
+    Each chunk is parsed with explicit dtypes by the C engine, checked against EXPECTED_PROCESSED_COLS
+    and preprocessed before the next one is read; only the columns training needs are kept, with
+    repeated strings shared, so the raw text is never held in memory as a whole.
+    :param path: CSV file to read.
+    :param preprocessor: Cleans the names and classifies the timing of each chunk.
+    :param chunk_rows: Rows parsed at a time.
+    :return: Preprocessed DataFrame without the datetime column.
+    :raises ValueError: When a column is missing or a chunk does not parse with the expected dtypes.
+    """
+    header = pd.read_csv(path, nrows = 0).columns
+    missing = [column for column in PROCESSED_DTYPES if column not in header]
+    if missing:
+        raise ValueError(f"Columns {missing} are missing from the processed data.")
+
+    parts = []
+    rows = 0
+    with pd.read_csv(path, usecols = list(PROCESSED_DTYPES), dtype = PROCESSED_DTYPES, chunksize = chunk_rows, engine = "c") as reader:
+        while True:
+            try:
+                chunk = next(reader)
+            except StopIteration:
+                break
+            except (ValueError, TypeError) as e:
+                # e.g. a non integer Quantity, the parser stops at the first bad chunk
+                raise ValueError(f"Invalid processed data after row {rows}: {e}") from e
+            if not validate_columns(chunk, EXPECTED_PROCESSED_COLS, verbose = False):
+                raise ValueError(f"Rows {rows} to {rows + len(chunk)} do not match the expected column types.")
+            chunk = preprocessor.preprocess(chunk).drop(columns = [DATE_COL])
+            # One string object per distinct UPC instead of one per row
+            chunk["UPC"] = chunk["UPC"].astype("category")
+            parts.append(chunk)
+            rows += len(chunk)
+
+    if not parts:
+        return pd.DataFrame(columns = [column for column in PROCESSED_DTYPES if column != DATE_COL] + [TIMINGS_COL])
+    df = pd.concat(parts, ignore_index = True)
+    # Back to plain object columns, they reference the shared category strings
+    for column in ("UPC", TIMINGS_COL):
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype(object)
+    return df
+
+
+async def insert_data(collection_name, inp_data, many = True, dataset_name = '', chunk_size = INSERT_CHUNK_SIZE):
+    await collection_name.delete_many({})
     if many:
-        collection_name.insert_many(inp_data)
+        # Large unordered batches, the server applies them without stopping at the first error
+        # insert_many refuses an empty list, a timing slot without sales just stays empty
+        for start in range(0, len(inp_data), chunk_size):
+            await collection_name.insert_many(inp_data[start:start + chunk_size], ordered = False)
     else:
-        collection_name.insert_one(inp_data)
-    print(f"{dataset_name} data stored successfully!")
\ No newline at end of file
+        await collection_name.insert_one(inp_data)
+    print(f"{dataset_name} data stored successfully!")
+
+
+async def upsert_association_data(collection_name, inp_data, dataset_name = '', chunk_size = INSERT_CHUNK_SIZE):
+    # Replaces the documents of the given products only, the others are kept
+    for start in range(0, len(inp_data), chunk_size):
+        await collection_name.bulk_write([ReplaceOne({"product": doc["product"]}, doc, upsert = True)
+                                          for doc in inp_data[start:start + chunk_size]], ordered = False)
+    print(f"{dataset_name} data updated successfully!")
+
+
+async def create_product_indexes(collections, dataset_name = ''):
+    # Association documents are fetched by product, one document per product
+    for collection in collections:
+        await collection.create_index("product", unique = True, name = "product_unique")
+    print(f"{dataset_name} indexes created successfully!")
\ No newline at end of file
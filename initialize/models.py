@@ -1,5 +1,9 @@
+import time
+from itertools import chain
+import numpy as np
 import pandas as pd
 from collections import defaultdict
+from scipy import sparse
 from configs.constant import QUANTITY_COL, PRODUCT_NAME_COL, SESSION_COL
 
 
@@ -11,7 +15,8 @@ def popular_based(df, top_n = 100):
     return [{'popular_data': df_popular.to_dict()}]
 
 
-def association_based(df: pd.DataFrame, top_n = 100) -> list:
+def association_based_loop(df: pd.DataFrame, top_n = 100) -> list:
+    """Reference implementation of association_based, kept for equivalence checks and benchmarks."""
     association_cache = defaultdict(lambda: defaultdict(int))
 
     # Group by session and process associations
@@ -32,5 +37,173 @@ def association_based(df: pd.DataFrame, top_n = 100) -> list:
     }
 
     # Prepare output in the desired format
-    return [{'product': product, 'associate_products': associates} 
-            for product, associates in sorted_association_cache.items()]
\ No newline at end of file
+    return [{'product': product, 'associate_products': associates}
+            for product, associates in sorted_association_cache.items()]
+
+
+def session_quantities(quantities: pd.Series) -> np.ndarray:
+    """Quantities as the loop adds them: a missing one adds nothing, fractional ones are summed as they are."""
+    values = quantities.fillna(0).to_numpy()
+    if values.dtype.kind == 'f' and not np.array_equal(values, np.floor(values)):
+        return values
+    return values.astype(np.int64)
+
+
+def sum_entries(rows: np.ndarray, cols: np.ndarray, values: np.ndarray, shape: tuple) -> sparse.csr_matrix:
+    """
+    Sum the values of (row, column) entries into a CSR matrix, zero sums included. Each row lists
+    its columns in the order they first appear in the entries, its indices are not sorted.
+    """
+    # Hashed, cells are numbered by first appearance
+    cells, keys = pd.factorize(rows.astype(np.int64) * shape[1] + cols)
+    sums = np.bincount(cells, weights = values, minlength = len(keys))
+    if values.dtype.kind in 'iu':
+        # Exact, sums stay far below 2**53
+        sums = sums.astype(np.int64)
+    keys = np.asarray(keys)
+    cell_rows = keys // shape[1]
+    ranked = np.argsort(cell_rows, kind = 'stable')
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(cell_rows, minlength = shape[0]))))
+    return sparse.csr_matrix((sums[ranked], (keys % shape[1])[ranked], indptr), shape = shape)
+
+
+def co_occurrence_matrix(df: pd.DataFrame) -> tuple[sparse.csr_matrix, np.ndarray]:
+    """
+    Build the product x product co-occurrence counts of a transactions DataFrame.
+    Cell (p, q) is the quantity of q bought in the same session as p, summed over every
+    pair of distinct rows of the session, same as association_based_loop. Each row lists its
+    associates in the order the loop first meets them, which is how it breaks ties.
+    :param df: Transactions with session, product name and quantity columns.
+    :return: CSR matrix of counts and the product names of its rows/columns.
+    """
+    df = df[df[SESSION_COL].notna()]
+    session_codes, _ = pd.factorize(df[SESSION_COL], sort = True)
+
+    # Number products by first appearance when walking sessions in order, like the loop does
+    order = np.argsort(session_codes, kind = 'stable')
+    session_codes = session_codes[order]
+    product_codes, product_names = pd.factorize(df[PRODUCT_NAME_COL].astype(str).to_numpy()[order])
+    quantities = session_quantities(df[QUANTITY_COL])[order]
+
+    # Every pair (i, j) of distinct rows of a session, in the loop's order: by session, i, then j
+    sizes = np.bincount(session_codes)
+    row_sizes = sizes[session_codes]
+    i = np.repeat(np.arange(len(session_codes)), row_sizes)
+    j = (np.repeat((np.cumsum(sizes) - sizes)[session_codes], row_sizes)
+         + np.arange(len(i)) - np.repeat(np.cumsum(row_sizes) - row_sizes, row_sizes))
+    distinct = i != j
+    i, j = i[distinct], j[distinct]
+
+    counts = sum_entries(product_codes[i], product_codes[j], quantities[j], (len(product_names), len(product_names)))
+    return counts, np.asarray(product_names, dtype = object)
+
+
+def top_n_per_row(counts: sparse.csr_matrix, top_n: int):
+    """
+    Yield (row, columns, values) with the top_n values of every non-empty row, highest first.
+    Uses partial selection; ties at the cut-off and in the ordering go to the column listed first
+    in the row, like the stable sort of the loop.
+    """
+    indptr, indices, data = counts.indptr, counts.indices, counts.data
+    for row in range(counts.shape[0]):
+        start, end = indptr[row], indptr[row + 1]
+        if start == end:
+            continue
+        cols, vals = indices[start:end], data[start:end]
+        if end - start > top_n:
+            kth = np.partition(vals, len(vals) - top_n)[len(vals) - top_n]
+            above = np.flatnonzero(vals > kth)
+            tied = np.flatnonzero(vals == kth)[:top_n - len(above)]
+            keep = np.sort(np.concatenate([above, tied]))
+            cols, vals = cols[keep], vals[keep]
+        ranked = np.argsort(-vals, kind = 'stable')
+        yield row, cols[ranked], vals[ranked]
+
+
+def association_documents(counts: sparse.csr_matrix, product_names: np.ndarray, top_n = 100, associate_names: np.ndarray = None) -> list:
+    associate_names = product_names if associate_names is None else associate_names
+    return [{'product': product_names[row],
+             'associate_products': dict(zip(associate_names[cols].tolist(), vals.tolist()))}
+            for row, cols, vals in top_n_per_row(counts, top_n)]
+
+
+def association_based(df: pd.DataFrame, top_n = 100) -> list:
+    counts, product_names = co_occurrence_matrix(df)
+    return association_documents(counts, product_names, top_n)
+
+
+def popularity_counts(df: pd.DataFrame) -> dict:
+    """Quantity sold of every product, the raw counts popular_based ranks."""
+    return df.groupby(PRODUCT_NAME_COL)[QUANTITY_COL].sum().to_dict()
+
+
+def association_count_rows(counts: sparse.csr_matrix, product_names: np.ndarray, associate_names: np.ndarray = None) -> list:
+    """Every non-empty row of a co-occurrence matrix, the raw counts association_based ranks."""
+    associate_names = product_names if associate_names is None else associate_names
+    indptr, indices, data = counts.indptr, counts.indices, counts.data
+    return [{'product': product_names[row],
+             'associates': associate_names[indices[indptr[row]:indptr[row + 1]]].tolist(),
+             'counts': data[indptr[row]:indptr[row + 1]].tolist()}
+            for row in range(counts.shape[0]) if indptr[row] != indptr[row + 1]]
+
+
+def merge_counts(base: dict, delta: dict) -> dict:
+    """Add the counts of new sessions, counts are sums over sessions so they merge by addition."""
+    merged = dict(base)
+    for key, count in delta.items():
+        merged[key] = merged.get(key, 0) + count
+    return merged
+
+
+def popular_from_counts(counts: dict, top_n = 100) -> list:
+    """popular_based output from popularity counts, same ranking and ties as training."""
+    df_popular = pd.Series(counts, dtype = np.int64).sort_index().nlargest(top_n)
+    return [{'popular_data': df_popular.to_dict()}]
+
+
+def merge_delta_counts(base_popularity: dict, base_rows: dict, df: pd.DataFrame, top_n = 100) -> tuple:
+    """
+    Merge the counts of the new sessions in `df` into the stored counts and re-rank what changed.
+    The stored entries of a row are summed before the new ones, so its associates keep the order they
+    first co-occurred in over the whole history and ties rank as a full retrain ranks them.
+    :param base_popularity: Stored popularity counts of the timing.
+    :param base_rows: Stored (associates, counts) of (at least) the products of `df`, by product.
+    :return: Merged popularity counts, merged count rows of the products `df` touched, and the
+        popular and association documents of those products.
+    """
+    popularity = merge_counts(base_popularity, popularity_counts(df))
+    delta, delta_names = co_occurrence_matrix(df)
+    touched = np.flatnonzero(np.diff(delta.indptr))
+    delta = delta[touched]
+    products = delta_names[touched]
+    stored = [base_rows.get(product, ((), ())) for product in products.tolist()]
+
+    # Stored entries first, then the new ones, associates are numbered by first appearance
+    lengths = [len(associates) for associates, _ in stored]
+    stored_counts = np.array(list(chain.from_iterable(counts for _, counts in stored)))
+    associate_codes, associate_names = pd.factorize(np.concatenate((
+        np.array(list(chain.from_iterable(associates for associates, _ in stored)), dtype = object),
+        delta_names[delta.indices],
+    )))
+    rows = np.concatenate((np.repeat(np.arange(len(products)), lengths),
+                           np.repeat(np.arange(len(products)), np.diff(delta.indptr))))
+    values = np.concatenate((stored_counts if len(stored_counts) else stored_counts.astype(delta.dtype), delta.data))
+    merged = sum_entries(rows, associate_codes, values, (len(products), len(associate_names)))
+
+    associate_names = np.asarray(associate_names, dtype = object)
+    rows = association_count_rows(merged, products, associate_names)
+    association_json = association_documents(merged, products, top_n, associate_names)
+    return popularity, rows, popular_from_counts(popularity, top_n), association_json
+
+
+def train_timing_partition(timing: str, df: pd.DataFrame, top_n = 100) -> tuple:
+    """
+    Train both models on one timing partition, runs in a worker process during setup.
+    Also returns the raw counts the models are ranked from, incremental updates merge into them.
+    """
+    started = time.perf_counter()
+    popular_json = popular_based(df, top_n = top_n)
+    counts, product_names = co_occurrence_matrix(df)
+    association_json = association_documents(counts, product_names, top_n)
+    raw_counts = {'popularity': popularity_counts(df), 'associations': association_count_rows(counts, product_names)}
+    return timing, popular_json, association_json, time.perf_counter() - started, raw_counts
@@ -1,15 +1,17 @@
-import uvicorn
 from fastapi import FastAPI
 from routes.recommendation_route import router as recommendation_router
 from routes.user_route import router as user_router
 from routes.fixed_alaways_reco import router as fixed_router
+from routes.diagnostics_route import router as diagnostics_router
+from routes.metrics_route import router as metrics_router
 from loguru import logger
 from fastapi.middleware.cors import CORSMiddleware
 import fastapi
 from configs.manager import settings
 from middleware.exception import ExceptionHandlerMiddleware
+from middleware.timing import TimingMiddleware
 from configs.events import startup_event, shutdown_event
-from fastapi.middleware.gzip import GZipMiddleware
+from middleware.compression import GZipMiddleware
 
 
 def initialize_backend_application() -> fastapi.FastAPI:
@@ -30,9 +32,13 @@ def initialize_backend_application() -> fastapi.FastAPI:
         allow_headers=settings.ALLOWED_HEADERS,
     )
     app.add_middleware(ExceptionHandlerMiddleware)
+    # Outermost, so the error responses are timed too
+    app.add_middleware(TimingMiddleware, server_timing=settings.SERVER_TIMING_ENABLED)
     app.include_router(recommendation_router)
     app.include_router(user_router)
     app.include_router(fixed_router)
+    app.include_router(diagnostics_router)
+    app.include_router(metrics_router)
     return app
 
 
@@ -40,6 +46,8 @@ backend_app: fastapi.FastAPI = initialize_backend_application()
 
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run("main:backend_app", 
                 host = settings.SERVER_HOST, 
                 workers = settings.SERVER_WORKERS,
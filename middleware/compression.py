@@ -0,0 +1,78 @@
+import zlib
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Not worth compressing, already compressed or must not be buffered
+_SKIP_CONTENT_TYPES = ("text/event-stream", "image/", "video/", "audio/", "application/zip", "application/gzip")
+
+
+class GZipMiddleware:
+    """
+    Gzip for responses of at least `minimum_size` bytes, same output as Starlette's GZipMiddleware.
+    Decides from the response headers (Content-Length, Content-Type) or its first body chunk and
+    only then creates a compressor, so small responses pass straight through at no cost.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1000, compresslevel: int = 2):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compresslevel = compresslevel
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or "gzip" not in Headers(scope = scope).get("accept-encoding", ""):
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_with_gzip(message: Message):
+            nonlocal start_message, compressor, passthrough
+            message_type = message["type"]
+            if passthrough or message_type not in ("http.response.start", "http.response.body"):
+                await send(message)
+                return
+
+            if message_type == "http.response.start":
+                headers = Headers(raw = message["headers"])
+                length = headers.get("content-length")
+                if ("content-encoding" in headers
+                        or headers.get("content-type", "").startswith(_SKIP_CONTENT_TYPES)
+                        or (length is not None and int(length) < self.minimum_size)):
+                    passthrough = True
+                    await send(message)
+                else:
+                    # Wait for the first chunk to know the size of a response without Content-Length
+                    start_message = message
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                if len(body) < self.minimum_size and not more_body:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                # wbits 16 + MAX_WBITS: gzip container, like the gzip module
+                compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+                headers = MutableHeaders(raw = start_message["headers"])
+                headers["Content-Encoding"] = "gzip"
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del headers["Content-Length"]
+                    compressed = compressor.compress(body)
+                else:
+                    compressed = compressor.compress(body) + compressor.flush()
+                    headers["Content-Length"] = str(len(compressed))
+                await send(start_message)
+                await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+                return
+
+            compressed = compressor.compress(body)
+            if not more_body:
+                compressed += compressor.flush()
+            await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+        await self.app(scope, receive, send_with_gzip)
@@ -1,25 +1,47 @@
-
 from loguru import logger
-from fastapi import Request
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 import os
 
 API_KEY = os.getenv("API_KEY")
 
-class ExceptionHandlerMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
+class ExceptionHandlerMiddleware:
+    """
+    Turns an unhandled exception into a 500 with {'error', 'messages'}.
+    Plain ASGI: wraps `send` only, no extra task or body stream per request like BaseHTTPMiddleware.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        response_started = False
+
+        async def send_tracking_start(message: Message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
         try:
-            return await call_next(request)
+            await self.app(scope, receive, send_tracking_start)
         except Exception as e:
             logger.exception(e)
-            return JSONResponse(
+            if response_started:
+                # Too late for an error response, let the server close the connection
+                raise
+            response = JSONResponse(
                 status_code=500, 
                 content={
                     'error': e.__class__.__name__, 
                     'messages': e.args
                 }
             )
+            await response(scope, receive, send)
         
 
 
@@ -0,0 +1,40 @@
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from utils.metrics import latency_metrics
+
+
+class TimingMiddleware:
+    """
+    Times every HTTP request and the stage spans recorded while it runs, into the latency
+    histograms of /metrics. Optionally reports the spans to the client in a Server-Timing header.
+    Plain ASGI so the spans of the endpoint share its context.
+    """
+
+    def __init__(self, app: ASGIApp, server_timing: bool = True):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = latency_metrics.start_request()
+        status = 500
+
+        async def send_with_timing(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", timings.server_timing().encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            # The router stores the matched route in the scope, its path template keeps the label set bounded
+            route = scope.get("route")
+            endpoint = getattr(route, "path", None) or "unmatched"
+            latency_metrics.finish_request(timings, scope["method"], endpoint, status)
@@ -1,5 +1,5 @@
 from odmantic import Model
-from typing import Dict
+from typing import Dict, Optional
 
 class User(Model):
     username: str
@@ -41,7 +41,10 @@ class OtherPopular(Model):
     
 class BreakfastAssociation(Model):
     product: str
-    associate_products: Dict[str, int]
+    # Compact documents (repos.association_store), associate_products in versions stored before
+    associate_ids: Optional[bytes] = None
+    weights: Optional[bytes] = None
+    associate_products: Optional[Dict[str, int]] = None
 
     model_config = {
         "collection": "breakfast_association_collection"
@@ -49,7 +52,10 @@ class BreakfastAssociation(Model):
 
 class LunchAssociation(Model):
     product: str
-    associate_products: Dict[str, int]
+    # Compact documents (repos.association_store), associate_products in versions stored before
+    associate_ids: Optional[bytes] = None
+    weights: Optional[bytes] = None
+    associate_products: Optional[Dict[str, int]] = None
 
     model_config = {
         "collection": "lunch_association_collection"
@@ -57,7 +63,10 @@ class LunchAssociation(Model):
 
 class DinnerAssociation(Model):
     product: str
-    associate_products: Dict[str, int]
+    # Compact documents (repos.association_store), associate_products in versions stored before
+    associate_ids: Optional[bytes] = None
+    weights: Optional[bytes] = None
+    associate_products: Optional[Dict[str, int]] = None
 
     model_config = {
         "collection": "dinner_association_collection"
@@ -65,8 +74,56 @@ class DinnerAssociation(Model):
 
 class OtherAssociation(Model):
     product: str
-    associate_products: Dict[str, int]
+    # Compact documents (repos.association_store), associate_products in versions stored before
+    associate_ids: Optional[bytes] = None
+    weights: Optional[bytes] = None
+    associate_products: Optional[Dict[str, int]] = None
 
     model_config = {
         "collection": "other_association_collection"
-    }
\ No newline at end of file
+    }
+
+class Category(Model):
+    product: str
+    category: str
+    subcategory: str
+    timing: str
+
+    model_config = {
+        "collection": "category_collection"
+    }
+
+class ProductVocabulary(Model):
+    # Product names by id of the compact association documents of a model version, in chunks
+    chunk: int
+    names: list[str]
+
+    model_config = {
+        "collection": "product_vocabulary"
+    }
+
+class ProductLookup(Model):
+    # Name -> UPC or UPC -> name map of a model version, as parallel key and value lists in chunks
+    lookup: str
+    chunk: int
+    keys: list[str]
+    values: list[str]
+
+    model_config = {
+        "collection": "product_lookup"
+    }
+
+# Trained model documents per timing partition
+POPULAR_MODELS = {
+    'Breakfast': BreakfastPopular,
+    'Lunch': LunchPopular,
+    'Dinner': DinnerPopular,
+    'Other': OtherPopular,
+}
+
+ASSOCIATION_MODELS = {
+    'Breakfast': BreakfastAssociation,
+    'Lunch': LunchAssociation,
+    'Dinner': DinnerAssociation,
+    'Other': OtherAssociation,
+}
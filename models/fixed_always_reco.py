@@ -10,12 +10,16 @@ class ProductType(str, Enum):
 # === Model ===
 class FixedProduct(Model):
     products: List[Dict]
+    # None for the default store, documents stored before stores existed have no store_id
+    store_id: Optional[str] = None
     created_at: datetime = datetime.utcnow()
     updated_at: Optional[datetime] = None
     updated_by: Optional[str] = None
 
 class AlwaysRecommendProduct(Model):
     products: List[Dict]
+    # None for the default store, documents stored before stores existed have no store_id
+    store_id: Optional[str] = None
     created_at: datetime = datetime.utcnow()
     updated_at: Optional[datetime] = None
     updated_by: Optional[str] = None
@@ -1,9 +1,10 @@
+import csv
 from collections import defaultdict
-import pandas as pd
 from configs.constant import EXCLUDE_SUBCATEGORIES, STRICT_CATEGORY_RULES, MONO_CATEGORIES, CROSS_CATEGORIES, TIME_SLOTS, MAX_SUBCATEGORY_LIMIT, CATEGORY_DATA_PATH
 
-# Read Categories
-df_categories = pd.read_csv(CATEGORY_DATA_PATH)
+# Fields pandas.read_csv reads as NaN, kept as "nan" like str(NaN) did
+_NA_VALUES = {'', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+              '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'}
 
 class Product:
     def __init__(self, name = None, category = None, subcategory = None, timing = None):
@@ -12,15 +13,32 @@ class Product:
         self.subcategory = subcategory
         self.timing = timing
 
-categories_dct = defaultdict(Product)
 
-for idx, row in df_categories.iterrows():
-    p_n = str(row['Product_name']).strip().lower()
-    cat = str(row['Category']).strip().lower()
-    scat = str(row['Subcategory']).strip().lower()
-    tim = str(row['Timing']).strip().lower()
+def _clean(value) -> str:
+    return "nan" if value is None or value in _NA_VALUES else str(value).strip().lower()
+
+
+def load_categories(path: str = CATEGORY_DATA_PATH) -> defaultdict:
+    """
+    Read Categories: product name -> Product. Parsed with the csv module, so serving
+    never imports pandas.
+    """
+    categories = defaultdict(Product)
+    with open(path, newline = "", encoding = "utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            p_n = _clean(row.get('Product_name'))
+            categories[p_n] = Product(p_n, _clean(row.get('Category')), _clean(row.get('Subcategory')), _clean(row.get('Timing')))
+    return categories
+
+
+def __getattr__(name: str):
+    # Module attributes of the eager version, now the catalog of the published models
+    if name in ("categories_dct", "compiled_rules"):
+        from repos.category_catalog import category_catalog
+        snapshot = category_catalog.snapshot()
+        return snapshot.categories if name == "categories_dct" else snapshot.rules
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-    categories_dct[p_n] = Product(p_n, cat, scat, tim)
 
 class Aggregation:
     def __init__(self, reco_list, cart_items, categories, current_hour,
@@ -126,6 +144,100 @@ class Aggregation:
         return self.reco_list
     
 
+class CompiledRules:
+    """
+    Aggregation rules compiled once per catalog: categories and subcategories become integer ids,
+    rule lists become frozensets of ids, so filtering a candidate is a few set lookups.
+    """
+
+    def __init__(self, categories,
+                 excluded_subcategories = EXCLUDE_SUBCATEGORIES,
+                 strict_category_rules = STRICT_CATEGORY_RULES,
+                 mono_subcategories = MONO_CATEGORIES,
+                 cross_subcategories = CROSS_CATEGORIES,
+                 max_subcategory_limit = MAX_SUBCATEGORY_LIMIT):
+        # Id 0 is the missing attribute of products that are not in the catalog
+        self.category_ids = {None: 0}
+        self.subcategory_ids = {None: 0}
+        self.unknown = (0, 0)
+        self.products = {
+            name: (self.category_ids.setdefault(product.category, len(self.category_ids)),
+                   self.subcategory_ids.setdefault(product.subcategory, len(self.subcategory_ids)))
+            for name, product in list(categories.items())
+        }
+        self.max_subcategory_limit = max_subcategory_limit
+
+        # Rule values that no product carries can never match, they are simply left out
+        self.excluded = self._subcategory_set(excluded_subcategories)
+        self.mono = self._subcategory_set(mono_subcategories)
+        self.strict = {
+            self.category_ids[category]: frozenset(self.category_ids[c] for c in conflicts if c in self.category_ids)
+            for category, conflicts in strict_category_rules.items() if category in self.category_ids
+        }
+        self.cross = {
+            self.subcategory_ids[subcategory]: self._subcategory_set(associated)
+            for subcategory, associated in cross_subcategories.items() if subcategory in self.subcategory_ids
+        }
+
+    def _subcategory_set(self, subcategories) -> frozenset:
+        return frozenset(self.subcategory_ids[s] for s in subcategories if s in self.subcategory_ids)
+
+    def filter(self, reco_list: list, cart_items: list) -> list:
+        """Same result and order as Aggregation.get_final_recommendations, in one pass over the candidates."""
+        products, unknown = self.products, self.unknown
+        cart_set = set(cart_items)
+        blocked_subcategories = self.excluded
+        conflicting_categories = frozenset()
+        prioritized_subcategories = frozenset()
+
+        if cart_items:
+            cart_attrs = [products.get(p.strip(), unknown) for p in cart_items]
+            # Same mono subcategory as the cart, conflicting categories, cross-sell of the last item
+            blocked_subcategories = blocked_subcategories | {s for _, s in cart_attrs if s in self.mono}
+            conflicting_categories = frozenset().union(*(self.strict.get(c, ()) for c, _ in cart_attrs))
+            prioritized_subcategories = self.cross.get(cart_attrs[-1][1], frozenset())
+
+        prioritized, rest = [], []
+        for p in reco_list:
+            if p in cart_set:
+                continue
+            # Catalog names are stripped, so an exact hit saves the strip
+            attrs = products.get(p)
+            category, subcategory = attrs if attrs is not None else products.get(p.strip(), unknown)
+            if subcategory in blocked_subcategories or category in conflicting_categories:
+                continue
+            (prioritized if subcategory in prioritized_subcategories else rest).append((p, subcategory))
+
+        # Short names still take their subcategory slot, they are dropped after the limit like before
+        limit = self.max_subcategory_limit
+        subcategory_count = {}
+        final = []
+        for candidates in (prioritized, rest):
+            for p, subcategory in candidates:
+                count = subcategory_count.get(subcategory, 0)
+                if count < limit:
+                    subcategory_count[subcategory] = count + 1
+                    if len(p) > 1:
+                        final.append(p)
+        return final
+
+
+class CompiledAggregation:
+    """Drop-in replacement for Aggregation backed by CompiledRules."""
+
+    def __init__(self, reco_list, cart_items, rules: CompiledRules, current_hour):
+        self.reco_list = reco_list
+        self.cart_items = cart_items
+        self.rules = rules
+        self.current_hour = current_hour
+
+    def get_final_recommendations(self):
+        """Execute all filtering and return the final list of recommended products."""
+        self.reco_list = self.rules.filter(self.reco_list, self.cart_items)
+        return self.reco_list
+
+
+
 def enrich_with_upc(items: list[str], name_to_upc_map: dict) -> list[dict]:
     return [
         {
@@ -1,13 +1,21 @@
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, Field
+from typing import List, Optional
 from bson import ObjectId
 from typing import Any
+from configs.constant import STORE_ID_PATTERN
 
 
 class RecommendationRequestBody(BaseModel):
     cartItems: List = ['4011002']
     currentHour: int = 17
     topN: int = 2
+    # Store trained with the same storeId on /setup, the default store when None
+    storeId: Optional[str] = Field(None, pattern = STORE_ID_PATTERN)
+
+class BatchRecommendationRequestBody(BaseModel):
+    # Validated one by one, so an invalid cart only fails its own entry
+    items: List[dict]
+    storeId: Optional[str] = Field(None, pattern = STORE_ID_PATTERN)
     
 class UserBase(BaseModel):
     username: str
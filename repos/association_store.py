@@ -0,0 +1,114 @@
+import asyncio
+import sys
+from array import array
+from odmantic import AIOEngine
+from models.db import ProductVocabulary
+from repos.model_versions import model_collection
+
+# Names per vocabulary document, far below the 16 MB document limit
+VOCABULARY_CHUNK_SIZE = 50_000
+# Fields of an association document needed to serve it, compact or not
+ASSOCIATION_PROJECTION = {"_id": 0, "product": 1, "associate_ids": 1, "weights": 1, "associate_products": 1}
+
+
+class VocabularyBuilder:
+    """Product names of a model version numbered in order of first use, an id never changes once given."""
+
+    def __init__(self, names = ()):
+        self.names = list(names)
+        self.ids = {name: i for i, name in enumerate(self.names)}
+
+    def id_of(self, name: str) -> int:
+        i = self.ids.get(name)
+        if i is None:
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return i
+
+
+def _to_bytes(values: array) -> bytes:
+    # Stored little-endian whatever the host
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(raw: bytes, typecode: str) -> list:
+    values = array(typecode)
+    values.frombytes(raw)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tolist()
+
+
+def pack_association(doc: dict, vocabulary: VocabularyBuilder) -> dict:
+    """
+    Compact form of a trained association document: the associates as int32 vocabulary ids and
+    their weights as int32 (int64 when a count does not fit), two parallel byte strings.
+    """
+    associates = doc["associate_products"]
+    ids = array("i", [vocabulary.id_of(name) for name in associates])
+    try:
+        weights = array("i", associates.values())
+    except OverflowError:
+        weights = array("q", associates.values())
+    return {"product": doc["product"], "associate_ids": _to_bytes(ids), "weights": _to_bytes(weights)}
+
+
+def unpack_association(doc: dict, names: list) -> tuple[list, list]:
+    """(associate names, weights) of an association document, compact or in the former {name: weight} form."""
+    if "associate_ids" not in doc:
+        associates = doc["associate_products"]
+        return list(associates), list(associates.values())
+    raw_ids, raw_weights = doc["associate_ids"], doc["weights"]
+    # The width of the weights follows from their length
+    weights = _from_bytes(raw_weights, "i" if len(raw_weights) == len(raw_ids) else "q")
+    return [names[i] for i in _from_bytes(raw_ids, "i")], weights
+
+
+async def store_vocabulary(engine: AIOEngine, version: int, names: list, chunk_size: int = VOCABULARY_CHUNK_SIZE, store: str | None = None):
+    collection = model_collection(engine, ProductVocabulary, version, store)
+    await collection.delete_many({})
+    for i, start in enumerate(range(0, len(names), chunk_size)):
+        await collection.insert_one({"chunk": i, "names": names[start:start + chunk_size]})
+
+
+async def load_vocabulary(engine: AIOEngine, version: int, store: str | None = None) -> list:
+    """Product names of `version` by id, interned. Empty for versions stored before the compact format."""
+    docs = await model_collection(engine, ProductVocabulary, version, store).find({}, {"_id": 0, "chunk": 1, "names": 1}).to_list(None)
+    docs.sort(key = lambda doc: doc["chunk"])
+    return [sys.intern(name) for doc in docs for name in doc["names"]]
+
+
+class VocabularyCache:
+    """Vocabularies of the model versions this worker reads. A published version never changes, each is loaded once."""
+
+    def __init__(self, keep: int = 2):
+        self.keep = keep
+        self._names = {}
+        self._lock = asyncio.Lock()
+        self.loads = 0
+
+    async def get(self, engine: AIOEngine, version: int, store: str | None = None) -> list:
+        key = (store, version)
+        names = self._names.get(key)
+        if names is None:
+            async with self._lock:
+                names = self._names.get(key)
+                if names is None:
+                    names = self._names[key] = await load_vocabulary(engine, version, store)
+                    self.loads += 1
+                    # The live version of the store and the one before, for requests still on it
+                    versions = [cached for cached in self._names if cached[0] == store]
+                    for cached in versions[:-self.keep]:
+                        del self._names[cached]
+        return names
+
+    def drop(self, store: str | None):
+        """Forget the vocabularies of `store`, once it is evicted from this worker."""
+        for cached in [cached for cached in self._names if cached[0] == store]:
+            del self._names[cached]
+
+
+vocabulary_cache = VocabularyCache()
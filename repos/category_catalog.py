@@ -0,0 +1,88 @@
+import asyncio
+import time
+from collections import defaultdict
+from loguru import logger
+from odmantic import AIOEngine
+from configs.constant import CATEGORY_DATA_PATH
+from models.db import Category
+from models.hepler import CompiledRules, Product, load_categories
+from repos.model_versions import get_model_version, model_collection
+from utils.stores import store_file
+
+
+class CategorySnapshot:
+    """Immutable view of one category catalog and the aggregation rules compiled from it."""
+
+    __slots__ = ("version", "source", "categories", "rules", "loaded_at")
+
+    def __init__(self, version: int | None, source: str, categories: defaultdict):
+        self.version = version
+        self.source = source
+        self.categories = categories
+        self.rules = CompiledRules(categories)
+        self.loaded_at = time.time()
+
+
+def categories_from_documents(docs: list[dict]) -> defaultdict:
+    categories = defaultdict(Product)
+    for doc in docs:
+        categories[doc["product"]] = Product(doc["product"], doc["category"], doc["subcategory"], doc["timing"])
+    return categories
+
+
+class CategoryCatalogStore:
+    """
+    Category catalog of the published model version of a store for this worker. /setup stores the catalog
+    next to the models it trained, so both switch together; the snapshot is swapped as a whole
+    when the version changes and a request keeps the one it started with.
+    Versions published before the catalog was versioned fall back to the stored Categories upload.
+    """
+
+    def __init__(self, store: str | None = None):
+        self.store = store
+        self.path = store_file(CATEGORY_DATA_PATH, store)
+        self.current: CategorySnapshot | None = None
+        self._lock = asyncio.Lock()
+        self.reloads = 0
+
+    def _from_file(self, version: int | None) -> CategorySnapshot:
+        return CategorySnapshot(version, "file", load_categories(self.path))
+
+    async def _load(self, engine: AIOEngine, version: int) -> CategorySnapshot:
+        docs = await model_collection(engine, Category, version, self.store).find({}, {"_id": 0}).to_list(None)
+        if docs:
+            return await asyncio.to_thread(CategorySnapshot, version, "database", categories_from_documents(docs))
+        logger.warning(f"No category catalog stored with model v{version}, reading {self.path}")
+        return await asyncio.to_thread(self._from_file, version)
+
+    async def refresh(self, engine: AIOEngine, force: bool = False) -> CategorySnapshot:
+        async with self._lock:
+            version = await get_model_version(engine, self.store)
+            if force or self.current is None or self.current.version != version:
+                started = time.perf_counter()
+                # A single reference assignment, requests see either the old or the new catalog
+                self.current = await self._load(engine, version)
+                self.reloads += 1
+                logger.info(f"Category catalog v{version} ({self.current.source}) loaded in {time.perf_counter() - started:.2f}s")
+            return self.current
+
+    def snapshot(self) -> CategorySnapshot:
+        """The current catalog, read from the stored upload if none was loaded yet (e.g. database down at startup)."""
+        snapshot = self.current
+        if snapshot is None:
+            snapshot = self.current = self._from_file(None)
+        return snapshot
+
+    def stats(self) -> dict:
+        snapshot = self.current
+        return {
+            "version": snapshot.version if snapshot else None,
+            "source": snapshot.source if snapshot else None,
+            "loadedAt": snapshot.loaded_at if snapshot else None,
+            "products": len(snapshot.categories) if snapshot else 0,
+            "reloads": self.reloads,
+        }
+
+
+# Default store, the stores' own are created by repos.store_registry
+category_catalog = CategoryCatalogStore()
@@ -1,16 +1,24 @@
 from io import BytesIO
 import random
 from fastapi import HTTPException, UploadFile
-import pandas as pd
-from typing import List, Set
-from models.fixed_always_reco import AlwaysRecommendProduct, FixedProduct
+from odmantic import AIOEngine
+from typing import TYPE_CHECKING, List, Set
+from models.fixed_always_reco import AlwaysRecommendProduct, FixedProduct, ProductType
+from utils.config_bus import PRODUCTS_CHANNEL, config_bus
 from utils.error_codes import UPLOAD_ERRORS
+from utils.single_flight import single_flight
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 REQUIRED_COLUMNS = ["UPC", "Product Name"]
 
 
-async def parse_upload(file: UploadFile) -> pd.DataFrame:
+async def parse_upload(file: UploadFile) -> "pd.DataFrame":
+    # Only product list uploads need pandas, not the serving path
+    import pandas as pd
+
     contents = await file.read()
     if file.filename.endswith(".csv"):
         df = pd.read_csv(BytesIO(contents))
@@ -20,7 +28,52 @@ async def parse_upload(file: UploadFile) -> pd.DataFrame:
         raise HTTPException(status_code=400, detail=UPLOAD_ERRORS["INVALID_FILE_TYPE"])
     return df
 
-async def validate_df(df: pd.DataFrame):
+class ProductListCache:
+    """
+    Fixed and Always product lists of every store this worker served. Loaded once from Mongo and
+    dropped when the products channel of the store moves, i.e. after an upload or reset on any worker.
+    """
+
+    MODELS = {ProductType.fixed: FixedProduct, ProductType.always: AlwaysRecommendProduct}
+
+    def __init__(self):
+        self._products = {}
+        self._generation = 0
+        self.loads = 0
+
+    async def get(self, db: AIOEngine, product_type: ProductType, store: str | None = None) -> List[dict]:
+        key = (store, product_type)
+        products = self._products.get(key)
+        if products is None:
+            generation = self._generation
+            model = self.MODELS[product_type]
+            # Requests missing the same list at once wait for one read
+            config = await single_flight.do("product_list", (key, generation), db.find_one, model, model.store_id == store)
+            products = config.products if config else []
+            self.loads += 1
+            # An invalidation that happened during the read wins, the next request reloads
+            if generation == self._generation:
+                self._products[key] = products
+        return products
+
+    def invalidate(self, engine = None, version = None, store: str | None = None):
+        self._generation += 1
+        self._products = {key: products for key, products in self._products.items() if key[0] != store}
+
+    def stats(self) -> dict:
+        return {
+            "cached": {f"{product_type.value}@{store}" if store else product_type.value: len(products)
+                       for (store, product_type), products in self._products.items()},
+            "loads": self.loads,
+            "generation": self._generation,
+        }
+
+
+product_list_cache = ProductListCache()
+config_bus.subscribe(PRODUCTS_CHANNEL, product_list_cache.invalidate)
+
+
+async def validate_df(df: "pd.DataFrame"):
     missing = set(REQUIRED_COLUMNS) - set(df.columns)
     if missing:
         err = UPLOAD_ERRORS["MISSING_COLUMNS"]
@@ -0,0 +1,31 @@
+from odmantic import AIOEngine
+from models.db import ProductLookup
+from repos.model_versions import model_collection
+
+# Entries per lookup document, far below the 16 MB document limit
+LOOKUP_CHUNK_SIZE = 50_000
+LOOKUP_NAMES = ("name_to_upc", "upc_to_name")
+
+
+async def store_lookup_maps(engine: AIOEngine, version: int, name_to_upc_map: dict, upc_to_name_map: dict,
+                            chunk_size: int = LOOKUP_CHUNK_SIZE, store: str | None = None):
+    """Store the lookup maps with `version` of `store`, so every host can serve and rebuild them."""
+    collection = model_collection(engine, ProductLookup, version, store)
+    await collection.delete_many({})
+    for lookup, mapping in zip(LOOKUP_NAMES, (name_to_upc_map, upc_to_name_map)):
+        keys, values = list(mapping), list(mapping.values())
+        # An empty map still gets its document, a version with lookups always has both
+        for i, start in enumerate(range(0, max(len(keys), 1), chunk_size)):
+            await collection.insert_one({"lookup": lookup, "chunk": i, "keys": keys[start:start + chunk_size], "values": values[start:start + chunk_size]})
+
+
+async def load_lookup_maps(engine: AIOEngine, version: int, store: str | None = None) -> tuple[dict, dict] | None:
+    """Name -> UPC and UPC -> name maps of `version` of `store`, None for versions published before they were stored."""
+    docs = await model_collection(engine, ProductLookup, version, store).find({}, {"_id": 0}).to_list(None)
+    if not docs:
+        return None
+    docs.sort(key = lambda doc: doc["chunk"])
+    maps = {lookup: {} for lookup in LOOKUP_NAMES}
+    for doc in docs:
+        maps[doc["lookup"]].update(zip(doc["keys"], doc["values"]))
+    return maps["name_to_upc"], maps["upc_to_name"]
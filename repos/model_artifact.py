@@ -0,0 +1,241 @@
+import glob
+import json
+import mmap
+import os
+import re
+import struct
+import time
+from bisect import bisect_left
+from collections.abc import Mapping
+import numpy as np
+from utils.ranking import merge_association_scores
+
+ARTIFACT_DIR = "model_artifacts"
+# Bumped when the layout changes, older files are ignored and the index is loaded from the database
+MAGIC = b"RECOMAP2"
+_HEADER = struct.Struct("<8sQ")
+_ALIGN = 8
+_ARTIFACT_NAME = re.compile(r"^model_v(?P<version>\d+)\.bin$")
+
+
+def artifact_path(version: int, artifact_dir: str = ARTIFACT_DIR) -> str:
+    return os.path.join(artifact_dir, f"model_v{version}.bin")
+
+
+class StringTable:
+    """Sorted, deduplicated strings stored as one UTF-8 blob plus offsets, so an id orders like its string."""
+
+    def __init__(self, buffer, offsets: np.ndarray, base: int = 0):
+        # Offsets stay in the shared mapping (a memoryview indexes without numpy scalars),
+        # `base` is where the blob starts in `buffer`
+        self._buffer = buffer
+        self._offsets = memoryview(offsets).cast("B").cast("q")
+        self._base = base
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        base = self._base
+        return self._buffer[base + self._offsets[i]:base + self._offsets[i + 1]].decode()
+
+    def id_of(self, value: str) -> int:
+        """Id of `value`, -1 when it is not in the table."""
+        i = bisect_left(self, value)
+        return i if i < len(self) and self[i] == value else -1
+
+
+class ArtifactMap(Mapping):
+    """Read-only str -> str mapping over two parallel id arrays, keys sorted."""
+
+    def __init__(self, strings: StringTable, keys: np.ndarray, values: np.ndarray):
+        self._strings = strings
+        self._keys = keys
+        self._values = values
+
+    def _position(self, key) -> int:
+        key_id = self._strings.id_of(key) if isinstance(key, str) else -1
+        if key_id < 0:
+            return -1
+        i = int(np.searchsorted(self._keys, key_id))
+        return i if i < len(self._keys) and self._keys[i] == key_id else -1
+
+    def __getitem__(self, key) -> str:
+        i = self._position(key)
+        if i < 0:
+            raise KeyError(key)
+        return self._strings[self._values[i]]
+
+    def get(self, key, default = None):
+        i = self._position(key)
+        return self._strings[self._values[i]] if i >= 0 else default
+
+    def __contains__(self, key) -> bool:
+        return self._position(key) >= 0
+
+    def __iter__(self):
+        return (self._strings[key_id] for key_id in self._keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def to_dict(self) -> dict:
+        """Plain dict copy, every string decoded once. Hashed lookups, where the map bisects the string table."""
+        strings = self._strings
+        return dict(zip(map(strings.__getitem__, self._keys.tolist()), map(strings.__getitem__, self._values.tolist())))
+
+
+def write_model_artifact(path: str, index, name_to_upc_map: dict, upc_to_name_map: dict) -> int:
+    """
+    Write a ModelIndex and its lookup maps as one binary file meant to be mmapped read-only
+    by every worker:
+    - a sorted string table (UTF-8 blob + offsets) holding every name and UPC,
+    - the lookup maps as sorted key ids with their value ids,
+    - per timing the popular ids and the associations in CSR form (sorted product ids, indptr,
+      indices and their weights).
+    :return: Size of the file in bytes.
+    """
+    strings = set(name_to_upc_map) | set(name_to_upc_map.values()) | set(upc_to_name_map) | set(upc_to_name_map.values())
+    for timing in index.timings.values():
+        strings.update(timing.popular)
+        strings.update(timing.associations)
+        for associates, _ in timing.associations.values():
+            strings.update(associates)
+    strings = sorted(strings)
+    ids = {value: i for i, value in enumerate(strings)}
+
+    encoded = [value.encode() for value in strings]
+    arrays = {
+        "strings.offsets": np.concatenate(([0], np.cumsum([len(raw) for raw in encoded], dtype = np.int64))).astype(np.int64),
+        "strings.blob": np.frombuffer(b"".join(encoded), dtype = np.uint8),
+    }
+    for name, mapping in (("name_to_upc", name_to_upc_map), ("upc_to_name", upc_to_name_map)):
+        keys = sorted(mapping, key = ids.__getitem__)
+        arrays[f"{name}.keys"] = np.array([ids[key] for key in keys], dtype = np.int32)
+        arrays[f"{name}.values"] = np.array([ids[mapping[key]] for key in keys], dtype = np.int32)
+
+    for timing_name, timing in index.timings.items():
+        products = sorted(timing.associations, key = ids.__getitem__)
+        lengths = [len(timing.associations[product][0]) for product in products]
+        arrays[f"{timing_name}.popular"] = np.array([ids[name] for name in timing.popular], dtype = np.int32)
+        arrays[f"{timing_name}.products"] = np.array([ids[product] for product in products], dtype = np.int32)
+        arrays[f"{timing_name}.indptr"] = np.concatenate(([0], np.cumsum(lengths, dtype = np.int64))).astype(np.int64)
+        arrays[f"{timing_name}.indices"] = np.array(
+            [ids[name] for product in products for name in timing.associations[product][0]], dtype = np.int32)
+        arrays[f"{timing_name}.weights"] = np.array(
+            [weight for product in products for weight in timing.associations[product][1]], dtype = np.float64)
+
+    # Layout: magic, header length, JSON header, then every array 8-byte aligned
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        layout[name] = {"offset": offset, "dtype": array.dtype.str, "count": len(array)}
+        offset += -(-array.nbytes // _ALIGN) * _ALIGN
+    header = json.dumps({
+        "version": index.version,
+        "timings": list(index.timings),
+        "created_at": time.time(),
+        "arrays": layout,
+    }).encode()
+    data_start = -(-(_HEADER.size + len(header)) // _ALIGN) * _ALIGN
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok = True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+    # Workers that mapped the previous file keep reading it, new opens see the new one
+    os.replace(tmp_path, path)
+    return data_start + offset
+
+
+class ModelArtifact:
+    """
+    A model artifact mapped read-only. The pages live in the OS page cache, so every worker of
+    the host shares one physical copy and opening it parses nothing but the header.
+    Serves the same popular/associations interface as ModelIndex.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        magic, header_len = _HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a model artifact.")
+        header = json.loads(self._map[_HEADER.size:_HEADER.size + header_len])
+        data_start = -(-(_HEADER.size + header_len) // _ALIGN) * _ALIGN
+
+        self.path = path
+        self.version = header["version"]
+        self.created_at = header["created_at"]
+        self.loaded_at = time.time()
+        self._arrays = {
+            name: np.frombuffer(self._map, dtype = spec["dtype"], count = spec["count"], offset = data_start + spec["offset"])
+            for name, spec in header["arrays"].items()
+        }
+        blob_start = data_start + header["arrays"]["strings.blob"]["offset"]
+        self.strings = StringTable(self._map, self._arrays["strings.offsets"], blob_start)
+        self.name_to_upc = ArtifactMap(self.strings, self._arrays["name_to_upc.keys"], self._arrays["name_to_upc.values"])
+        self.upc_to_name = ArtifactMap(self.strings, self._arrays["upc_to_name.keys"], self._arrays["upc_to_name.values"])
+        self.timings = header["timings"]
+
+    def popular(self, timing: str, top_n: int) -> list:
+        strings = self.strings
+        return [strings[i] for i in self._arrays[f"{timing}.popular"][:top_n].tolist()]
+
+    def associations(self, timing: str, cart_items: list, top_n: int, normalize: bool = False) -> list:
+        # Same merge as ModelIndex.associations, on string ids: only the selected ones are decoded
+        strings = self.strings
+        products = self._arrays[f"{timing}.products"]
+        indptr = self._arrays[f"{timing}.indptr"]
+        indices = self._arrays[f"{timing}.indices"]
+        weights = self._arrays[f"{timing}.weights"]
+        sources = []
+        for product in dict.fromkeys(cart_items):
+            product_id = strings.id_of(product)
+            if product_id < 0:
+                continue
+            i = int(np.searchsorted(products, product_id))
+            if i < len(products) and products[i] == product_id:
+                start, end = int(indptr[i]), int(indptr[i + 1])
+                sources.append((indices[start:end].tolist(), weights[start:end].tolist()))
+        return [strings[i] for i in merge_association_scores(sources, top_n, normalize)]
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "path": self.path,
+            "bytes": len(self._map),
+            "strings": len(self.strings),
+            "createdAt": self.created_at,
+            "loadedAt": self.loaded_at,
+            "timings": {
+                timing: {"popular": len(self._arrays[f"{timing}.popular"]), "associations": len(self._arrays[f"{timing}.products"])}
+                for timing in self.timings
+            },
+        }
+
+
+def open_model_artifact(version: int, artifact_dir: str = ARTIFACT_DIR) -> ModelArtifact | None:
+    """Map the artifact of `version`, None when this host has none (e.g. trained on another node) or an outdated one."""
+    path = artifact_path(version, artifact_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            return None
+    return ModelArtifact(path)
+
+
+def drop_model_artifacts(keep: set[int], artifact_dir: str = ARTIFACT_DIR) -> list[str]:
+    """Delete the artifacts of every version not in `keep`. Mapped copies stay readable until unmapped."""
+    dropped = []
+    for path in glob.glob(os.path.join(artifact_dir, "model_v*.bin")):
+        match = _ARTIFACT_NAME.match(os.path.basename(path))
+        if match and int(match["version"]) not in keep:
+            os.remove(path)
+            dropped.append(path)
+    return dropped
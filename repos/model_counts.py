@@ -0,0 +1,65 @@
+from odmantic import AIOEngine
+from pymongo import ReplaceOne
+from initialize.helper import INSERT_CHUNK_SIZE
+from repos.model_versions import MODEL_VERSION_COLLECTION
+from utils.stores import store_collection, store_key
+
+# Raw counts the trained models are ranked from, one popularity document per timing and
+# one co-occurrence row per (timing, product), per store. Not versioned, a pointer records
+# the model version they produced.
+POPULARITY_COUNTS_COLLECTION = "popularity_counts"
+ASSOCIATION_COUNTS_COLLECTION = "association_counts"
+COUNTS_ID = "counts"
+
+
+def _counts(engine: AIOEngine, name: str, store: str | None):
+    return engine.database[store_collection(name, store)]
+
+
+async def get_counts_version(engine: AIOEngine, store: str | None = None) -> int | None:
+    """Model version the stored counts produced, None when they are missing or half written."""
+    doc = await engine.database[MODEL_VERSION_COLLECTION].find_one({"_id": store_key(COUNTS_ID, store)}, {"version": 1})
+    return doc["version"] if doc else None
+
+
+async def set_counts_version(engine: AIOEngine, version: int | None, store: str | None = None):
+    """Cleared before the counts are written, set once they match a published version."""
+    await engine.database[MODEL_VERSION_COLLECTION].update_one({"_id": store_key(COUNTS_ID, store)}, {"$set": {"version": version}}, upsert = True)
+
+
+async def create_counts_indexes(engine: AIOEngine, store: str | None = None):
+    await _counts(engine, ASSOCIATION_COUNTS_COLLECTION, store).create_index([("timing", 1), ("product", 1)], unique = True, name = "timing_product_unique")
+
+
+async def replace_timing_counts(engine: AIOEngine, timing: str, popularity: dict, rows: list, chunk_size = INSERT_CHUNK_SIZE, store: str | None = None):
+    """Replace every count of a timing, after a full training."""
+    await _counts(engine, POPULARITY_COUNTS_COLLECTION, store).replace_one(
+        {"_id": timing}, {"_id": timing, "products": list(popularity), "counts": list(popularity.values())}, upsert = True)
+    associations = _counts(engine, ASSOCIATION_COUNTS_COLLECTION, store)
+    await associations.delete_many({"timing": timing})
+    for start in range(0, len(rows), chunk_size):
+        await associations.insert_many([{"timing": timing, **row} for row in rows[start:start + chunk_size]], ordered = False)
+
+
+async def update_timing_counts(engine: AIOEngine, timing: str, popularity: dict, rows: list, chunk_size = INSERT_CHUNK_SIZE, store: str | None = None):
+    """Write the merged counts of the products a delta touched."""
+    await _counts(engine, POPULARITY_COUNTS_COLLECTION, store).replace_one(
+        {"_id": timing}, {"_id": timing, "products": list(popularity), "counts": list(popularity.values())}, upsert = True)
+    associations = _counts(engine, ASSOCIATION_COUNTS_COLLECTION, store)
+    for start in range(0, len(rows), chunk_size):
+        await associations.bulk_write([
+            ReplaceOne({"timing": timing, "product": row["product"]}, {"timing": timing, **row}, upsert = True)
+            for row in rows[start:start + chunk_size]
+        ], ordered = False)
+
+
+async def load_popularity_counts(engine: AIOEngine, timing: str, store: str | None = None) -> dict:
+    doc = await _counts(engine, POPULARITY_COUNTS_COLLECTION, store).find_one({"_id": timing})
+    return dict(zip(doc["products"], doc["counts"])) if doc else {}
+
+
+async def load_association_counts(engine: AIOEngine, timing: str, products: list, store: str | None = None) -> dict:
+    """(associates, counts) of `products`, one $in query."""
+    cursor = _counts(engine, ASSOCIATION_COUNTS_COLLECTION, store).find(
+        {"timing": timing, "product": {"$in": products}}, {"_id": 0, "product": 1, "associates": 1, "counts": 1})
+    return {doc["product"]: (doc["associates"], doc["counts"]) async for doc in cursor}
@@ -0,0 +1,177 @@
+import asyncio
+import sys
+import time
+from loguru import logger
+from odmantic import AIOEngine
+from configs.constant import TIMINGS
+from configs.manager import settings
+from models.db import POPULAR_MODELS, ASSOCIATION_MODELS
+from repos.association_store import ASSOCIATION_PROJECTION, unpack_association, vocabulary_cache
+from repos.lookup_maps import load_lookup_maps
+from repos.model_artifact import ARTIFACT_DIR, ModelArtifact, artifact_path, drop_model_artifacts, open_model_artifact, write_model_artifact
+from repos.model_versions import get_model_version, get_model_versions, model_collection
+from utils.lookup_store import LookupSnapshot, LookupStore, lookup_store
+from utils.ranking import merge_association_scores
+from utils.stores import store_dir
+
+
+class TimingIndex:
+    """
+    Popular list and association lists of one timing partition, names interned and held in tuples.
+    Each product maps to its associates and their weights, two parallel tuples.
+    """
+
+    __slots__ = ("popular", "associations")
+
+    def __init__(self, popular: tuple, associations: dict):
+        self.popular = popular
+        self.associations = associations
+
+    @classmethod
+    def from_documents(cls, popular_doc: dict | None, association_docs: list[dict], names: list = ()) -> "TimingIndex":
+        """:param names: Vocabulary of the model version, already interned, for compact association documents."""
+        popular = tuple(sys.intern(name) for name in popular_doc["popular_data"]) if popular_doc else ()
+        associations = {}
+        for doc in association_docs:
+            associates, weights = unpack_association(doc, names)
+            associations[sys.intern(doc["product"])] = (tuple(map(sys.intern, associates)), tuple(weights))
+        return cls(popular, associations)
+
+
+class ModelIndex:
+    """In-process copy of all trained timing partitions, so serving needs no database round-trip."""
+
+    def __init__(self, version: int, timings: dict[str, TimingIndex]):
+        self.version = version
+        self.timings = timings
+        self.loaded_at = time.time()
+
+    def popular(self, timing: str, top_n: int) -> list:
+        return list(self.timings[timing].popular[:top_n])
+
+    def associations(self, timing: str, cart_items: list, top_n: int, normalize: bool = False) -> list:
+        # Same merge as get_association_recommendations
+        lookup = self.timings[timing].associations
+        sources = [associates for associates in map(lookup.get, dict.fromkeys(cart_items)) if associates]
+        return merge_association_scores(sources, top_n, normalize)
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "loadedAt": self.loaded_at,
+            "timings": {
+                timing: {"popular": len(index.popular), "associations": len(index.associations)}
+                for timing, index in self.timings.items()
+            },
+        }
+
+
+async def load_model_index(engine: AIOEngine, version: int, products: dict[str, set] | None = None, store: str | None = None) -> ModelIndex:
+    """
+    Load the trained models of `version` of `store`.
+    :param products: Only these timings and, per timing, the association documents of these
+        products (one $in query each). Every timing and product when None.
+    """
+    async def load_timing(timing: str) -> TimingIndex:
+        query = {"product": {"$in": list(products[timing])}} if products is not None else {}
+        popular_doc, association_docs = await asyncio.gather(
+            model_collection(engine, POPULAR_MODELS[timing], version, store).find_one({}, {"_id": 0, "popular_data": 1}),
+            model_collection(engine, ASSOCIATION_MODELS[timing], version, store).find(query, ASSOCIATION_PROJECTION).to_list(None),
+        )
+        return TimingIndex.from_documents(popular_doc, association_docs, names)
+
+    names = await vocabulary_cache.get(engine, version, store)
+
+    timings = TIMINGS if products is None else [timing for timing in TIMINGS if timing in products]
+    partitions = await asyncio.gather(*(load_timing(timing) for timing in timings))
+    return ModelIndex(version, dict(zip(timings, partitions)))
+
+
+class ModelIndexStore:
+    """
+    Tracks the published model version of a store for this worker and, unless serving from Mongo,
+    holds its index and swaps it when the version changes:
+    - "memory": a ModelIndex built from the model collections, one copy per worker,
+    - "mmap": the ModelArtifact written by /setup, one copy per host shared by all workers. Its
+      lookup maps are served too, copied to dicts per worker so the lookup JSON files are never
+      parsed. A host that did not publish the version builds its artifact from the database on
+      the first load, and falls back to "memory" for versions stored without their lookup maps.
+    The lookup maps stored with the version are served in every mode, the lookup files only for
+    versions published before.
+    """
+
+    def __init__(self, mode: str = "memory", store: str | None = None, lookups: LookupStore = lookup_store):
+        self.mode = mode
+        self.store = store
+        self.lookups = lookups
+        self.version = None
+        self.current: ModelIndex | ModelArtifact | None = None
+        self._lock = asyncio.Lock()
+        self.reloads = 0
+
+    async def _load(self, engine: AIOEngine, version: int) -> ModelIndex | ModelArtifact | None:
+        if self.mode == "mmap":
+            artifact = await asyncio.to_thread(open_model_artifact, version, store_dir(ARTIFACT_DIR, self.store))
+            if artifact is None:
+                artifact = await self._build_artifact(engine, version)
+            if artifact is not None:
+                # Built once per version, every request looks names and UPCs up
+                name_to_upc, upc_to_name = await asyncio.gather(
+                    asyncio.to_thread(artifact.name_to_upc.to_dict), asyncio.to_thread(artifact.upc_to_name.to_dict)
+                )
+                self.lookups.pin(LookupSnapshot(f"model-v{version}", name_to_upc, upc_to_name))
+                return artifact
+            logger.warning(f"No model artifact for v{version} on this host nor lookups stored to build one, loading the index from the database")
+        lookups = await load_lookup_maps(engine, version, self.store)
+        # Versions published before the lookups were stored with them serve the lookup files
+        self.lookups.pin(LookupSnapshot(f"model-v{version}", *lookups) if lookups else None)
+        if self.mode == "mongo":
+            return None
+        return await load_model_index(engine, version, store = self.store)
+
+    async def _build_artifact(self, engine: AIOEngine, version: int) -> ModelArtifact | None:
+        """
+        Write the artifact of `version` on this host from the database, e.g. when another host published it.
+        Each worker missing it writes its own copy and renames it in place, the last one wins.
+        :return: None for versions published before the lookups were stored with them.
+        """
+        lookups = await load_lookup_maps(engine, version, self.store)
+        if lookups is None:
+            return None
+        index = await load_model_index(engine, version, store = self.store)
+        artifact_dir = store_dir(ARTIFACT_DIR, self.store)
+        await asyncio.to_thread(write_model_artifact, artifact_path(version, artifact_dir), index, *lookups)
+        del index
+        # Same retention as the publishing host: the live version and the previous one
+        versions = await get_model_versions(engine, self.store)
+        drop_model_artifacts(keep = {version, versions["version"], versions["previous"]}, artifact_dir = artifact_dir)
+        logger.info(f"Model artifact v{version} of {self.store or 'the default store'} built on this host from the database")
+        return await asyncio.to_thread(open_model_artifact, version, artifact_dir)
+
+    async def refresh(self, engine: AIOEngine, force: bool = False) -> ModelIndex | ModelArtifact | None:
+        async with self._lock:
+            version = await get_model_version(engine, self.store)
+            if force or version != self.version or (self.mode != "mongo" and self.current is None):
+                started = time.perf_counter()
+                self.current = await self._load(engine, version)
+                self.reloads += 1
+                logger.info(f"Model index v{version} ({type(self.current).__name__ if self.current else 'lookups only'}) of {self.store or 'the default store'} "
+                            f"loaded in {time.perf_counter() - started:.2f}s")
+            if version != self.version:
+                # Lookup files published with the version are picked up by the next read
+                self.lookups.expire()
+            self.version = version
+            return self.current
+
+    def stats(self) -> dict:
+        return {
+            "activeVersion": self.version,
+            "mode": self.mode,
+            "loaded": type(self.current).__name__ if self.current else None,
+            "reloads": self.reloads,
+            **(self.current.stats() if self.current else {}),
+        }
+
+
+# Default store, the stores' own are created by repos.store_registry
+model_index_store = ModelIndexStore(mode = settings.MODEL_SERVING_MODE)
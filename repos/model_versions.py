@@ -0,0 +1,108 @@
+import re
+import time
+from odmantic import AIOEngine
+from models.db import POPULAR_MODELS, ASSOCIATION_MODELS, Category, ProductLookup, ProductVocabulary
+from utils.config_bus import MODELS_CHANNEL, config_bus
+from utils.stores import store_collection, store_key
+
+MODEL_VERSION_COLLECTION = "model_versions"
+ACTIVE_VERSION_ID = "active"
+# Shared by the stores, a version number is never reused by another store
+COUNTER_ID = "counter"
+
+# Everything published under a model version: the trained models, the product names their
+# association documents refer to, the category catalog they were filtered with and the lookup maps
+VERSIONED_MODELS = [*POPULAR_MODELS.values(), *ASSOCIATION_MODELS.values(), ProductVocabulary, Category, ProductLookup]
+MODEL_COLLECTIONS = [model.__collection__ for model in VERSIONED_MODELS]
+_VERSIONED_NAME = re.compile(r"^(?P<base>.+)_v(?P<version>\d+)$")
+
+
+def collection_name(base: str, version: int, store: str | None = None) -> str:
+    """Collection holding `version` of a model of `store`, version 0 is the unversioned legacy collection."""
+    return store_collection(f"{base}_v{version}" if version else base, store)
+
+
+def model_collection(engine: AIOEngine, model, version: int, store: str | None = None):
+    return engine.database[collection_name(model.__collection__, version, store)]
+
+
+async def get_model_versions(engine: AIOEngine, store: str | None = None) -> dict:
+    """Pointer document of `store`: the live version and the previous one kept for rollback."""
+    active_id = store_key(ACTIVE_VERSION_ID, store)
+    doc = await engine.database[MODEL_VERSION_COLLECTION].find_one({"_id": active_id})
+    return doc or {"_id": active_id, "version": 0, "previous": None}
+
+
+async def get_model_version(engine: AIOEngine, store: str | None = None) -> int:
+    """Version of the trained models `store` currently publishes, 0 if /setup never published one."""
+    doc = await engine.database[MODEL_VERSION_COLLECTION].find_one({"_id": store_key(ACTIVE_VERSION_ID, store)}, {"version": 1})
+    return doc["version"] if doc else 0
+
+
+async def allocate_model_version(engine: AIOEngine, store: str | None = None) -> int:
+    """Reserve a new version number for a set of staging collections."""
+    versions = engine.database[MODEL_VERSION_COLLECTION]
+    active = await get_model_version(engine, store)
+    await versions.update_one({"_id": COUNTER_ID}, {"$max": {"seq": active}}, upsert = True)
+    doc = await versions.find_one_and_update({"_id": COUNTER_ID}, {"$inc": {"seq": 1}}, return_document = True)
+    return doc["seq"]
+
+
+async def _flip(engine: AIOEngine, expected: int, version: int, previous: int | None, store: str | None):
+    active_id = store_key(ACTIVE_VERSION_ID, store)
+    result = await engine.database[MODEL_VERSION_COLLECTION].update_one(
+        {"_id": active_id, "version": expected} if expected else {"_id": active_id},
+        {"$set": {"version": version, "previous": previous, "published_at": time.time()}},
+        upsert = not expected,
+    )
+    if not result.matched_count and not result.upserted_id:
+        raise RuntimeError(f"Model version changed while publishing v{version}, try again.")
+
+
+async def publish_model_version(engine: AIOEngine, version: int, store: str | None = None) -> int:
+    """
+    Make fully written staging collections live. A single pointer update, so readers switch
+    from one complete version to the other, then every worker is told to reload.
+    :return: The version that was live before, kept for rollback.
+    """
+    active = await get_model_version(engine, store)
+    await _flip(engine, active, version, active, store)
+    await config_bus.bump(engine, MODELS_CHANNEL, store)
+    return active
+
+
+async def rollback_model_version(engine: AIOEngine, store: str | None = None) -> int:
+    """Point `store` back to its previous version and return it."""
+    doc = await get_model_versions(engine, store)
+    if doc.get("previous") is None:
+        raise ValueError("No previous model version to roll back to.")
+    await _flip(engine, doc["version"], doc["previous"], doc["version"], store)
+    await config_bus.bump(engine, MODELS_CHANNEL, store)
+    return doc["previous"]
+
+
+async def copy_model_version(engine: AIOEngine, source: int, target: int, store: str | None = None):
+    """Server-side copy of every model collection of `source` into the staging collections of `target`."""
+    for model in VERSIONED_MODELS:
+        await model_collection(engine, model, source, store).aggregate(
+            [{"$match": {}}, {"$out": collection_name(model.__collection__, target, store)}]
+        ).to_list(None)
+
+
+async def drop_model_versions(engine: AIOEngine, keep: set[int], store: str | None = None) -> list[str]:
+    """Drop the versioned model collections of `store` of every version not in `keep`."""
+    prefix, dropped = store_collection("", store), []
+    for name in await engine.database.list_collection_names():
+        # Seen from the default store, the collections of the other stores have no model collection as base
+        match = _VERSIONED_NAME.match(name[len(prefix):]) if name.startswith(prefix) else None
+        if match and match["base"] in MODEL_COLLECTIONS and int(match["version"]) not in keep:
+            await engine.database.drop_collection(name)
+            dropped.append(name)
+    return dropped
+
+
+async def discard_model_version(engine: AIOEngine, version: int, store: str | None = None):
+    """Drop the staging collections of a version that was never published."""
+    if version:
+        for base in MODEL_COLLECTIONS:
+            await engine.database.drop_collection(collection_name(base, version, store))
@@ -0,0 +1,165 @@
+import asyncio
+import time
+from collections import OrderedDict
+from fastapi import HTTPException
+from loguru import logger
+from odmantic import AIOEngine
+from configs.manager import settings
+from repos.association_store import vocabulary_cache
+from repos.category_catalog import CategoryCatalogStore, category_catalog
+from repos.model_artifact import ModelArtifact
+from repos.model_index import ModelIndexStore, model_index_store
+from repos.model_versions import get_model_version
+from utils.config_bus import MODELS_CHANNEL, config_bus
+from utils.lookup_store import LookupStore, drop_store_lookups, lookup_store, store_lookups
+from utils.memory import approx_bytes
+from utils.single_flight import SingleFlight
+
+
+class StoreNotFound(Exception):
+    pass
+
+
+class StoreState:
+    """Models, category catalog and lookup maps of one store in this worker."""
+
+    __slots__ = ("store", "models", "catalog", "lookups", "nbytes", "loaded_at", "last_used")
+
+    def __init__(self, store: str | None, models: ModelIndexStore, catalog: CategoryCatalogStore, lookups: LookupStore):
+        self.store = store
+        self.models = models
+        self.catalog = catalog
+        self.lookups = lookups
+        self.nbytes = None
+        self.loaded_at = self.last_used = time.time()
+
+    def measure(self) -> int:
+        """Approximate bytes held for the store, its mapped artifact counted whole. Blocking."""
+        current = self.models.current
+        mapped = current.stats()["bytes"] if isinstance(current, ModelArtifact) else 0
+        self.nbytes = approx_bytes(current, self.catalog.current, self.lookups.loaded()) + mapped
+        return self.nbytes
+
+    def stats(self) -> dict:
+        return {
+            "storeId": self.store,
+            "version": self.models.version,
+            "loaded": type(self.models.current).__name__ if self.models.current else None,
+            "bytes": self.nbytes,
+            "loadedAt": self.loaded_at,
+            "lastUsed": self.last_used,
+        }
+
+
+class StoreRegistry:
+    """
+    Stores served by this worker. The default store (requests without storeId) is loaded at
+    startup and always kept; another store is loaded on its first request, in the serving mode of
+    the default one, and the least recently used stores are evicted once the loaded stores exceed
+    `memory_budget` bytes. Requests still holding an evicted store finish on it, the next one
+    loads it again.
+    """
+
+    def __init__(self, memory_budget: int):
+        self.memory_budget = memory_budget
+        self.default = StoreState(None, model_index_store, category_catalog, lookup_store)
+        # Least recently used first
+        self._stores = OrderedDict()
+        # Concurrent first requests of a store wait for one load
+        self._loads = SingleFlight()
+        self.loads = 0
+        self.evictions = 0
+
+    async def get(self, engine: AIOEngine, store: str | None) -> StoreState:
+        """
+        :raises StoreNotFound: If `store` never published models.
+        """
+        if store is None:
+            state = self.default
+        else:
+            state = self._stores.get(store)
+            if state is None:
+                state = await self._loads.do("store", store, self._load, engine, store)
+            else:
+                self._stores.move_to_end(store)
+        state.last_used = time.time()
+        return state
+
+    async def _load(self, engine: AIOEngine, store: str) -> StoreState:
+        if not await get_model_version(engine, store):
+            raise StoreNotFound(f"No models published for store {store}, run /setup with its storeId first.")
+        started = time.perf_counter()
+        lookups = store_lookups(store, serve = True)
+        state = StoreState(store, ModelIndexStore(self.default.models.mode, store, lookups), CategoryCatalogStore(store), lookups)
+        await state.models.refresh(engine)
+        await state.catalog.refresh(engine)
+        try:
+            await asyncio.to_thread(lookups.snapshot)
+        except FileNotFoundError as e:
+            logger.warning(f"Lookup maps of store {store} not available on this host : {e}")
+        self._stores[store] = state
+        # A version published while loading notified no one yet, picked up here
+        await state.models.refresh(engine)
+        await state.catalog.refresh(engine)
+        await asyncio.to_thread(state.measure)
+        if self.default.nbytes is None:
+            await asyncio.to_thread(self.default.measure)
+        self.loads += 1
+        logger.info(f"Store {store} v{state.models.version} loaded in {time.perf_counter() - started:.2f}s, ~{state.nbytes / 2**20:.1f} MB")
+        self._evict(keep = store)
+        return state
+
+    def loaded_bytes(self) -> int:
+        return sum(state.nbytes or 0 for state in (self.default, *self._stores.values()))
+
+    def _evict(self, keep: str | None):
+        total = self.loaded_bytes()
+        for store in list(self._stores):
+            if total <= self.memory_budget:
+                break
+            if store == keep:
+                continue
+            state = self._stores.pop(store)
+            vocabulary_cache.drop(store)
+            drop_store_lookups(store)
+            total -= state.nbytes or 0
+            self.evictions += 1
+            logger.info(f"Store {store} evicted, unused since {time.time() - state.last_used:.0f}s")
+        if total > self.memory_budget:
+            logger.warning(f"Stores loaded take ~{total / 2**20:.0f} MB, over the budget of {self.memory_budget / 2**20:.0f} MB")
+
+    async def refresh(self, engine: AIOEngine, version: int | None = None, store: str | None = None):
+        """Reload the models and catalog of `store` after a publish or rollback. A store not loaded here loads the new version on its next request."""
+        state = self.default if store is None else self._stores.get(store)
+        if state is None:
+            return
+        results = await asyncio.gather(state.models.refresh(engine), state.catalog.refresh(engine), return_exceptions = True)
+        # Measured again once something made the budget matter
+        if state.nbytes is not None:
+            await asyncio.to_thread(state.measure)
+            self._evict(keep = store)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+    def stats(self) -> dict:
+        return {
+            "memoryBudgetBytes": self.memory_budget,
+            "loadedBytes": self.loaded_bytes(),
+            "loads": self.loads,
+            "evictions": self.evictions,
+            # Default store first, then least recently used first
+            "stores": [state.stats() for state in (self.default, *self._stores.values())],
+        }
+
+
+async def serving_store(engine: AIOEngine, store: str | None) -> StoreState:
+    """The store of a request, 404 when it has no models."""
+    try:
+        return await store_registry.get(engine, store)
+    except StoreNotFound as e:
+        raise HTTPException(status_code = 404, detail = str(e))
+
+
+store_registry = StoreRegistry(settings.STORE_MEMORY_BUDGET_MB * 2**20)
+config_bus.subscribe(MODELS_CHANNEL, store_registry.refresh)
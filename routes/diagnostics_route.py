@@ -0,0 +1,71 @@
+from fastapi import APIRouter, Depends
+from auth.api_key import get_api_key
+from db.pool_monitor import pool_monitor
+from db.singleton import client_options
+from repos.category_catalog import category_catalog
+from repos.fixed_always_product import product_list_cache
+from repos.model_index import model_index_store
+from repos.store_registry import store_registry
+from utils.config_bus import config_bus
+from utils.cache import base_ranking_cache
+from utils.lookup_store import lookup_store
+from utils.metrics import latency_metrics
+from utils.single_flight import single_flight
+
+
+router = APIRouter(
+    prefix="/api/v1/diagnostics",
+    tags=["Diagnostics V1"],
+    dependencies=[Depends(get_api_key)]
+)
+
+
+@router.get("/lookups")
+async def lookup_stats():
+    # Compare "version" across workers to confirm they all serve the same build
+    return lookup_store.stats()
+
+
+@router.get("/model-index")
+async def model_index_stats():
+    return model_index_store.stats()
+
+
+@router.get("/stores")
+async def store_stats():
+    # Stores loaded by this worker, least recently used first after the default store
+    return store_registry.stats()
+
+
+@router.get("/categories")
+async def category_stats():
+    # Follows the model version, "source" is "file" for versions stored without a catalog
+    return category_catalog.stats()
+
+
+@router.get("/mongo-pool")
+async def mongo_pool_stats():
+    # Per worker: open and checked out connections and checkout waits, per server
+    return {**pool_monitor.stats(), "options": client_options()}
+
+
+@router.get("/single-flight")
+async def single_flight_stats():
+    # Per kind of read: calls, round-trips actually made and the reads collapsed into them
+    return single_flight.stats()
+
+
+@router.get("/cache")
+async def cache_stats():
+    return base_ranking_cache.stats()
+
+
+@router.get("/config")
+async def config_stats():
+    return {**config_bus.stats(), "productLists": product_list_cache.stats()}
+
+
+@router.get("/latency")
+async def latency_stats():
+    # Bucketed quantiles of this worker, /metrics has the full histograms
+    return latency_metrics.summary()
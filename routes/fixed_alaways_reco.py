@@ -1,12 +1,15 @@
 from datetime import datetime
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Query
 from odmantic import AIOEngine
 from auth.api_key import get_api_key
+from configs.constant import STORE_ID_PATTERN
 from db.singleton import get_engine
 from models.fixed_always_reco import AlwaysRecommendProduct, FixedProduct, ProductType
 from repos.fixed_always_product import parse_upload, validate_df
+from repos.store_registry import serving_store
 from utils.error_codes import UPLOAD_ERRORS, UPLOAD_SUCCESS
 from utils.helper import load_lookup_dicts
+from utils.config_bus import PRODUCTS_CHANNEL, config_bus
 
 
 
@@ -21,6 +24,7 @@ router = APIRouter(
 async def upload_products(
     productType: ProductType,
     file: UploadFile = File(...),
+    storeId: str | None = Query(None, pattern = STORE_ID_PATTERN),
     db: AIOEngine = Depends(get_engine)
 ):
     # 1️ Parse + validate
@@ -31,8 +35,9 @@ async def upload_products(
     df["UPC"] = df["UPC"].astype(str).str.strip()
     df["Product Name"] = df["Product Name"].astype(str).str.strip()
 
-    # 3️ Load your UPC lookup map
-    _, upc_to_name_map = load_lookup_dicts()
+    # 3️ Load your UPC lookup map, the store's own
+    store = await serving_store(db, storeId)
+    _, upc_to_name_map = load_lookup_dicts(store.lookups)
 
     # 4️ Filter valid vs invalid
     valid_products = []
@@ -54,22 +59,24 @@ async def upload_products(
 
     # 5️ Save only valid ones
     if productType == ProductType.fixed:
-        config = await db.find_one(FixedProduct)
+        config = await db.find_one(FixedProduct, FixedProduct.store_id == storeId)
         if not config:
-            config = FixedProduct(products=valid_products, created_at=now)
+            config = FixedProduct(products=valid_products, store_id=storeId, created_at=now)
         else:
             config.products = valid_products
             config.updated_at = now
         await db.save(config)
 
     elif productType == ProductType.always:
-        config = await db.find_one(AlwaysRecommendProduct)
+        config = await db.find_one(AlwaysRecommendProduct, AlwaysRecommendProduct.store_id == storeId)
         if not config:
-            config = AlwaysRecommendProduct(products=valid_products, created_at=now)
+            config = AlwaysRecommendProduct(products=valid_products, store_id=storeId, created_at=now)
         else:
             config.products = valid_products
             config.updated_at = now
         await db.save(config)
+    # Every worker drops its cached Fixed/Always lists of the store
+    await config_bus.bump(db, PRODUCTS_CHANNEL, storeId)
 
     if skipped_upcs:
         message = f"Products uploaded, but {len(skipped_upcs)} unknown UPCs were skipped."
@@ -91,14 +98,15 @@ async def upload_products(
 @router.put("/reset-products")
 async def clear_products(
     productType: ProductType,
+    storeId: str | None = Query(None, pattern = STORE_ID_PATTERN),
     db: AIOEngine = Depends(get_engine)
 ):
     now = datetime.utcnow()
 
     if productType == ProductType.fixed:
-        config = await db.find_one(FixedProduct)
+        config = await db.find_one(FixedProduct, FixedProduct.store_id == storeId)
     elif productType == ProductType.always:
-        config = await db.find_one(AlwaysRecommendProduct)
+        config = await db.find_one(AlwaysRecommendProduct, AlwaysRecommendProduct.store_id == storeId)
     else:
         raise HTTPException(status_code=400, detail="Invalid product type.")
 
@@ -108,6 +116,8 @@ async def clear_products(
     config.products = []
     config.updated_at = now
     await db.save(config)
+    # Every worker drops its cached Fixed/Always lists of the store
+    await config_bus.bump(db, PRODUCTS_CHANNEL, storeId)
 
     return {
         "message": f"{productType.value.capitalize()} products cleared successfully."
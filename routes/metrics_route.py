@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+from auth.api_key import get_api_key
+from utils.metrics import latency_metrics
+
+
+router = APIRouter(
+    tags=["Metrics"],
+    dependencies=[Depends(get_api_key)]
+)
+
+
+@router.get("/metrics", response_class = PlainTextResponse)
+async def metrics():
+    # Histograms of the worker serving the scrape, the "worker" label tells them apart
+    return PlainTextResponse(latency_metrics.render(), media_type = "text/plain; version=0.0.4")
@@ -1,29 +1,40 @@
 import asyncio
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
 from loguru import logger
+from pydantic import ValidationError
 from odmantic import AIOEngine
 from auth.api_key import get_api_key
-from models.fixed_always_reco import AlwaysRecommendProduct, FixedProduct
-from models.schema import RecommendationRequestBody
-from models.hepler import categories_dct, Aggregation, enrich_with_upc, get_product_names_from_upcs
+from models.fixed_always_reco import ProductType
+from models.schema import BatchRecommendationRequestBody, RecommendationRequestBody
+from models.hepler import CompiledAggregation, enrich_with_upc, get_product_names_from_upcs
 from db.singleton import get_engine
-from repos.fixed_always_product import merge_final_recommendations
+from repos.fixed_always_product import merge_final_recommendations, product_list_cache
 from routes.user_route import PermissionChecker
-from utils.helper import get_association_recommendations, get_popular_recommendation, load_lookup_dicts
-from configs.constant import PROCESSED_DATA_PATH, CATEGORY_DATA_PATH, TIME_SLOTS
-from initialize.data_validation import validate
-from setup import run_models_and_store_outputs
+from utils.helper import get_association_recommendations, get_popular_recommendation
+from utils.cache import base_ranking_cache
+from utils.metrics import span
+from utils.responses import FastJSONResponse
+from utils.single_flight import single_flight
+from configs.constant import TIME_SLOTS, PROCESSED_DATA_PATH, CATEGORY_DATA_PATH, STORE_ID_PATTERN
 from fastapi import UploadFile, File
-import pandas as pd
-from models.db import BreakfastPopular, LunchPopular, DinnerPopular, OtherPopular, BreakfastAssociation, LunchAssociation, DinnerAssociation, OtherAssociation
-from initialize.helper import get_timing
+from models.db import BreakfastPopular, POPULAR_MODELS, ASSOCIATION_MODELS
+from repos.association_store import vocabulary_cache
+from repos.model_index import load_model_index
+from repos.model_versions import get_model_version, get_model_versions, model_collection, rollback_model_version
+from repos.store_registry import StoreState, serving_store
+from configs.manager import settings
+from utils.timing import get_timing
+from utils.jobs import JobAlreadyRunning, job_runner
+from utils.stores import store_file, store_key
 import random
 
 
 router = APIRouter(
     prefix="/api/v1",  # version prefix
     tags=["Recommendation V1"],
-    dependencies=[Depends(get_api_key)]
+    dependencies=[Depends(get_api_key)],
+    default_response_class=FastJSONResponse
 )
 
 # @router.get("/view data")
@@ -41,43 +52,148 @@ async def get_data(
 async def upload_csvs(
     processed: UploadFile = File(...), 
     categories: UploadFile = File(...),
+    storeId: str | None = Query(None, pattern = STORE_ID_PATTERN),
+    db: AIOEngine = Depends(get_engine),
     # athorize:bool = Depends(PermissionChecker(['items:read', 'items:write'])),
 ):
     # if not athorize:
     #         return HTTPException(status_code = 403, detail = "User don't have acess to see the recommendation")
-    # Read both files into pandas DataFrames
-    df1 = pd.read_csv(processed.file)
-    df2 = pd.read_csv(categories.file)
-    # Lets see is the input files are in correct format
-    validation = validate(df1, df2)
-    if not validation:
-        print(f"Error: Validation failed, please try again with correct data format.")
-        return {"Error": "Validation failed, please try again with correct data format."}
-
-    # Store the input files
-    df1.to_csv(PROCESSED_DATA_PATH, index = False)
-    df2.to_csv(CATEGORY_DATA_PATH, index = False)
-    print("Data is stored successfully")
+    # Training pulls in pandas and scipy, imported by the first upload rather than at startup
+    from setup import discard_uploads, run_setup_job, stage_upload
+
+    # Streamed to staging files, the job parses them once
+    with span("stage_upload"):
+        processed_path = await stage_upload(processed, store_file(PROCESSED_DATA_PATH, storeId))
+        categories_path = await stage_upload(categories, store_file(CATEGORY_DATA_PATH, storeId))
+
+    # Training runs in the background, poll /setup/{jobId} for its progress. Stores train independently
     try:
-        run_models_and_store_outputs()
-    except:
-        return {"Error": "Failed to run the recomendation model."}
-    
-    # Return the shape as a JSON response
-    return {"message": "Set up has been completed, now you can safely run the recommendation API."}
+        with span("submit"):
+            job = await job_runner.submit(db, store_key("setup", storeId), run_setup_job, processed_path, categories_path, storeId)
+    except JobAlreadyRunning as e:
+        discard_uploads(processed_path, categories_path)
+        raise HTTPException(status_code = 409, detail = str(e))
 
+    return {
+        "message": "Set up has been started, the recommendation API serves the previous models until it completes.",
+        "jobId": job.id,
+        "status": job.status
+    }
 
-@router.post("/recommendation")
-async def recommendation(
-    data: RecommendationRequestBody,
+
+@router.post("/setup/delta")
+async def upload_delta_csv(
+    processed: UploadFile = File(...),
+    storeId: str | None = Query(None, pattern = STORE_ID_PATTERN),
+    db: AIOEngine = Depends(get_engine),
+):
+    """New transactions since the last /setup, merged into the live models without a full retrain."""
+    from setup import discard_uploads, run_delta_job, stage_upload
+
+    processed_path = await stage_upload(processed, store_file(PROCESSED_DATA_PATH, storeId))
+
+    # Same lock as /setup, a delta never runs alongside a full training of the store
+    try:
+        job = await job_runner.submit(db, store_key("setup", storeId), run_delta_job, processed_path, storeId)
+    except JobAlreadyRunning as e:
+        discard_uploads(processed_path)
+        raise HTTPException(status_code = 409, detail = str(e))
+
+    return {
+        "message": "Delta update has been started, the recommendation API serves the previous models until it completes.",
+        "jobId": job.id,
+        "status": job.status
+    }
+
+
+@router.get("/setup/{job_id}")
+async def setup_status(
+    job_id: str,
     db: AIOEngine = Depends(get_engine)
 ):
+    job = await job_runner.get(db, job_id)
+    if not job:
+        raise HTTPException(status_code = 404, detail = "Set up job not found.")
+    return job
+
+
+@router.get("/models/versions")
+async def model_versions(
+    storeId: str | None = Query(None, pattern = STORE_ID_PATTERN),
+    db: AIOEngine = Depends(get_engine)
+):
+    return await get_model_versions(db, storeId)
+
+
+@router.post("/models/rollback")
+async def rollback_models(
+    storeId: str | None = Query(None, pattern = STORE_ID_PATTERN),
+    db: AIOEngine = Depends(get_engine)
+):
+    from setup import restore_lookups
+
+    try:
+        version = await rollback_model_version(db, storeId)
+    except ValueError as e:
+        raise HTTPException(status_code = 409, detail = str(e))
+    # The lookup maps of the version come back with it
+    lookups_restored = await restore_lookups(db, version, storeId)
+    if not lookups_restored:
+        logger.warning(f"No lookup maps kept with v{version}, the lookup files of the newer version stay published")
+    return {"message": f"Rolled back to model version {version}.", "modelVersion": version, "lookupsRestored": lookups_restored}
+
+
+async def get_base_recommendations(db: AIOEngine, store: StoreState, cart_upcs, timing_category: str, top_n: int, current_hr: int, lookups, catalog, model_index = None) -> list:
+    """
+    Filtered association (or popular) ranking of a cart as UPCs, before Fixed/Always are merged in.
+    :param store: Store of the request, its models when `model_index` is None.
+    :param catalog: CategorySnapshot whose rules filter both rankings.
+    :param model_index: Models prefetched for this cart, the serving index of the store in this worker when None.
+    """
+    name_to_upc_map, upc_to_name_map = lookups.name_to_upc, lookups.upc_to_name
+    cart_items = [upc_to_name_map.get(upc, "") for upc in cart_upcs]
+    if model_index is None and settings.MODEL_SERVING_MODE != "mongo":
+        model_index = store.models.current
+    if model_index is not None:
+        # Served from the in-process index or the mapped artifact, no database round-trip
+        with span("models"):
+            popular_recommendations = model_index.popular(timing_category, top_n)
+            assoc_recommendations = model_index.associations(timing_category, cart_items, top_n, settings.ASSOCIATION_NORMALIZE)
+    else:
+        with span("models_mongo"):
+            version = store.models.version
+            if version is None:
+                version = await single_flight.do("model_version", store.store, get_model_version, db, store.store)
+            # Loaded once per version, the documents only hold product ids
+            names = await vocabulary_cache.get(db, version, store.store)
+            # Gather all recommendations concurrently
+            popular_recommendations, assoc_recommendations  = await asyncio.gather(
+                get_popular_recommendation(model_collection(db, POPULAR_MODELS[timing_category], version, store.store), top_n),
+                get_association_recommendations(model_collection(db, ASSOCIATION_MODELS[timing_category], version, store.store), cart_items, top_n,
+                                                settings.ASSOCIATION_NORMALIZE, names)
+            )
+
+    with span("aggregation"):
+        aggregator = CompiledAggregation(popular_recommendations, cart_items, catalog.rules, current_hr)
+        filtered_popular_recommendation = aggregator.get_final_recommendations()
+
+        aggregator = CompiledAggregation(assoc_recommendations, cart_items, catalog.rules, current_hr)
+        filtered_assoc_recommendation = aggregator.get_final_recommendations()
+
+    base_recommendations = filtered_assoc_recommendation if filtered_assoc_recommendation else filtered_popular_recommendation
+    # === Cross-match ===
+    with span("cross_match"):
+        base_rec_upcs = [name_to_upc_map.get(name.lower(), "") for name in base_recommendations]
+    # logger.debug(base_rec_upcs)
+    lookup_misses = cart_items.count("") + base_rec_upcs.count("")
+    store.lookups.record(hits = len(cart_items) + len(base_rec_upcs) - lookup_misses, misses = lookup_misses)
+    return base_rec_upcs
+
+
+async def recommend_cart(db: AIOEngine, store: StoreState, data: RecommendationRequestBody, always_products: list, fixed_products: list, lookups = None, model_index = None, catalog = None) -> dict:
+    """Recommendation of one cart of `store`, with the Fixed/Always lists (and optionally the lookups, models and categories) already loaded."""
     final_top_n = data.topN
     top_n = final_top_n + 50
-
-    # === Load Always upfront ===
-    always_doc = await db.find_one(AlwaysRecommendProduct)
-    always_products = always_doc.products if always_doc else []
     always_upcs = [ap["UPC"] for ap in always_products]
 
     # === If Always alone is enough ===
@@ -95,52 +211,123 @@ async def recommendation(
         }
     logger.debug("Re Plus Engine Execute")
 
-    name_to_upc_map, upc_to_name_map = load_lookup_dicts()
-    cart_items = [upc_to_name_map.get(upc.strip(), "") for upc in data.cartItems]
-    current_hr = data.currentHour
-    timing_category = get_timing(current_hr, TIME_SLOTS)
-    # Gather all recommendations concurrently
-    if timing_category == 'Breakfast':
-        popular_recommendations, assoc_recommendations  = await asyncio.gather(
-            get_popular_recommendation(db, top_n, BreakfastPopular),
-            get_association_recommendations(db, cart_items, top_n, BreakfastAssociation)
-        )
-    elif timing_category == 'Lunch':
-        popular_recommendations, assoc_recommendations  = await asyncio.gather(
-            get_popular_recommendation(db, top_n, LunchPopular),
-            get_association_recommendations(db, cart_items, top_n, LunchAssociation)
-        )
-    elif timing_category == 'Dinner':
-        popular_recommendations, assoc_recommendations  = await asyncio.gather(
-            get_popular_recommendation(db, top_n, DinnerPopular),
-            get_association_recommendations(db, cart_items, top_n, DinnerAssociation)
-        )
-    elif timing_category == 'Other':
-        popular_recommendations, assoc_recommendations  = await asyncio.gather(
-            get_popular_recommendation(db, top_n, OtherPopular),
-            get_association_recommendations(db, cart_items, top_n, OtherAssociation)
-        )
-
-    aggregator = Aggregation(popular_recommendations, cart_items, categories_dct, current_hr)
-    filtered_popular_recommendation = aggregator.get_final_recommendations()
-
-    aggregator = Aggregation(assoc_recommendations, cart_items, categories_dct, current_hr)
-    filtered_assoc_recommendation = aggregator.get_final_recommendations()
+    # One snapshot for the whole request so every lookup sees the same build
+    if lookups is None:
+        with span("lookups"):
+            lookups = store.lookups.snapshot()
+    if catalog is None:
+        catalog = store.catalog.snapshot()
+    upc_to_name_map = lookups.upc_to_name
+    cart_upcs = tuple(upc.strip() for upc in data.cartItems)
+    timing_category = get_timing(data.currentHour, TIME_SLOTS)
 
-    base_recommendations = filtered_assoc_recommendation if filtered_assoc_recommendation else filtered_popular_recommendation
-    # === Cross-match ===
-    base_rec_upcs = [name_to_upc_map.get(name.lower(), "") for name in base_recommendations]
-    # logger.debug(base_rec_upcs)
-
-    # === Load Fixed & Always ===
-    fixed_doc = await db.find_one(FixedProduct)
-    fixed_products = fixed_doc.products if fixed_doc else []
+    # The base ranking is deterministic, only the Fixed/Always merge below is random
+    cache_key = (store.store, timing_category, cart_upcs, final_top_n, store.models.version, lookups.version, catalog.version)
+    base_rec_upcs = base_ranking_cache.get(cache_key)
+    if base_rec_upcs is None:
+        base_rec_upcs = tuple(await get_base_recommendations(db, store, cart_upcs, timing_category, top_n, data.currentHour, lookups, catalog, model_index))
+        base_ranking_cache.set(cache_key, base_rec_upcs)
 
-    final_upcs = merge_final_recommendations(base_rec_upcs, fixed_products, always_products, final_top_n)
-
-    final_result = [{"upc": upc, "name": upc_to_name_map.get(upc, "")} for upc in final_upcs]
+    with span("merge"):
+        final_upcs = merge_final_recommendations(list(base_rec_upcs), fixed_products, always_products, final_top_n)
+        final_result = [{"upc": upc, "name": upc_to_name_map.get(upc, "")} for upc in final_upcs]
 
     return {
         "message": "Final Recommendation",
         "recommendedItems": final_result
-    }
\ No newline at end of file
+    }
+
+
+@router.post("/recommendation")
+async def recommendation(
+    data: RecommendationRequestBody,
+    db: AIOEngine = Depends(get_engine)
+):
+    # Loaded on the first request of a store in this worker
+    with span("store"):
+        store = await serving_store(db, data.storeId)
+    # === Load Fixed & Always ===
+    with span("product_lists"):
+        always_products = await product_list_cache.get(db, ProductType.always, store.store)
+        fixed_products = await product_list_cache.get(db, ProductType.fixed, store.store)
+    # Plain str/list content, rendered as is without the jsonable_encoder pass
+    return FastJSONResponse(await recommend_cart(db, store, data, always_products, fixed_products))
+
+
+async def prefetch_models(db: AIOEngine, store: StoreState, carts: list[RecommendationRequestBody], lookups):
+    """
+    Models needed by a batch when serving from Mongo: the popular document and the association
+    documents of every cart item, one query per timing slot. None when this worker serves the store from memory.
+    """
+    if settings.MODEL_SERVING_MODE != "mongo" and store.models.current is not None:
+        return None
+    products = {}
+    for data in carts:
+        items = products.setdefault(get_timing(data.currentHour, TIME_SLOTS), set())
+        items.update(lookups.upc_to_name.get(upc.strip(), "") for upc in data.cartItems)
+    version = store.models.version
+    if version is None:
+        version = await single_flight.do("model_version", store.store, get_model_version, db, store.store)
+    return await load_model_index(db, version, products, store.store)
+
+
+BATCH_YIELD_EVERY = 50
+
+
+def _item_error(e: Exception) -> dict:
+    # Validation errors may carry non-JSON context, the batch response is rendered without jsonable_encoder
+    messages = jsonable_encoder(e.errors(include_url = False)) if isinstance(e, ValidationError) else [str(arg) for arg in e.args]
+    return {"error": e.__class__.__name__, "messages": messages}
+
+
+@router.post("/recommendation/batch")
+async def recommendation_batch(
+    data: BatchRecommendationRequestBody,
+    db: AIOEngine = Depends(get_engine)
+):
+    """
+    Recommendations of many carts in one call. Fixed/Always lists and lookups are loaded once,
+    models are fetched once per timing slot. Results keep the input order, an invalid or failing
+    cart gets an error entry instead of failing the whole batch.
+    """
+    if len(data.items) > settings.RECO_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code = 413, detail = f"At most {settings.RECO_BATCH_MAX_ITEMS} carts per batch.")
+
+    with span("store"):
+        store = await serving_store(db, data.storeId)
+    with span("product_lists"):
+        always_products = await product_list_cache.get(db, ProductType.always, store.store)
+        fixed_products = await product_list_cache.get(db, ProductType.fixed, store.store)
+
+    results, carts = [None] * len(data.items), {}
+    for i, item in enumerate(data.items):
+        try:
+            cart = RecommendationRequestBody.model_validate(item)
+            # Every cart of a batch is recommended from the batch's store
+            if cart.storeId not in (None, data.storeId):
+                raise ValueError(f"storeId {cart.storeId} of the cart differs from the storeId of the batch.")
+            carts[i] = cart
+        except (ValidationError, ValueError) as e:
+            results[i] = _item_error(e)
+
+    # Carts the Always list fully answers need no models nor lookups
+    needs_models = [cart for cart in carts.values() if len(always_products) < cart.topN]
+    with span("prefetch"):
+        lookups = store.lookups.snapshot() if needs_models else None
+        catalog = store.catalog.snapshot() if needs_models else None
+        model_index = await prefetch_models(db, store, needs_models, lookups) if needs_models else None
+
+    for done, (i, cart) in enumerate(carts.items(), start = 1):
+        try:
+            results[i] = await recommend_cart(db, store, cart, always_products, fixed_products, lookups, model_index, catalog)
+        except Exception as e:
+            logger.exception(e)
+            results[i] = _item_error(e)
+        if done % BATCH_YIELD_EVERY == 0:
+            # Served from memory nothing awaits for real, let other requests run between chunks
+            await asyncio.sleep(0)
+
+    return FastJSONResponse({
+        "message": "Batch Recommendation",
+        "results": results
+    })
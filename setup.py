@@ -1,87 +1,369 @@
+import asyncio
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
-from initialize.models import popular_based, association_based
-from initialize.helper import insert_data, DataPreprocessor
-from configs.constant import TIME_SLOTS, TIMINGS, PROCESSED_DATA_PATH, TIMINGS_COL
-from db.singleton import \
-breakfast_popular_collection_name, lunch_popular_collection_name, \
-dinner_popular_collection_name, other_popular_collection_name, \
-breakfast_association_collection_name, lunch_association_collection_name, \
-dinner_association_collection_name, other_association_collection_name
+from fastapi import UploadFile
+from initialize.models import merge_delta_counts, train_timing_partition
+from initialize.helper import insert_data, upsert_association_data, create_product_indexes, ingest_processed, DataPreprocessor
+from initialize.data_validation import validate_columns
+from configs.constant import TIME_SLOTS, TIMINGS, PROCESSED_DATA_PATH, CATEGORY_DATA_PATH, DELTA_DATA_DIR, TIMINGS_COL, PRODUCT_NAME_COL, EXPECTED_CATEGORY_COLS
+from configs.manager import settings
+from models.db import POPULAR_MODELS, ASSOCIATION_MODELS, Category
+from repos.model_artifact import ARTIFACT_DIR, artifact_path, drop_model_artifacts, open_model_artifact, write_model_artifact
+from repos.association_store import VocabularyBuilder, load_vocabulary, pack_association, store_vocabulary
+from repos.lookup_maps import load_lookup_maps, store_lookup_maps
+from repos.model_index import load_model_index
+from repos.model_counts import (create_counts_indexes, get_counts_version, load_association_counts, load_popularity_counts,
+                                replace_timing_counts, set_counts_version, update_timing_counts)
+from repos.model_versions import (allocate_model_version, copy_model_version, discard_model_version, drop_model_versions,
+                                  get_model_version, model_collection, publish_model_version)
+from utils.jobs import Job
+from db.singleton import get_engine
+from utils.helper import build_lookup_dicts, save_lookup_dicts
+from utils.lookup_store import store_lookups
+from utils.metrics import latency_metrics
+from utils.stores import store_dir, store_file
 
-import time
+UPLOAD_COPY_BYTES = 1 << 20
 
-from utils.helper import build_lookup_dicts, save_lookup_dicts
 
+async def store_timing_outputs(tm, popular_json, association_json, version, vocabulary: VocabularyBuilder, raw_counts = None, store: str | None = None):
+    # Written to the staging collections of `version`, readers keep using the live version
+    engine = get_engine()
+    dataset_name = tm.lower()
+    print(f"Preparing {dataset_name} recommendation dataset (v{version})...")
+    await insert_data(model_collection(engine, POPULAR_MODELS[tm], version, store), popular_json, dataset_name = f'{dataset_name}_popular')
+    association_docs = [pack_association(doc, vocabulary) for doc in association_json]
+    await insert_data(model_collection(engine, ASSOCIATION_MODELS[tm], version, store), association_docs, dataset_name = f'{dataset_name}_association')
+    if raw_counts is not None:
+        await replace_timing_counts(engine, tm, raw_counts['popularity'], raw_counts['associations'], store = store)
 
-def run_models_and_store_outputs():
-    #Reading dataset
-    try:
-        df = pd.read_csv(PROCESSED_DATA_PATH)
-    except FileNotFoundError:
-        print(f"Error: File not found at {PROCESSED_DATA_PATH}. Please check the file path.")
-        return
-    except Exception as e:
-        print(f"Error reading the dataset: {str(e)}")
+
+def prepare_partitions(df: pd.DataFrame | None = None, store: str | None = None) -> dict | None:
+    """Split the preprocessed dataset (the stored one when `df` is None) per timing. Blocking."""
+    #Reading and pre-processing dataset
+    if df is None:
+        processed_path = store_file(PROCESSED_DATA_PATH, store)
+        try:
+            df = ingest_processed(processed_path, DataPreprocessor(TIME_SLOTS), settings.INGEST_CHUNK_ROWS)
+        except FileNotFoundError:
+            print(f"Error: File not found at {processed_path}. Please check the file path.")
+            return
+        except Exception as e:
+            print(f"Error reading the dataset: {str(e)}")
+            return
+
+    return {tm: df[df[TIMINGS_COL] == tm].copy() for tm in TIMINGS}
+
+
+def _phase(job: Job | None, name: str):
+    return job.phase(name) if job is not None else nullcontext()
+
+
+async def run_models_and_store_outputs(version: int, workers: int = settings.TRAINING_WORKERS, job: Job | None = None, partitions: dict | None = None,
+                                       store: str | None = None):
+    """
+    Train the popular and association models of every timing partition and store them
+    in the staging collections of `version` of `store`.
+    Partitions are independent, they are trained in parallel in `workers` processes and
+    stored as soon as each one is ready. Nothing blocks the event loop.
+    :param partitions: Already prepared partitions, prepared from the stored dataset when None.
+    :return: Per timing report of rows, training and storing seconds, None when setup failed.
+    """
+    if partitions is None:
+        async with _phase(job, "preprocess"):
+            partitions = await asyncio.to_thread(prepare_partitions, None, store)
+    if partitions is None:
         return
-    
-    #Pre-processing dataset
-    preprocessor = DataPreprocessor(TIME_SLOTS)
-    df = preprocessor.preprocess(df)
-
-    name_to_upc_map, upc_to_name_map = build_lookup_dicts(df)
-    save_lookup_dicts(name_to_upc_map, upc_to_name_map)
-    for tm in TIMINGS:
-        df_filtered = df[df[TIMINGS_COL] == tm].copy()
+    report = {tm: {"rows": len(df_filtered)} for tm, df_filtered in partitions.items()}
+
+    async with _phase(job, "train"):
+        stored = await train_and_store_partitions(partitions, report, workers, version, store)
+    return report if stored else None
+
+
+async def train_and_store_partitions(partitions: dict, report: dict, workers: int, version: int, store: str | None = None) -> bool:
+    loop = asyncio.get_running_loop()
+    workers = max(1, min(workers, len(partitions)))
+    # spawn: workers must not inherit the Mongo client and its threads
+    pool = ProcessPoolExecutor(max_workers = workers, mp_context = multiprocessing.get_context("spawn")) if workers > 1 else None
+    # The stored counts are rewritten below, they match no published version until this one is
+    await set_counts_version(get_engine(), None, store)
+    # Shared by the timings, their association documents refer to products by id
+    vocabulary = VocabularyBuilder()
+    try:
         # Apply Models
-        popular_json = popular_based(df_filtered)
-        association_json = association_based(df_filtered)
+        trainings = [loop.run_in_executor(pool, train_timing_partition, tm, df_filtered) for tm, df_filtered in partitions.items()]
+        for done, training in enumerate(asyncio.as_completed(trainings), start = 1):
+            tm, popular_json, association_json, train_seconds, raw_counts = await training
+            print(f"[{done}/{len(trainings)}] {tm} trained on {report[tm]['rows']} rows in {train_seconds:.2f}s")
+            # Timed in the training process, recorded here
+            latency_metrics.observe_stage("job:setup", "train_partition", train_seconds)
 
-        # Storing breakfast data
-        if tm == 'Breakfast':
+            started = time.perf_counter()
             try:
-                print("Preparing breakfast recommendation dataset...")
-                insert_data(breakfast_popular_collection_name, popular_json, dataset_name = 'breakfast_popular')
-                time.sleep(1)
-                insert_data(breakfast_association_collection_name, association_json, dataset_name = 'breakfast_association')
-                time.sleep(1)
+                with latency_metrics.span("store_partition", endpoint = "job:setup"):
+                    await store_timing_outputs(tm, popular_json, association_json, version, vocabulary, raw_counts, store)
             except Exception as e:
-                print(f"Error in preparing or inserting breakfast recommendation data: {str(e)}")
-                return
-            
-        # Storing Lunch data
-        elif tm == 'Lunch':
-            try:
-                print("Preparing lunch recommendation dataset...")
-                insert_data(lunch_popular_collection_name, popular_json, dataset_name = 'lunch_popular')
-                time.sleep(1)
-                insert_data(lunch_association_collection_name, association_json, dataset_name = 'lunch_association')
-                time.sleep(1)
-            except Exception as e:
-                print(f"Error in preparing or inserting lunch recommendation data: {str(e)}")
-                return
-        
-        # Storing Dinner data
-        elif tm == 'Dinner':
-            try:
-                print("Preparing dinner recommendation dataset...")
-                insert_data(dinner_popular_collection_name, popular_json, dataset_name = 'dinner_popular')
-                time.sleep(1)
-                insert_data(dinner_association_collection_name, association_json, dataset_name = 'dinner_association')
-                time.sleep(1)
-            except Exception as e:
-                print(f"Error in preparing or inserting dinner recommendation data: {str(e)}")
-                return
-            
-        # Storing Other data
-        elif tm == 'Other':
-            try:
-                print("Preparing other recommendation dataset...")
-                insert_data(other_popular_collection_name, popular_json, dataset_name = 'other_popular')
-                time.sleep(1)
-                insert_data(other_association_collection_name, association_json, dataset_name = 'other_association')
-                time.sleep(1)
-            except Exception as e:
-                print(f"Error in preparing or inserting other recommendation data: {str(e)}")
-                return
+                print(f"Error in preparing or inserting {tm.lower()} recommendation data: {str(e)}")
+                return False
+            report[tm].update(train_seconds = round(train_seconds, 3), store_seconds = round(time.perf_counter() - started, 3))
+            print(f"[{done}/{len(trainings)}] {tm} stored in {report[tm]['store_seconds']:.2f}s")
+        try:
+            await store_vocabulary(get_engine(), version, vocabulary.names, store = store)
+        except Exception as e:
+            print(f"Error in inserting the product vocabulary: {str(e)}")
+            return False
+        return True
+    finally:
+        if pool is not None:
+            pool.shutdown(wait = False, cancel_futures = True)
+
+
+def _copy_upload(upload: UploadFile, path: str):
+    upload.file.seek(0)
+    with open(path, "wb") as f:
+        shutil.copyfileobj(upload.file, f, UPLOAD_COPY_BYTES)
+
+
+async def stage_upload(upload: UploadFile, path: str) -> str:
+    """
+    Copy an upload in chunks to a staging file next to `path`, nothing is parsed nor held in memory.
+    The staging file replaces `path` once the models built from it are live.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok = True)
+    fd, staged_path = tempfile.mkstemp(dir = directory, prefix = f".{os.path.basename(path)}.", suffix = ".upload")
+    os.close(fd)
+    try:
+        await asyncio.to_thread(_copy_upload, upload, staged_path)
+    except BaseException:
+        discard_uploads(staged_path)
+        raise
+    return staged_path
+
+
+def discard_uploads(*paths: str):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def read_categories(path: str) -> pd.DataFrame:
+    df = pd.read_csv(path)
+    if not validate_columns(df, EXPECTED_CATEGORY_COLS):
+        raise ValueError("Validation failed, please try again with correct data format.")
+    return df
+
+
+CATEGORY_FIELDS = {'Product_name': 'product', 'Category': 'category', 'Subcategory': 'subcategory', 'Timing': 'timing'}
+
+
+def category_documents(df: pd.DataFrame) -> list[dict]:
+    """Catalog documents of a Categories upload: one per product, the last row wins, values stripped and lower-cased."""
+    # astype(str) keeps empty cells as "nan", like the catalog has always read them
+    catalog = pd.DataFrame({field: df[col].astype(str).str.strip().str.lower() for col, field in CATEGORY_FIELDS.items()})
+    return catalog.drop_duplicates('product', keep = 'last').to_dict('records')
+
+
+async def run_setup_job(job: Job, processed_path: str, categories_path: str, store: str | None = None) -> dict:
+    """
+    Background /setup job: validate the staged uploads, train, index and publish the new models of `store`, then
+    keep the uploads as its stored inputs.
+    The processed upload is parsed once, chunk by chunk, and the parsed data feeds training directly.
+    """
+    try:
+        # Lets see is the input files are in correct format
+        async with job.phase("ingest"):
+            categories = await asyncio.to_thread(read_categories, categories_path)
+            catalog_docs = await asyncio.to_thread(category_documents, categories)
+            del categories
+            df = await asyncio.to_thread(ingest_processed, processed_path, DataPreprocessor(TIME_SLOTS), settings.INGEST_CHUNK_ROWS)
+            print("Data Validation Successful")
+
+        async with job.phase("preprocess"):
+            partitions = await asyncio.to_thread(prepare_partitions, df, store)
+            # Published with the models
+            lookups = await asyncio.to_thread(build_lookup_dicts, df)
+        del df
+
+        engine = get_engine()
+        version = await allocate_model_version(engine, store)
+        report = await run_models_and_store_outputs(version, job = job, partitions = partitions, store = store)
+        del partitions
+        if report is None:
+            await discard_model_version(engine, version, store)
+            raise RuntimeError("Failed to run the recomendation model.")
+
+        # Published with the models, every worker switches to both at once
+        async with job.phase("catalog"):
+            await insert_data(model_collection(engine, Category, version, store), catalog_docs, dataset_name = 'category')
+        del catalog_docs
+
+        result = await publish_models(job, engine, version, lookups, store)
+        await set_counts_version(engine, version, store)
+
+        # Only once the models built from them are live, a failed job leaves the stored inputs and deltas alone.
+        # The uploads become the stored inputs as they are, no re-serialization
+        async with job.phase("store_inputs"):
+            os.replace(processed_path, store_file(PROCESSED_DATA_PATH, store))
+            os.replace(categories_path, store_file(CATEGORY_DATA_PATH, store))
+            # The full history supersedes the deltas merged so far
+            shutil.rmtree(store_dir(DELTA_DATA_DIR, store), ignore_errors = True)
+            print("Data is stored successfully")
+    finally:
+        discard_uploads(processed_path, categories_path)
+
+    return {**result, "partitions": report}
+
+
+async def publish_models(job: Job, engine, version: int, lookups: tuple[dict, dict], store: str | None = None) -> dict:
+    """
+    Index, write the artifact of and publish the staging collections of `version` of `store`.
+    :param lookups: Name -> UPC and UPC -> name maps of the version. Stored with it and written to
+        its artifact, and to the lookup files once the version is live.
+    """
+    async with job.phase("index"):
+        await create_product_indexes(
+            [model_collection(engine, model, version, store) for model in ASSOCIATION_MODELS.values()],
+            dataset_name = 'association'
+        )
+        await create_counts_indexes(engine, store)
+
+    # Binary copy of the models and lookups, mapped read-only by the workers of this host. The
+    # other hosts build theirs from the database, the lookups are stored with the version for them
+    artifact_dir = store_dir(ARTIFACT_DIR, store)
+    async with job.phase("artifact"):
+        name_to_upc_map, upc_to_name_map = lookups
+        await store_lookup_maps(engine, version, name_to_upc_map, upc_to_name_map, store = store)
+        index = await load_model_index(engine, version, store = store)
+        artifact_bytes = await asyncio.to_thread(
+            write_model_artifact, artifact_path(version, artifact_dir), index, name_to_upc_map, upc_to_name_map
+        )
+        del index
+
+    # Flip the live pointer, this worker reloads now and the others on their next config poll
+    async with job.phase("publish"):
+        previous = await publish_model_version(engine, version, store)
+        # Only once the version is live, a failed job leaves the published lookups alone
+        await asyncio.to_thread(save_lookup_dicts, name_to_upc_map, upc_to_name_map, store_lookups(store))
+        # Keep the previous version for instant rollback
+        dropped = await drop_model_versions(engine, keep = {version, previous}, store = store)
+        dropped_artifacts = drop_model_artifacts(keep = {version, previous}, artifact_dir = artifact_dir)
+
+    return {"modelVersion": version, "previousVersion": previous, "droppedCollections": dropped,
+            "artifactBytes": artifact_bytes, "droppedArtifacts": dropped_artifacts}
+
+
+async def restore_lookups(engine, version: int, store: str | None = None) -> bool:
+    """
+    Publish again the lookups of `version` of `store`, e.g. after a rollback to it, from the
+    database or, for versions published before the lookups were stored with them, the artifact.
+    :return: False when neither keeps them, the lookup files are left alone.
+    """
+    lookups = await load_lookup_maps(engine, version, store)
+    if lookups is None:
+        artifact = await asyncio.to_thread(open_model_artifact, version, store_dir(ARTIFACT_DIR, store))
+        if artifact is None:
+            return False
+        lookups = artifact.name_to_upc.to_dict(), artifact.upc_to_name.to_dict()
+    await asyncio.to_thread(save_lookup_dicts, *lookups, store_lookups(store))
+    return True
+
+
+async def merge_lookups(engine, version: int, df: pd.DataFrame, store: str | None = None) -> tuple[dict, dict]:
+    """
+    The lookups of `version` of `store` with the products of a delta added, existing entries are kept. Nothing is written.
+    Versions published before the lookups were stored with them start from the lookup files.
+    """
+    stored = await load_lookup_maps(engine, version, store)
+    if stored is None:
+        try:
+            current = await asyncio.to_thread(store_lookups(store).file_snapshot)
+            stored = current.name_to_upc, current.upc_to_name
+        except FileNotFoundError:
+            stored = {}, {}
+    name_to_upc_map, upc_to_name_map = stored
+    delta_name_to_upc, delta_upc_to_name = await asyncio.to_thread(build_lookup_dicts, df)
+    return {**delta_name_to_upc, **name_to_upc_map}, {**delta_upc_to_name, **upc_to_name_map}
+
+
+async def run_delta_job(job: Job, processed_path: str, store: str | None = None) -> dict:
+    """
+    Background /setup/delta job: merge the counts of new transactions into the stored counts and
+    republish, on top of a copy of the live models, only the products they touch.
+    A delta must hold new sessions only, a session split across uploads is not paired.
+    """
+    engine = get_engine()
+    try:
+        async with job.phase("ingest"):
+            df = await asyncio.to_thread(ingest_processed, processed_path, DataPreprocessor(TIME_SLOTS), settings.INGEST_CHUNK_ROWS)
+            print("Data Validation Successful")
+
+        live = await get_model_version(engine, store)
+        if await get_counts_version(engine, store) != live:
+            raise ValueError(f"The stored counts do not match the live models (v{live}), run a full /setup first.")
+
+        # Only the stored counts of the products in the delta are read
+        async with job.phase("merge"):
+            merged, report = {}, {}
+            for tm in TIMINGS:
+                df_filtered = df[df[TIMINGS_COL] == tm]
+                if df_filtered.empty:
+                    continue
+                started = time.perf_counter()
+                base_popularity = await load_popularity_counts(engine, tm, store)
+                base_rows = await load_association_counts(engine, tm, df_filtered[PRODUCT_NAME_COL].unique().tolist(), store)
+                merged[tm] = await asyncio.to_thread(merge_delta_counts, base_popularity, base_rows, df_filtered)
+                report[tm] = {"rows": len(df_filtered), "products": len(merged[tm][1]),
+                              "merge_seconds": round(time.perf_counter() - started, 3)}
+            lookups = await merge_lookups(engine, live, df, store)
+        del df
+
+        version = await allocate_model_version(engine, store)
+        try:
+            async with job.phase("stage"):
+                await copy_model_version(engine, live, version, store)
+                # $out copies no index, the upserts below look documents up by product
+                await create_product_indexes(
+                    [model_collection(engine, model, version, store) for model in ASSOCIATION_MODELS.values()],
+                    dataset_name = 'association'
+                )
+                # Ids of the live version stay valid, new products are appended
+                vocabulary = VocabularyBuilder(await load_vocabulary(engine, version, store))
+                for tm, (_, _, popular_json, association_json) in merged.items():
+                    dataset_name = tm.lower()
+                    await insert_data(model_collection(engine, POPULAR_MODELS[tm], version, store), popular_json, dataset_name = f'{dataset_name}_popular')
+                    association_docs = [pack_association(doc, vocabulary) for doc in association_json]
+                    await upsert_association_data(model_collection(engine, ASSOCIATION_MODELS[tm], version, store), association_docs, dataset_name = f'{dataset_name}_association')
+                await store_vocabulary(engine, version, vocabulary.names, store = store)
+            result = await publish_models(job, engine, version, lookups, store)
+        except Exception:
+            # Past the flip the version is live, only a version that never was is discarded
+            if await get_model_version(engine, store) != version:
+                await discard_model_version(engine, version, store)
+            raise
+
+        # Counts follow the published models, if this fails the next delta asks for a full /setup
+        async with job.phase("counts"):
+            await set_counts_version(engine, None, store)
+            for tm, (popularity, rows, _, _) in merged.items():
+                await update_timing_counts(engine, tm, popularity, rows, store = store)
+            await set_counts_version(engine, version, store)
+
+        delta_dir = store_dir(DELTA_DATA_DIR, store)
+        os.makedirs(delta_dir, exist_ok = True)
+        os.replace(processed_path, os.path.join(delta_dir, f"delta_v{version}.csv"))
+    finally:
+        discard_uploads(processed_path)
+
+    return {**result, "partitions": report}
 
-# run_models_and_store_outputs() # Need to remove this, only for testing
\ No newline at end of file
+# asyncio.run(run_models_and_store_outputs(1)) # Need to remove this, only for testing
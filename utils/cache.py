@@ -0,0 +1,69 @@
+import time
+from collections import OrderedDict
+from configs.manager import settings
+from utils.config_bus import MODELS_CHANNEL, PRODUCTS_CHANNEL, config_bus
+
+
+class TTLCache:
+    """
+    Size-bounded LRU cache whose entries also expire after `ttl` seconds.
+    Not thread-safe, meant to be used from the event loop of one worker.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key, default = None):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last = False)
+            self.evictions += 1
+
+    def clear(self):
+        self._data.clear()
+        self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxSize": self.max_size,
+            "ttlSeconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRatio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+# Base ranking of /recommendation per (timing slot, cart, topN, model and lookup version)
+base_ranking_cache = TTLCache(settings.RECO_CACHE_SIZE, settings.RECO_CACHE_TTL_SECONDS)
+config_bus.subscribe(MODELS_CHANNEL, lambda *_: base_ranking_cache.clear())
+config_bus.subscribe(PRODUCTS_CHANNEL, lambda *_: base_ranking_cache.clear())
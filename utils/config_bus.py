@@ -0,0 +1,105 @@
+import asyncio
+import inspect
+import time
+from collections import defaultdict
+from loguru import logger
+from odmantic import AIOEngine
+from utils.stores import split_store_key, store_key
+
+CONFIG_VERSION_COLLECTION = "config_versions"
+
+# Channels of state that workers cache locally, one document per channel and store
+MODELS_CHANNEL = "models"
+PRODUCTS_CHANNEL = "products"
+
+
+class ConfigVersionBus:
+    """
+    Cross-worker invalidation through monotonically increasing versions stored in Mongo, one
+    document per channel and store. A writer bumps the channel after changing the data; every
+    worker polls the (tiny) collection and runs the channel's subscribers when a version moves.
+    A version is recorded once every subscriber applied it, a failed one is retried on the next poll.
+    """
+
+    def __init__(self):
+        self.versions = {}
+        self._subscribers = defaultdict(list)
+        self._watcher: asyncio.Task | None = None
+        self.polls = 0
+        self.notifications = 0
+        self.last_poll_at = None
+
+    def subscribe(self, channel: str, callback):
+        """Register `callback(engine, version, store)`, sync or async, to run when `channel` of a store changes."""
+        self._subscribers[channel].append(callback)
+
+    async def _notify(self, engine: AIOEngine, key: str, version: int):
+        channel, store = split_store_key(key)
+        applied = True
+        for callback in self._subscribers[channel]:
+            try:
+                result = callback(engine, version, store)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                applied = False
+                logger.error(f"Error while applying {key} v{version}, retrying on the next poll : {e}")
+        if applied:
+            self.versions[key] = version
+        self.notifications += 1
+
+    def forget(self, channel: str, store: str | None = None):
+        """Apply `channel` of `store` again on the next poll, e.g. after its state failed to load."""
+        self.versions.pop(store_key(channel, store), None)
+
+    async def bump(self, engine: AIOEngine, channel: str, store: str | None = None) -> int:
+        """Announce a change of `channel` of `store`; applied in this worker right away, in the others on their next poll."""
+        doc = await engine.database[CONFIG_VERSION_COLLECTION].find_one_and_update(
+            {"_id": store_key(channel, store)},
+            {"$inc": {"version": 1}, "$set": {"updated_at": time.time()}},
+            upsert = True,
+            return_document = True,
+        )
+        await self._notify(engine, doc["_id"], doc["version"])
+        return doc["version"]
+
+    async def poll(self, engine: AIOEngine, notify: bool = True):
+        docs = await engine.database[CONFIG_VERSION_COLLECTION].find({}, {"version": 1}).to_list(None)
+        self.polls += 1
+        self.last_poll_at = time.time()
+        for doc in docs:
+            key, version = doc["_id"], doc["version"]
+            if self.versions.get(key) != version:
+                if notify:
+                    await self._notify(engine, key, version)
+                else:
+                    self.versions[key] = version
+
+    async def _watch(self, engine: AIOEngine, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.poll(engine)
+            except Exception as e:
+                # Keep serving the cached state, try again on the next poll
+                logger.error(f"Error while polling config versions : {e}")
+
+    def start_watching(self, engine: AIOEngine, interval: float):
+        if self._watcher is None or self._watcher.done():
+            self._watcher = asyncio.create_task(self._watch(engine, interval))
+
+    def stop_watching(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+    def stats(self) -> dict:
+        return {
+            "versions": self.versions,
+            "polls": self.polls,
+            "notifications": self.notifications,
+            "lastPollAt": self.last_poll_at,
+        }
+
+
+config_bus = ConfigVersionBus()
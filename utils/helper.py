@@ -1,30 +1,43 @@
-from odmantic import AIOEngine
-import pandas as pd
-import json
 import os
+from typing import TYPE_CHECKING
+from repos.association_store import ASSOCIATION_PROJECTION, unpack_association
+from utils.lookup_store import LOOKUP_DIR, LookupStore, lookup_store
+from utils.ranking import merge_association_scores
+from utils.single_flight import single_flight
+
+if TYPE_CHECKING:
+    import pandas as pd
 
-LOOKUP_DIR = "lookup_data"
 os.makedirs(LOOKUP_DIR, exist_ok=True)
 
 
 # Define async functions for each recommendation source
 
-async def get_association_recommendations(engine: AIOEngine, cart_items: list, top_n: int, collection_name):
-    assoc_products = {}
-    if cart_items:
-        for product in cart_items:
-            assoc_recommendation = await engine.find_one(collection_name, {"product": product})
-            if assoc_recommendation:
-                assoc_products.update(assoc_recommendation.associate_products)
-    return list(assoc_products.keys())[:top_n]
+async def get_association_recommendations(collection, cart_items: list, top_n: int, normalize: bool = False, names: list = ()):
+    """
+    :param names: Vocabulary of the model version, the names of the ids of compact documents.
+    """
+    if not cart_items:
+        return []
+    # One round-trip for the whole cart, shared with the concurrent requests for the same products
+    products = frozenset(cart_items)
+    associations = await single_flight.do("associations", (collection.name, products), _find_associations, collection, products)
+    sources = [unpack_association(doc, names) for doc in map(associations.get, dict.fromkeys(cart_items)) if doc]
+    return merge_association_scores(sources, top_n, normalize)
+
 
+async def _find_associations(collection, products: frozenset) -> dict:
+    # Raw documents with only the fields we merge
+    cursor = collection.find({"product": {"$in": list(products)}}, ASSOCIATION_PROJECTION)
+    return {doc["product"]: doc async for doc in cursor}
 
-async def get_popular_recommendation(engine: AIOEngine, top_n: int, collection_name):
-    popular_recommendation = await engine.find_one(collection_name)
-    return list(popular_recommendation.popular_data.keys())[:top_n] if popular_recommendation else []
 
+async def get_popular_recommendation(collection, top_n: int):
+    popular_recommendation = await single_flight.do("popular", collection.name, collection.find_one, {}, {"_id": 0, "popular_data": 1})
+    return list(popular_recommendation["popular_data"].keys())[:top_n] if popular_recommendation else []
 
-def build_lookup_dicts(df: pd.DataFrame) -> tuple[dict, dict]:
+
+def build_lookup_dicts(df: "pd.DataFrame") -> tuple[dict, dict]:
     df["Product_name"] = df["Product_name"].astype(str).str.strip().str.lower()
     df["UPC"] = df["UPC"].astype(str).str.strip()
 
@@ -51,19 +64,11 @@ def build_lookup_dicts(df: pd.DataFrame) -> tuple[dict, dict]:
     return name_to_upc_map, upc_to_name_map
 
 
-def save_lookup_dicts(name_to_upc_map: dict, upc_to_name_map: dict):
-    with open(os.path.join(LOOKUP_DIR, "name_to_upc.json"), "w") as f:
-        json.dump(name_to_upc_map, f)
-
-    with open(os.path.join(LOOKUP_DIR, "upc_to_name.json"), "w") as f:
-        json.dump(upc_to_name_map, f)
-    print("✅ Lookup JSON files saved.")
+def save_lookup_dicts(name_to_upc_map: dict, upc_to_name_map: dict, lookups: LookupStore = lookup_store):
+    snapshot = lookups.publish(name_to_upc_map, upc_to_name_map)
+    print(f"✅ Lookup JSON files saved (version {snapshot.version}).")
 
-def load_lookup_dicts() -> tuple[dict, dict]:
-    with open(os.path.join(LOOKUP_DIR, "name_to_upc.json"), "r") as f1:
-        name_to_upc_map = json.load(f1)
-
-    with open(os.path.join(LOOKUP_DIR, "upc_to_name.json"), "r") as f2:
-        upc_to_name_map = json.load(f2)
-
-    return name_to_upc_map, upc_to_name_map
+def load_lookup_dicts(lookups: LookupStore = lookup_store) -> tuple[dict, dict]:
+    # Served from the in-memory store, the JSON files are only parsed when a new build shows up
+    snapshot = lookups.snapshot()
+    return snapshot.name_to_upc, snapshot.upc_to_name
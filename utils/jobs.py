@@ -0,0 +1,183 @@
+import asyncio
+import time
+import traceback
+import uuid
+from contextlib import asynccontextmanager
+from loguru import logger
+from odmantic import AIOEngine
+from pymongo.errors import DuplicateKeyError
+from configs.manager import settings
+from utils.metrics import latency_metrics
+
+JOBS_COLLECTION = "training_jobs"
+LOCKS_COLLECTION = "job_locks"
+
+
+class JobAlreadyRunning(Exception):
+    pass
+
+
+class JobLeaseLost(Exception):
+    pass
+
+
+class Job:
+    """
+    State of one background job, persisted to Mongo on every change so any worker can report it.
+    """
+
+    def __init__(self, engine: AIOEngine, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"
+        self.phase_name = None
+        self.phases = []
+        self.error = None
+        self.result = None
+        self.created_at = time.time()
+        self.finished_at = None
+        # Set when another job took the lock over, this one stops before its next phase
+        self.lease_lost = False
+        self._collection = engine.database[JOBS_COLLECTION]
+
+    def to_document(self) -> dict:
+        return {
+            "_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "phase": self.phase_name,
+            "phases": self.phases,
+            "error": self.error,
+            "result": self.result,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+    async def save(self):
+        await self._collection.replace_one({"_id": self.id}, self.to_document(), upsert = True)
+
+    @asynccontextmanager
+    async def phase(self, name: str):
+        """
+        Record the elapsed time of a phase of the job.
+        :raises JobLeaseLost: If the job lost its lock, nothing of the phase has run.
+        """
+        if self.lease_lost:
+            raise JobLeaseLost(f"The {self.kind} job lost its lock before the {name} phase, another job may hold it.")
+        self.phase_name = name
+        phase = {"name": name, "started_at": time.time(), "elapsed_seconds": None}
+        self.phases.append(phase)
+        await self.save()
+        started = time.perf_counter()
+        try:
+            yield phase
+        finally:
+            elapsed = time.perf_counter() - started
+            phase["elapsed_seconds"] = round(elapsed, 3)
+            latency_metrics.observe_stage(f"job:{self.kind}", name, elapsed)
+            await self.save()
+
+
+class JobRunner:
+    """
+    Runs jobs as tasks on the event loop of this worker, at most one job of a kind at a time
+    across all workers (a lease document in Mongo guards it). A running job renews its lease
+    every third of `lease_seconds`, so the lease of a job whose worker died expires soon and the
+    next job of the kind marks it failed.
+    The job coroutine is expected to push blocking work to an executor.
+    """
+
+    def __init__(self, lease_seconds: float = 120):
+        self.lease_seconds = lease_seconds
+        self._tasks = set()
+
+    async def _acquire(self, engine: AIOEngine, job: Job) -> bool:
+        now = time.time()
+        try:
+            expired = await engine.database[LOCKS_COLLECTION].find_one_and_update(
+                {"_id": job.kind, "locked_until": {"$lt": now}},
+                {"$set": {"job_id": job.id, "locked_until": now + self.lease_seconds}},
+                upsert = True,
+            )
+        except DuplicateKeyError:
+            return False
+        if expired and expired.get("job_id"):
+            # Released jobs are finished already, one still running stopped renewing its lease
+            await engine.database[JOBS_COLLECTION].update_one(
+                {"_id": expired["job_id"], "status": {"$in": ["queued", "running"]}},
+                {"$set": {"status": "failed", "phase": None, "finished_at": now,
+                          "error": {"error": "JobLeaseLost", "messages": ["The job stopped renewing its lock, its worker probably died."]}}},
+            )
+        return True
+
+    async def _renew(self, engine: AIOEngine, job: Job):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                result = await engine.database[LOCKS_COLLECTION].update_one(
+                    {"_id": job.kind, "job_id": job.id},
+                    {"$set": {"locked_until": time.time() + self.lease_seconds}},
+                )
+            except Exception as e:
+                # The lease outlasts two more attempts
+                logger.error(f"Error while renewing the lock of job {job.id} : {e}")
+                continue
+            if not result.matched_count:
+                job.lease_lost = True
+                logger.error(f"Job {job.id} lost its {job.kind} lock, it stops before its next phase")
+                return
+
+    async def _release(self, engine: AIOEngine, job: Job):
+        await engine.database[LOCKS_COLLECTION].update_one(
+            {"_id": job.kind, "job_id": job.id},
+            {"$set": {"locked_until": 0}},
+        )
+
+    async def submit(self, engine: AIOEngine, kind: str, fn, *args) -> Job:
+        """
+        Start `fn(job, *args)` in the background and return the job right away.
+        :raises JobAlreadyRunning: If a job of the same kind is still running.
+        """
+        job = Job(engine, kind)
+        if not await self._acquire(engine, job):
+            raise JobAlreadyRunning(f"A {kind} job is already running.")
+        await job.save()
+
+        task = asyncio.create_task(self._run(engine, job, fn, *args))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, engine: AIOEngine, job: Job, fn, *args):
+        # The task inherited the context of the submitting request, which has completed by now
+        latency_metrics.detach()
+        job.status = "running"
+        renewal = asyncio.create_task(self._renew(engine, job))
+        try:
+            job.result = await fn(job, *args)
+            job.status = "succeeded"
+        except Exception as e:
+            logger.exception(e)
+            job.status = "failed"
+            job.error = {"error": e.__class__.__name__, "messages": [str(arg) for arg in e.args],
+                         "trace": traceback.format_exc(limit = 5)}
+        finally:
+            renewal.cancel()
+            job.phase_name = None
+            job.finished_at = time.time()
+            try:
+                await job.save()
+            finally:
+                await self._release(engine, job)
+
+    async def get(self, engine: AIOEngine, job_id: str) -> dict | None:
+        doc = await engine.database[JOBS_COLLECTION].find_one({"_id": job_id})
+        if doc and doc["status"] in ("queued", "running"):
+            # Elapsed time of the phase in progress
+            current = doc["phases"][-1] if doc["phases"] else None
+            if current and current["elapsed_seconds"] is None:
+                current["elapsed_seconds"] = round(time.time() - current["started_at"], 3)
+        return doc
+
+
+job_runner = JobRunner(lease_seconds = settings.TRAINING_JOB_LEASE_SECONDS)
@@ -0,0 +1,198 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from utils.stores import store_dir
+
+LOOKUP_DIR = "lookup_data"
+NAME_TO_UPC_FILE = "name_to_upc.json"
+UPC_TO_NAME_FILE = "upc_to_name.json"
+
+# How often (seconds) a worker checks whether the lookup files on disk changed
+REFRESH_INTERVAL_SECONDS = 5
+
+
+class LookupSnapshot:
+    """Immutable view of one build of the name <-> UPC lookup maps."""
+
+    __slots__ = ("version", "name_to_upc", "upc_to_name", "loaded_at")
+
+    def __init__(self, version: str, name_to_upc: dict, upc_to_name: dict):
+        self.version = version
+        self.name_to_upc = name_to_upc
+        self.upc_to_name = upc_to_name
+        self.loaded_at = time.time()
+
+
+def _version_of(name_to_upc_raw: bytes, upc_to_name_raw: bytes) -> str:
+    digest = hashlib.sha1(name_to_upc_raw)
+    digest.update(upc_to_name_raw)
+    return digest.hexdigest()[:12]
+
+
+class LookupStore:
+    """
+    Process-wide store for the name <-> UPC lookup maps.
+    The maps are parsed once per worker and replaced as a whole when a new build is
+    published, so a reader holding a snapshot never sees a half-loaded map.
+    A pinned snapshot (the maps stored with the served model version) is served instead of the files.
+    """
+
+    def __init__(self, lookup_dir: str = LOOKUP_DIR, refresh_interval: float = REFRESH_INTERVAL_SECONDS):
+        self.lookup_dir = lookup_dir
+        self.refresh_interval = refresh_interval
+        self._snapshot: LookupSnapshot | None = None
+        self._pinned: LookupSnapshot | None = None
+        self._lock = threading.Lock()
+        self._file_stamp = None
+        self._last_check = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def _paths(self) -> tuple[str, str]:
+        return (os.path.join(self.lookup_dir, NAME_TO_UPC_FILE),
+                os.path.join(self.lookup_dir, UPC_TO_NAME_FILE))
+
+    def _stamp(self):
+        try:
+            return tuple(os.stat(path).st_mtime_ns for path in self._paths())
+        except FileNotFoundError:
+            return None
+
+    def _read(self) -> LookupSnapshot:
+        name_path, upc_path = self._paths()
+        with open(name_path, "rb") as f1:
+            name_raw = f1.read()
+        with open(upc_path, "rb") as f2:
+            upc_raw = f2.read()
+        return LookupSnapshot(_version_of(name_raw, upc_raw), json.loads(name_raw), json.loads(upc_raw))
+
+    def _swap(self, snapshot: LookupSnapshot, stamp):
+        # A single reference assignment, readers see either the old or the new build
+        self._snapshot = snapshot
+        self._file_stamp = stamp
+        self.reloads += 1
+
+    def reload(self) -> LookupSnapshot:
+        """Re-read the lookup files from disk and swap them in."""
+        with self._lock:
+            stamp = self._stamp()
+            self._swap(self._read(), stamp)
+            self._last_check = time.monotonic()
+            return self._snapshot
+
+    def publish(self, name_to_upc_map: dict, upc_to_name_map: dict) -> LookupSnapshot:
+        """Persist freshly built maps and make them the current version of this worker."""
+        name_raw = json.dumps(name_to_upc_map).encode()
+        upc_raw = json.dumps(upc_to_name_map).encode()
+        with self._lock:
+            os.makedirs(self.lookup_dir, exist_ok=True)
+            for path, raw in zip(self._paths(), (name_raw, upc_raw)):
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(raw)
+                os.replace(tmp_path, path)
+            snapshot = LookupSnapshot(_version_of(name_raw, upc_raw), name_to_upc_map, upc_to_name_map)
+            self._swap(snapshot, self._stamp())
+            self._last_check = time.monotonic()
+            return snapshot
+
+    def expire(self):
+        """Check the files for a new build on the next read, e.g. once the models they go with changed."""
+        self._last_check = float("-inf")
+
+    def pin(self, snapshot: LookupSnapshot | None):
+        """Serve `snapshot` instead of the lookup files, None goes back to the files."""
+        self._pinned = snapshot
+
+    def snapshot(self) -> LookupSnapshot:
+        """Return the current build: the pinned one, else the files."""
+        pinned = self._pinned
+        return pinned if pinned is not None else self.file_snapshot()
+
+    def loaded(self) -> LookupSnapshot | None:
+        """The build served now, None if nothing was loaded yet. Never reads the files."""
+        return self._pinned or self._snapshot
+
+    def file_snapshot(self) -> LookupSnapshot:
+        """Return the build of the files, loading it on first use and picking up files rewritten by other workers."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._swap(self._read(), self._stamp())
+                    self._last_check = time.monotonic()
+                return self._snapshot
+
+        now = time.monotonic()
+        if now - self._last_check >= self.refresh_interval:
+            self._last_check = now
+            stamp = self._stamp()
+            if stamp is not None and stamp != self._file_stamp:
+                return self.reload()
+        return snapshot
+
+    def upc_to_name(self, upc: str, default: str = "") -> str:
+        name = self.snapshot().upc_to_name.get(upc)
+        if name is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return name
+
+    def name_to_upc(self, name: str, default: str = "") -> str:
+        upc = self.snapshot().name_to_upc.get(name)
+        if upc is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return upc
+
+    def record(self, hits: int, misses: int):
+        """Account lookups done directly against a snapshot."""
+        self.hits += hits
+        self.misses += misses
+
+    def stats(self) -> dict:
+        snapshot = self.loaded()
+        total = self.hits + self.misses
+        return {
+            "pid": os.getpid(),
+            "source": "pinned" if self._pinned else "files",
+            "version": snapshot.version if snapshot else None,
+            "loadedAt": snapshot.loaded_at if snapshot else None,
+            "names": len(snapshot.name_to_upc) if snapshot else 0,
+            "upcs": len(snapshot.upc_to_name) if snapshot else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRatio": round(self.hits / total, 4) if total else None,
+            "reloads": self.reloads,
+        }
+
+
+# Default store
+lookup_store = LookupStore()
+# Other stores served by this worker, a build published here is served right away
+_served_lookups = {}
+
+
+def store_lookups(store: str | None, serve: bool = False) -> LookupStore:
+    """
+    Lookup maps of `store`, over its own directory except for the default store.
+    :param serve: Keep them as the maps this worker serves for `store`, until `drop_store_lookups`.
+    """
+    if store is None:
+        return lookup_store
+    lookups = _served_lookups.get(store)
+    if lookups is None:
+        lookups = LookupStore(store_dir(LOOKUP_DIR, store))
+        if serve:
+            _served_lookups[store] = lookups
+    return lookups
+
+
+def drop_store_lookups(store: str):
+    """Forget the lookup maps of a store no longer served by this worker."""
+    _served_lookups.pop(store, None)
@@ -0,0 +1,32 @@
+import sys
+import types
+
+_OPAQUE = (type, types.ModuleType, types.FunctionType, types.MethodType, types.BuiltinFunctionType)
+
+
+def approx_bytes(*roots) -> int:
+    """
+    Approximate heap size of `roots` and of everything they reference through containers,
+    instance attributes and slots, each object counted once (interned names shared by several
+    structures count once). Arrays over a memory mapping count their header only, the mapped
+    pages are not on the heap.
+    """
+    seen, stack, total = set(), list(roots), 0
+    while stack:
+        obj = stack.pop()
+        if obj is None or isinstance(obj, _OPAQUE) or id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif not isinstance(obj, (str, bytes, int, float)):
+            attributes = getattr(obj, "__dict__", None)
+            if attributes is not None:
+                stack.append(attributes)
+            for slot in getattr(type(obj), "__slots__", ()):
+                stack.append(getattr(obj, slot, None))
+    return total
@@ -0,0 +1,180 @@
+import math
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Upper bounds in seconds, from a cached /recommendation up to a /setup phase
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+
+
+class LatencyHistogram:
+    """Cumulative latency histogram, rendered as a Prometheus histogram."""
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        # bisect_left: a value equal to a bound falls in that bucket (le)
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, q: float) -> float | None:
+        """Upper bound of the bucket holding the `q` quantile, None without observations."""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class RequestTimings:
+    """Stage spans of the request in progress, in the order they completed."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+        self.token = None
+
+    def add(self, stage: str, seconds: float):
+        self.spans.append((stage, seconds))
+
+    def totals(self) -> dict:
+        """Seconds per stage, summed when a stage ran several times (e.g. per cart of a batch)."""
+        totals = {}
+        for stage, seconds in self.spans:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        return totals
+
+    def server_timing(self) -> str:
+        """Server-Timing header value, durations in milliseconds."""
+        entries = [f"{stage};dur={seconds * 1e3:.2f}" for stage, seconds in self.totals().items()]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1e3:.2f}")
+        return ", ".join(entries)
+
+
+_current_timings: ContextVar[RequestTimings | None] = ContextVar("request_timings", default = None)
+
+
+class LatencyMetrics:
+    """
+    Latency histograms of this worker: one per endpoint for whole requests and one per
+    (endpoint, stage) for the spans inside them. Not thread-safe, spans are expected on the event loop.
+    """
+
+    def __init__(self, namespace: str = "reco"):
+        self.namespace = namespace
+        self.requests = {}
+        self.stages = {}
+        self.started_at = time.time()
+
+    def observe_request(self, method: str, endpoint: str, status: int, seconds: float):
+        key = (method, endpoint, str(status))
+        histogram = self.requests.get(key)
+        if histogram is None:
+            histogram = self.requests[key] = LatencyHistogram()
+        histogram.observe(seconds)
+
+    def observe_stage(self, endpoint: str, stage: str, seconds: float):
+        key = (endpoint, stage)
+        histogram = self.stages.get(key)
+        if histogram is None:
+            histogram = self.stages[key] = LatencyHistogram()
+        histogram.observe(seconds)
+
+    @contextmanager
+    def span(self, stage: str, endpoint: str = "background"):
+        """
+        Time a stage. Inside a request the span is kept with it, and recorded under the route once
+        the request completes. Outside of one (background jobs) it is recorded under `endpoint` right away.
+        """
+        timings = _current_timings.get()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            if timings is not None:
+                timings.add(stage, seconds)
+            else:
+                self.observe_stage(endpoint, stage, seconds)
+
+    def start_request(self) -> RequestTimings:
+        timings = RequestTimings()
+        timings.token = _current_timings.set(timings)
+        return timings
+
+    def finish_request(self, timings: RequestTimings, method: str, endpoint: str, status: int):
+        _current_timings.reset(timings.token)
+        self.observe_request(method, endpoint, status, time.perf_counter() - timings.started)
+        for stage, seconds in timings.spans:
+            self.observe_stage(endpoint, stage, seconds)
+
+    @staticmethod
+    def detach():
+        """Stop attaching spans to the request that spawned this task, for background jobs."""
+        _current_timings.set(None)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (0.0.4)."""
+        worker = str(os.getpid())
+        lines = []
+        families = [
+            (f"{self.namespace}_http_request_duration_seconds", "Latency of HTTP requests per endpoint.",
+             ("method", "endpoint", "status"), self.requests),
+            (f"{self.namespace}_stage_duration_seconds", "Latency of the stages of a request or background job.",
+             ("endpoint", "stage"), self.stages),
+        ]
+        for name, help_text, label_names, histograms in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, histogram in sorted(histograms.items()):
+                labels = ",".join(f'{label}="{_escape(value)}"' for label, value in zip(label_names, key))
+                labels = f'{labels},worker="{worker}"'
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f"{name}_sum{{{labels}}} {histogram.sum:.6f}")
+                lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        lines.append(f"# HELP {self.namespace}_process_start_time_seconds Start time of this worker.")
+        lines.append(f"# TYPE {self.namespace}_process_start_time_seconds gauge")
+        lines.append(f'{self.namespace}_process_start_time_seconds{{worker="{worker}"}} {self.started_at:.3f}')
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> dict:
+        """Count, mean and bucketed p50/p99 per endpoint and stage, for the diagnostics route."""
+        def describe(histogram: LatencyHistogram) -> dict:
+            return {
+                "count": histogram.count,
+                "meanMs": round(histogram.sum / histogram.count * 1e3, 3) if histogram.count else None,
+                "p50Ms": _ms(histogram.quantile(0.5)),
+                "p99Ms": _ms(histogram.quantile(0.99)),
+            }
+
+        return {
+            "requests": {" ".join(key): describe(histogram) for key, histogram in sorted(self.requests.items())},
+            "stages": {" ".join(key): describe(histogram) for key, histogram in sorted(self.stages.items())},
+        }
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _ms(seconds: float | None) -> float | None:
+    # A quantile past the last bucket has no finite bound
+    return seconds * 1e3 if seconds is not None and not math.isinf(seconds) else None
+
+
+latency_metrics = LatencyMetrics()
+span = latency_metrics.span
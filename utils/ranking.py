@@ -0,0 +1,36 @@
+import heapq
+from itertools import islice
+from operator import itemgetter
+
+# heapq.nlargest beats sorting the whole union only when it is this many times larger than top_n
+HEAP_SELECTION_RATIO = 32
+
+
+def merge_association_scores(sources, top_n: int, normalize: bool = False) -> list:
+    """
+    Associates of a cart ranked by their weight summed over the cart items, best first.
+    Large unions only select their best `top_n` (heap selection), smaller ones are sorted, which
+    is faster below HEAP_SELECTION_RATIO. Either way ties keep the order in which the associates
+    were first met.
+    :param sources: (associates, weights) of every distinct cart item that has associations,
+        ranked by weight as training stores them. Associates may be names or any hashable id.
+    :param normalize: Scale the weights of each cart item to sum to 1, so an item with large
+        counts does not drown the others.
+    """
+    if len(sources) == 1 and not normalize:
+        # Already ranked, summing a single item changes nothing
+        return list(islice(sources[0][0], top_n))
+    scores = {}
+    get = scores.get
+    for associates, weights in sources:
+        if normalize:
+            total = sum(weights)
+            if not total:
+                continue
+            weights = [weight / total for weight in weights]
+        for associate, weight in zip(associates, weights):
+            scores[associate] = get(associate, 0) + weight
+    if len(scores) > HEAP_SELECTION_RATIO * top_n:
+        return [associate for associate, _ in heapq.nlargest(top_n, scores.items(), key = itemgetter(1))]
+    # sorted is stable, like nlargest
+    return [associate for associate, _ in sorted(scores.items(), key = itemgetter(1), reverse = True)[:top_n]]
@@ -0,0 +1,19 @@
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # Optional, the standard encoder is used without it
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered by orjson when it is installed. Same compact UTF-8 output as
+    JSONResponse for the str/int/list/dict payloads of the API, several times faster.
+    Return it from a route with JSON-native content to also skip FastAPI's jsonable_encoder pass.
+    """
+
+    def render(self, content) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option = orjson.OPT_NON_STR_KEYS)
@@ -0,0 +1,81 @@
+import asyncio
+from configs.manager import settings
+
+
+class _FlightCounters:
+    __slots__ = ("calls", "executions", "errors", "max_waiters")
+
+    def __init__(self):
+        self.calls = 0
+        self.executions = 0
+        self.errors = 0
+        self.max_waiters = 0
+
+
+class SingleFlight:
+    """
+    Collapses identical concurrent reads of this worker: while a read of (name, key) is in flight,
+    callers asking for the same one await it instead of issuing their own, and all get its result
+    (or its exception). Nothing is kept once the read completes, this is not a cache.
+    The read runs as a task of its own, a caller that is cancelled does not cancel it for the others.
+    Results are shared between callers, they must not be mutated.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._flights = {}
+        self._counters = {}
+
+    def _counter(self, name: str) -> _FlightCounters:
+        counters = self._counters.get(name)
+        if counters is None:
+            counters = self._counters[name] = _FlightCounters()
+        return counters
+
+    def _landed(self, flight_key, task: asyncio.Task):
+        if self._flights.get(flight_key, (None,))[0] is task:
+            del self._flights[flight_key]
+        # Marks the exception as retrieved should every caller have been cancelled meanwhile
+        if not task.cancelled() and task.exception() is not None:
+            self._counter(flight_key[0]).errors += 1
+
+    async def do(self, name: str, key, fn, *args):
+        """
+        :param name: Kind of read, the metrics are kept per name.
+        :param key: Hashable identity of the read within `name`, e.g. the collection and the query.
+        :return: The result of `fn(*args)`, run once for all concurrent callers.
+        """
+        counters = self._counter(name)
+        counters.calls += 1
+        if not self.enabled:
+            counters.executions += 1
+            return await fn(*args)
+        flight_key = (name, key)
+        flight = self._flights.get(flight_key)
+        if flight is None:
+            counters.executions += 1
+            task = asyncio.ensure_future(fn(*args))
+            flight = self._flights[flight_key] = [task, 1]
+            task.add_done_callback(lambda task: self._landed(flight_key, task))
+        else:
+            flight[1] += 1
+            counters.max_waiters = max(counters.max_waiters, flight[1])
+        return await asyncio.shield(flight[0])
+
+    def stats(self) -> dict:
+        reads = {}
+        for name, counters in self._counters.items():
+            collapsed = counters.calls - counters.executions
+            reads[name] = {
+                "calls": counters.calls,
+                "executions": counters.executions,
+                "collapsed": collapsed,
+                "collapsedRatio": round(collapsed / counters.calls, 4) if counters.calls else None,
+                "errors": counters.errors,
+                "maxWaiters": counters.max_waiters,
+            }
+        return {"enabled": self.enabled, "inFlight": len(self._flights), "reads": reads}
+
+
+# Mongo reads of the serving path, shared by the requests of this worker that ask for the same one at once
+single_flight = SingleFlight(settings.MONGO_COALESCE_READS)
@@ -0,0 +1,29 @@
+import os
+
+# Inputs, lookups and artifacts of a store live in a "stores/<storeId>" directory next to those
+# of the default store (SHOP_LOCATION, requests without storeId), which keep their paths
+STORES_DIR = "stores"
+# Mongo collections of a store are prefixed, the default store keeps the unprefixed ones
+STORE_COLLECTION_PREFIX = "store_"
+
+
+def store_dir(directory: str, store: str | None) -> str:
+    return directory if store is None else os.path.join(directory, STORES_DIR, store)
+
+
+def store_file(path: str, store: str | None) -> str:
+    return path if store is None else os.path.join(store_dir(os.path.dirname(path), store), os.path.basename(path))
+
+
+def store_collection(name: str, store: str | None) -> str:
+    return name if store is None else f"{STORE_COLLECTION_PREFIX}{store}.{name}"
+
+
+def store_key(key: str, store: str | None) -> str:
+    """Id of a per-store document (version pointers, config channels, job locks), `key` itself for the default store."""
+    return key if store is None else f"{key}@{store}"
+
+
+def split_store_key(key: str) -> tuple[str, str | None]:
+    key, _, store = key.partition("@")
+    return key, store or None
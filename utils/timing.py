@@ -0,0 +1,12 @@
+from configs.constant import TIMINGS
+
+
+def get_timing(hr, timing_ranges):
+    try:
+        for category, (start, end) in timing_ranges.items():
+                    if category in TIMINGS:
+                    # Handles cases where the range spans midnight
+                        if start <= hr < end or (start > end and (hr >= start or hr < end)):
+                            return category
+    except:
+        return "None"